@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark peak memory of loading create_functional_annotation inputs into plain
+dicts of namedtuples versus the compact record stores
+
+Usage:
+    python benchmarks/bench_annotation_memory.py [--transcripts 500000]
+"""
+
+# import libraries
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+LOADER = """
+import json, resource, sys, time
+from eifunannot.scripts import create_functional_annotation as cfa
+
+mode, ahrd_output, metrics_output, blast_tblr_output = sys.argv[1:5]
+start = time.perf_counter()
+if mode == "dict":
+    stores = ({}, {}, {})
+else:
+    stores = (cfa.ahrd_store(), cfa.metrics_store(), cfa.blast_store())
+cfa.process_ahrd(ahrd_output, stores[0])
+cfa.process_metrics(metrics_output, [0, 1, 14, 15], stores[1])
+cfa.process_blast(blast_tblr_output, stores[2])
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "mode": mode,
+    "seconds": round(elapsed, 2),
+    "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+}))
+"""
+
+DESCRIPTIONS = [
+    "Unknown protein",
+    "Protein kinase domain-containing protein",
+    "F-box protein",
+    "Transposon Ty3-I Gag-Pol polyprotein",
+    "ATP-dependent DNA helicase",
+]
+QUALITY_CODES = ["***", "**-", "*-*", "-**", "*--"]
+
+
+def generate_inputs(folder, transcripts, seed=1):
+    random.seed(seed)
+    ahrd_output = os.path.join(folder, "ahrd_output.csv")
+    metrics_output = os.path.join(folder, "metrics.tsv")
+    blast_tblr_output = os.path.join(folder, "query-vs-reference.blastp.tblr")
+    with open(ahrd_output, "w") as ahrd, open(metrics_output, "w") as metrics, open(
+        blast_tblr_output, "w"
+    ) as blast:
+        ahrd.write(
+            "# AHRD-Version 3.3.3\n\nProtein-Accession\tBlast-Hit-Accession\tAHRD-Quality-Code\tHuman-Readable-Description\tInterpro-ID (Description)\tGene-Ontology-Term\n"
+        )
+        metrics.write("TID\tGID\t" + "\t".join(f"col{i}" for i in range(3, 17)) + "\n")
+        for num in range(transcripts):
+            gene = f"Chr{num % 7 + 1}G{num // 2:07d}"
+            trans = f"{gene}.{num % 2 + 1}"
+            if random.random() < 0.3:
+                ahrd.write(f"{trans}\t\t\tUnknown protein\t\t\n")
+            else:
+                ahrd.write(
+                    f"{trans}\tsp|P{random.randint(1, 99999):05d}|PROT_ARATH\t{random.choice(QUALITY_CODES)}\t{random.choice(DESCRIPTIONS)}\tIPR{random.randint(1, 50000):06d} (Domain)\tGO:{random.randint(1, 99999):07d}\n"
+                )
+            metrics.write(
+                "\t".join(
+                    [trans, gene]
+                    + ["0.5"] * 12
+                    + [
+                        random.choice(["protein_coding", "transposable_element"]),
+                        random.choice(["High", "Low"]),
+                    ]
+                )
+                + "\n"
+            )
+            target = f"AT{random.randint(1, 5)}G{random.randint(1, 60000):05d}.1"
+            for _ in range(2):
+                qstart = random.randint(1, 200)
+                sstart = random.randint(1, 200)
+                blast.write(
+                    f"{trans}\t{target}\t88.5\t{qstart}\t{qstart + 150}\t{sstart}\t{sstart + 150}\t400\t450\t151\t130\t21\t140\t0\t0\t1e-50\t300\n"
+                )
+    return ahrd_output, metrics_output, blast_tblr_output
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "--transcripts",
+        type=int,
+        default=500000,
+        help="Number of transcripts (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(
+            None,
+            [
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                env.get("PYTHONPATH"),
+            ],
+        )
+    )
+    with tempfile.TemporaryDirectory(prefix="eifunannot_bench_") as folder:
+        inputs = generate_inputs(folder, args.transcripts)
+        results = []
+        for mode in ("dict", "store"):
+            output = subprocess.run(
+                [sys.executable, "-c", LOADER, mode, *inputs],
+                env=env,
+                check=True,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+            ).stdout
+            results.append(json.loads(output))
+    for result in results:
+        print(
+            f"{result['mode']:<6} {result['seconds']:>8} s {result['peak_rss_mb']:>10} MB peak RSS"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of generate_ahrd_reference_fasta_from_ensembl on a synthetic Ensembl
+pep.all.fa, before (five regex searches per header, one print per line) and after
+(one pass key:value tokenizer, block buffered output). The outputs of both are
+checked to be identical.
+
+Usage:
+    python benchmarks/bench_ensembl_headers.py [--records 2000000]
+"""
+
+# import libraries
+import argparse
+import io
+import os
+import random
+import re
+import tempfile
+import time
+
+from eifunannot.scripts.generate_ahrd_reference_fasta_from_ensembl import (
+    format_fasta_header,
+    get_description,
+    get_gene,
+    get_gene_biotype,
+    get_header,
+    get_transcript_biotype,
+)
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+BIOTYPES = ["protein_coding"] * 8 + ["IG_C_gene", "polymorphic_pseudogene"]
+DESCRIPTIONS = [
+    "immunoglobulin heavy constant delta [Source:HGNC Symbol;Acc:HGNC:5480]",
+    "zgc:77880 [Source:ZFIN;Acc:ZDB-GENE-040426-1901]",
+    "FERM domain containing 7 [Source:HGNC Symbol;Acc:HGNC:8079]",
+    "T cell-interacting, activating receptor on myeloid cells 1",
+]
+
+
+def format_before(fasta, out):
+    # format_fasta_header before the tokenizer, printing to out
+    print_rest = False
+    with open(fasta, "r") as filehandle:
+        for line in filehandle:
+            line = line.rstrip("\n")
+            if re.match(r"^\s*$", line) or line.startswith("#"):
+                pass
+            elif line.startswith(">"):
+                header = get_header(line)
+                get_gene(line)
+                gene_biotype = get_gene_biotype(line)
+                transcript_biotype = get_transcript_biotype(line)
+                if (
+                    gene_biotype == "protein_coding"
+                    and transcript_biotype == "protein_coding"
+                ):
+                    description = get_description(line)
+                    if description != "Unknown function":
+                        print_rest = True
+                        print(
+                            f">{header} | Symbols:  | {description.replace('[','(').replace(']',')')}  |",
+                            file=out,
+                        )
+                    else:
+                        print_rest = False
+                else:
+                    print_rest = False
+            else:
+                if print_rest:
+                    print(line, file=out)
+
+
+def generate_fasta(path, records, seed=1):
+    random.seed(seed)
+    with open(path, "w") as out:
+        for num in range(records):
+            gene_biotype = random.choice(BIOTYPES)
+            transcript_biotype = (
+                gene_biotype if random.random() < 0.9 else "nonsense_mediated_decay"
+            )
+            header = (
+                f">ENSP{num:011d}.1 pep chromosome:GRCh38:{num % 22 + 1}:{num}:{num + 900}:1"
+                f" gene:ENSG{num // 3:011d}.10 transcript:ENST{num:011d}.6"
+                f" gene_biotype:{gene_biotype} transcript_biotype:{transcript_biotype}"
+                f" gene_symbol:SYM{num // 3}"
+            )
+            if random.random() < 0.9:
+                header += f" description:{random.choice(DESCRIPTIONS)}"
+            seq = "M" + "".join(random.choices(AMINO_ACIDS, k=random.randint(20, 300)))
+            out.write(f"{header}\n")
+            for i in range(0, len(seq), 60):
+                out.write(f"{seq[i : i + 60]}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "--records",
+        type=int,
+        default=2000000,
+        help="Number of fasta records (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fasta = os.path.join(tmp_dir, "synthetic.pep.all.fa")
+        generate_fasta(fasta, args.records)
+        print(f"{args.records} records, {os.path.getsize(fasta) / (1 << 20):.1f} MiB")
+        outputs = {}
+        for name, function in (
+            ("before", format_before),
+            ("after", format_fasta_header),
+        ):
+            out = io.StringIO()
+            start = time.perf_counter()
+            function(fasta, out)
+            seconds = time.perf_counter() - start
+            outputs[name] = out.getvalue()
+            print(f"{name:<6} {args.records / seconds:>10.0f} records/s")
+    if outputs["before"] != outputs["after"]:
+        raise SystemExit("Error: The outputs differ")
+    print(f"Identical outputs, {outputs['after'].count('>')} records kept")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the filtering of incomplete sequences from a UniProt .dat file in
+download_from_uniprot, before (every pattern searched on every line, sequence built
+with +=) and after (dispatch on the two letter line code, filter_dat), on a
+synthetic .dat file. The outputs of both are checked to be identical.
+
+Usage:
+    python benchmarks/bench_filter_dat.py [--records 100000]
+"""
+
+# import libraries
+import argparse
+import io
+import random
+import re
+import time
+
+from eifunannot.scripts.download_from_uniprot import filter_dat
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def filter_before(lines, isoform_hash):
+    # filter_incomplete_seqs before the line code dispatch, writing to a list
+    output = []
+    newseq = False
+    acc_id = ""
+    for line in lines:
+        line = line.rstrip()
+        if newseq is False:
+            id_match_region = re.search(r"^ID\s+(\w+)\s+(\w+);", line)
+            if id_match_region:
+                id_id = id_match_region.group(1)
+                reviewed_status = id_match_region.group(2)
+                newseq = True
+                description = ""
+                organism_name = ""
+                organism_taxid = ""
+                gene_name = ""
+                protein_existence = ""
+                sequence_version = ""
+                seq = ""
+                print_seq = True
+        else:
+            ac_match_region = re.search(r"^AC\s+(\w+);", line)
+            de_match_region = re.search(r"^DE\s+(.+);", line)
+            os_match_region = re.search(r"^OS\s+([^\(]+)", line)
+            ox_match_region = re.search(r"^OX\s+\w+=(\d+);", line)
+            gn_match_region = re.search(r"^GN\s+\w+=([^;]+)", line)
+            pe_match_region = re.search(r"^PE\s+(\d+):", line)
+            sv_match_region = re.search(r"^DT\s+.*sequence version\s+(\d+).", line)
+            og_match_region = re.search(r"^OG\s+(.+)", line)
+            seq_match_region = re.search(r"^\s+([\w\s]+)", line)
+            if ac_match_region:
+                acc_id = ac_match_region.group(1)
+            if de_match_region:
+                if description == "":
+                    description = (
+                        de_match_region.group(1)
+                        .replace("RecName: Full=", "")
+                        .replace("SubName: Full=", "")
+                        .split("{")[0]
+                        .strip()
+                    )
+                if "Flags: Fragment" in line:
+                    print_seq = False
+            elif os_match_region:
+                if organism_name == "":
+                    organism_name = os_match_region.group(1).strip().rstrip(".")
+            elif ox_match_region:
+                organism_taxid = ox_match_region.group(1)
+            elif gn_match_region:
+                if gene_name == "":
+                    gene_name = gn_match_region.group(1).split("{")[0].strip()
+            elif pe_match_region:
+                protein_existence = pe_match_region.group(1)
+            elif sv_match_region:
+                sequence_version = sv_match_region.group(1)
+            elif og_match_region:
+                pass
+            elif re.match(r"^FT\s+NON_TER\s+", line):
+                print_seq = False
+            elif re.match(r"^FT\s+NON_CONS\s+(\d+)\s+", line):
+                print_seq = False
+            elif seq_match_region:
+                seq += seq_match_region.group(1)
+            elif re.match(r"^\/\/", line):
+                seq = re.sub(r"[\n\t\s]*", "", seq)
+                if seq[:1].lower() != "m":
+                    print_seq = False
+                newseq = False
+                if print_seq:
+                    header = ""
+                    if reviewed_status == "Reviewed":
+                        header += "sp|"
+                    else:
+                        header += "tr|"
+                    header += f"{acc_id}|{id_id} {description} "
+                    header += f"OS={organism_name} "
+                    header += f"OX={organism_taxid} "
+                    header += f"GN={gene_name} "
+                    header += f"PE={protein_existence} "
+                    header += f"SV={sequence_version}"
+                    line_width = 60
+                    sequence = "\n".join(
+                        [
+                            seq[i : i + line_width]
+                            for i in range(0, len(seq), line_width)
+                        ]
+                    )
+                    output.append(f">{header}\n{sequence}\n")
+                    if acc_id in isoform_hash:
+                        output.append(f"{isoform_hash[acc_id]}\n")
+    return output
+
+
+def generate_dat(records, seed=1):
+    random.seed(seed)
+    lines = []
+    isoform_hash = {}
+    for num in range(records):
+        reviewed = num % 10 == 0
+        acc = f"{'P' if reviewed else 'A0A'}{num:06d}"
+        length = random.randint(50, 800)
+        seq = random.choice("MMMMMMMMMA") + "".join(
+            random.choices(AMINO_ACIDS, k=length - 1)
+        )
+        status = "Reviewed" if reviewed else "Unreviewed"
+        lines.append(f"ID   PROT{num}_ARATH   {status};   {length} AA.\n")
+        lines.append(f"AC   {acc}; Q{num:05d};\n")
+        if num % 50 == 0:
+            lines.append(f"AC   R{num:05d};\n")
+        lines.append("DT   01-JAN-1990, integrated into UniProtKB/TrEMBL.\n")
+        lines.append(f"DT   01-JAN-1990, sequence version {num % 3 + 1}.\n")
+        lines.append("DT   24-JAN-2024, entry version 12.\n")
+        if reviewed:
+            lines.append(
+                "DE   RecName: Full=Protein kinase {ECO:0000256|ARBA:00012513};\n"
+            )
+        else:
+            lines.append("DE   SubName: Full=Uncharacterized protein;\n")
+        lines.append("DE   AltName: Full=Other name;\n")
+        if num % 40 == 1:
+            lines.append("DE   Flags: Fragment;\n")
+        if num % 3:
+            lines.append(
+                f"GN   Name=GENE{num} {{ECO:0000313|EMBL:X}}; ORFNames=F{num};\n"
+            )
+        lines.append("OS   Arabidopsis thaliana (Mouse-ear cress).\n")
+        if num % 30 == 2:
+            lines.append("OG   Plastid; Chloroplast.\n")
+        lines.append("OC   Eukaryota; Viridiplantae; Streptophyta; Embryophyta.\n")
+        lines.append("OX   NCBI_TaxID=3702 {ECO:0000313|EMBL:X};\n")
+        lines.append("RN   [1]\n")
+        lines.append("RP   NUCLEOTIDE SEQUENCE [LARGE SCALE GENOMIC DNA].\n")
+        lines.append("CC   -!- FUNCTION: Something; Other.\n")
+        lines.append("CC   -!- SUBCELLULAR LOCATION: Membrane.\n")
+        lines.append("DR   EMBL; AC007357; AAD31068.1; -; Genomic_DNA.\n")
+        lines.append("DR   InterPro; IPR000719; Prot_kinase_dom.\n")
+        lines.append(f"PE   {num % 5 + 1}: Inferred from homology;\n")
+        lines.append("KW   Kinase; Reference proteome.\n")
+        lines.append(f"FT   CHAIN           1..{length}\n")
+        lines.append('FT                   /note="Protein kinase"\n')
+        if num % 25 == 3:
+            lines.append("FT   NON_TER         1\n")
+        elif num % 25 == 4:
+            lines.append("FT   NON_CONS        10..11\n")
+        elif num % 25 == 5:
+            lines.append("FT   NON_CONS     10     11\n")
+        lines.append(
+            f"SQ   SEQUENCE   {length} AA;  12345 MW;  ABCDEF0123456789 CRC64;\n"
+        )
+        for i in range(0, length, 60):
+            part = seq[i : i + 60]
+            blocks = " ".join(part[j : j + 10] for j in range(0, len(part), 10))
+            lines.append(f"     {blocks}\n")
+        lines.append("//\n")
+        if reviewed and num % 20 == 0:
+            isoform_hash[acc] = f">sp|{acc}-2|PROT{num}_ARATH Isoform 2\n{seq[1:]}"
+    return "".join(lines), isoform_hash
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "--records",
+        type=int,
+        default=100000,
+        help="Number of .dat records (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    dat, isoform_hash = generate_dat(args.records)
+    print(f"{args.records} records, {len(dat) / (1 << 20):.1f} MiB")
+    outputs = {}
+    for name, function in (
+        ("before", filter_before),
+        ("after", lambda lines, isoforms: list(filter_dat(lines, isoforms))),
+    ):
+        start = time.perf_counter()
+        outputs[name] = "".join(function(io.StringIO(dat), isoform_hash))
+        seconds = time.perf_counter() - start
+        print(f"{name:<6} {args.records / seconds:>10.0f} records/s")
+    if outputs["before"] != outputs["after"]:
+        raise SystemExit("Error: The outputs differ")
+    print(f"Identical outputs, {outputs['after'].count('>')} sequences kept")
+
+
+if __name__ == "__main__":
+    main()
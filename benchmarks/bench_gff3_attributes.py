@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the per-line cost of the GFF3 attribute parsing and description
+encoding in add_description_to_annotation_GFF3, before (full dict of all attributes,
+quote on every description) and after (only the required attributes, memoized quote)
+
+Usage:
+    python benchmarks/bench_gff3_attributes.py [--lines 200000]
+"""
+
+# import libraries
+import argparse
+import random
+import timeit
+from urllib.parse import quote
+
+from eifunannot.scripts.add_description_to_annotation_GFF3 import (
+    ATTRIBUTE,
+    TRANSCRIPT_KEYS,
+    AddDescriptionToAnnotation,
+    encode_description,
+)
+
+DESCRIPTIONS = [
+    "Unknown protein",
+    "Protein kinase domain-containing protein",
+    "F-box protein",
+    "Transposon Ty3-I Gag-Pol polyprotein",
+    "ATP-dependent DNA helicase",
+]
+
+
+def parse_before(row):
+    return {
+        k.lower(): v
+        for k, v in (item.split("=") for item in row[ATTRIBUTE].strip(" ;").split(";"))
+    }
+
+
+def before(rows, descriptions):
+    for row, description in zip(rows, descriptions):
+        attrib = parse_before(row)
+        attrib["id"], attrib["parent"], attrib["confidence"]
+        quote(description, safe="")
+
+
+def after(rows, descriptions):
+    parse_attributes = AddDescriptionToAnnotation.parse_attributes
+    for row, description in zip(rows, descriptions):
+        attrib = parse_attributes(row, TRANSCRIPT_KEYS)
+        attrib["id"], attrib["parent"], attrib["confidence"]
+        encode_description(description)
+
+
+def generate_rows(lines, seed=1):
+    random.seed(seed)
+    rows = []
+    for num in range(lines):
+        trans = f"Chr{num % 7 + 1}G{num // 2:07d}.{num % 2 + 1}"
+        attributes = ";".join(
+            [
+                f"ID={trans}",
+                f"Parent={trans.rsplit('.', 1)[0]}",
+                f"Name={trans}",
+                "Note=protein_coding",
+                "confidence=High",
+                "has_start=True",
+                "has_stop=True",
+                "primary=True",
+                "representative=True",
+                f"alias={trans}",
+                "coding=True",
+            ]
+        )
+        rows.append(
+            ["Chr1", "Minos", "mRNA", "1", "1000", ".", "+", ".", attributes + ";"]
+        )
+    descriptions = [random.choice(DESCRIPTIONS) for _ in range(lines)]
+    return rows, descriptions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "--lines",
+        type=int,
+        default=200000,
+        help="Number of transcript lines (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of timings, the best is reported (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    rows, descriptions = generate_rows(args.lines)
+    for name, function in (("before", before), ("after", after)):
+        seconds = min(
+            timeit.repeat(
+                lambda: function(rows, descriptions), number=1, repeat=args.repeat
+            )
+        )
+        print(f"{name:<6} {seconds * 1e9 / args.lines:>8.0f} ns per line")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup time of every console script in the entry_points of setup.py: the import of
+its module, and its '--help' run through the entry point function, each in a fresh
+interpreter. A script failing to start (e.g. a missing dependency) is reported with
+the last line of its error.
+
+With --importtime, the slowest imports of each script are listed from
+'python -X importtime'.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 5] [--importtime]
+"""
+
+# import libraries
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SETUP_PY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "setup.py"
+)
+
+
+def console_scripts(setup_py):
+    """
+    Name, module and function of the console scripts of setup_py
+    """
+    with open(setup_py, "r") as fh:
+        tree = ast.parse(fh.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.keyword) and node.arg == "entry_points":
+            entry_points = ast.literal_eval(node.value)
+            break
+    else:
+        raise SystemExit(f"Error: no entry_points in '{setup_py}'")
+    scripts = []
+    for entry in entry_points.get("console_scripts", []):
+        name, target = (field.strip() for field in entry.split("=", 1))
+        module, function = target.split(":")
+        scripts.append((name, module, function))
+    return scripts
+
+
+def help_code(name, module, function):
+    # the entry point as the installed script calls it
+    return f"import sys; sys.argv = [{name!r}, '--help']; from {module} import {function}; {function}()"
+
+
+def run_python(code, options=()):
+    """
+    Seconds, exit status and stderr of python running code
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, *options, "-c", code],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return time.perf_counter() - start, process.returncode, process.stderr
+
+
+def time_code(code, repeat):
+    """
+    Median seconds of repeat runs of code, or the last error line if it fails
+    """
+    seconds = []
+    for _ in range(repeat):
+        elapsed, returncode, stderr = run_python(code)
+        # argparse exits with 0 after --help
+        if returncode:
+            lines = stderr.strip().splitlines()
+            return None, lines[-1] if lines else f"exit status {returncode}"
+        seconds.append(elapsed)
+    return statistics.median(seconds), None
+
+
+def slowest_imports(module, top):
+    """
+    Cumulative microseconds and names of the top slowest imports of module
+    """
+    elapsed, returncode, stderr = run_python(f"import {module}", ("-X", "importtime"))
+    imports = []
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        imports.append((int(cumulative_us), name.rstrip()))
+    imports.sort(reverse=True)
+    return imports[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Runs of each measure, the median is reported (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--setup",
+        default=SETUP_PY,
+        help="setup.py of the console scripts (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--importtime",
+        action="store_true",
+        help="List the slowest imports of each script",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=8,
+        help="Imports listed with --importtime (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    baseline, error = time_code("pass", args.repeat)
+    print(f"python startup: {baseline * 1000:.0f} ms, included in the times below\n")
+    print(f"{'script':<45}{'import_ms':>11}{'help_ms':>10}")
+    for name, module, function in console_scripts(args.setup):
+        import_s, error = time_code(f"import {module}", args.repeat)
+        if error is None:
+            help_s, error = time_code(help_code(name, module, function), args.repeat)
+        if error is not None:
+            print(f"{name:<45}  failed: {error}")
+            continue
+        print(f"{name:<45}{import_s * 1000:>11.0f}{help_s * 1000:>10.0f}")
+        if args.importtime:
+            for cumulative_us, imported in slowest_imports(module, args.top):
+                print(f"    {cumulative_us / 1000:>8.1f} ms {imported}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+End to end benchmark of the eifunannot workflow overhead on a synthetic proteome
+
+The tools are replaced by the stand-ins in benchmarks/workflow/bin (blastp,
+makeblastdb, prinseq, interproscan.sh, the AHRD jar through java, and GNU time -v),
+which write outputs of realistic size in a fraction of the time, so that what is
+measured is the workflow itself:
+
+    dag                           snakemake -n, DAG build of the whole run
+    run                           snakemake run of all the rules, with their
+                                  logs/benchmarks/<rule>.<wildcards>.tsv files
+    report                        eifunannot report on the rule logs
+    stats                         AHRD output summary printed by eifunannot run
+                                  (needs pandas)
+    parse_blast                   parse_blast on a 17 column blast table
+    create_functional_annotation  create_functional_annotation on the AHRD output
+
+The results (seconds of each phase, jobs and seconds of each rule) are written as
+JSON with --output. With --compare, the phases and rules more than --threshold times
+slower than in an earlier results file are reported and the exit status is 1.
+
+Usage:
+    python benchmarks/bench_workflow.py [--proteins 5000] [--cores 2] \\
+        [--output results.json] [--compare previous.json]
+"""
+
+# import libraries
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import eifunannot
+from eifunannot.scripts import resource_report
+
+STAND_INS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "workflow", "bin")
+PACKAGE = os.path.dirname(os.path.abspath(eifunannot.__file__))
+SNAKEFILE = os.path.join(PACKAGE, "eifunannot.smk")
+AHRD_CONFIG = os.path.join(
+    PACKAGE, "config", "ahrd_example_input_go_prediction.generic.yaml"
+)
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+AHRD_RESOURCES = [
+    "blacklist_descline",
+    "filter_descline_sprot",
+    "filter_descline_trembl",
+    "filter_descline_tair",
+    "blacklist_token",
+    "interpro_dtd",
+    "gene_ontology_result",
+    "interpro_database",
+]
+
+
+def write_fasta(path, ids, descriptions, rng):
+    lengths = {}
+    with open(path, "w") as out:
+        for protein, description in zip(ids, descriptions):
+            seq = "M" + "".join(rng.choices(AMINO_ACIDS, k=rng.randint(80, 800)))
+            lengths[protein] = len(seq)
+            out.write(f">{protein} {description}\n")
+            for i in range(0, len(seq), 60):
+                out.write(f"{seq[i : i + 60]}\n")
+    return lengths
+
+
+def write_inputs(work_dir, args):
+    """
+    Synthetic proteome, databases, AHRD resources and run config, returns the paths of
+    the run config and of the proteome lengths
+    """
+    rng = random.Random(1)
+    data = os.path.join(work_dir, "data")
+    os.makedirs(data, exist_ok=True)
+    proteins = [
+        f"Chr{num % 12 + 1}G{num:07d}.{num % 3 + 1}" for num in range(args.proteins)
+    ]
+    lengths = write_fasta(
+        os.path.join(data, "proteins.fa"), proteins, ("" for _ in proteins), rng
+    )
+    databases = {
+        "reference": (
+            [f"AT{num % 5 + 1}G{num:05d}.1" for num in range(args.db_proteins)],
+            (
+                f"| Symbols: SYN{num} | synthetic protein {num} | chr1:{num}-{num + 900} FORWARD"
+                for num in range(args.db_proteins)
+            ),
+        ),
+        "swissprot": (
+            [f"sp|P{num:05d}|SYN{num}_ARATH" for num in range(args.db_proteins)],
+            (
+                f"Synthetic protein {num} OS=Arabidopsis thaliana OX=3702 GN=SYN{num} PE=1 SV=1"
+                for num in range(args.db_proteins)
+            ),
+        ),
+        "trembl": (
+            [f"tr|A0A{num:06d}|A0A{num:06d}_ARATH" for num in range(args.db_proteins)],
+            (
+                f"Uncharacterized protein OS=Arabidopsis thaliana OX=3702 GN=SYN{num} PE=4 SV=1"
+                for num in range(args.db_proteins)
+            ),
+        ),
+    }
+    for name, (ids, descriptions) in databases.items():
+        write_fasta(os.path.join(data, f"{name}.fa"), ids, descriptions, rng)
+    for resource in AHRD_RESOURCES:
+        with open(os.path.join(data, resource), "w") as out:
+            out.write("# synthetic\n")
+    run_config = os.path.join(work_dir, "run_config.yaml")
+    with open(run_config, "w") as out:
+        out.write(f"fasta: {os.path.join(data, 'proteins.fa')}\n")
+        out.write(f"output: {os.path.join(work_dir, 'output')}\n")
+        out.write(f"chunk_size: {args.chunk_size}\n")
+        out.write("databases:\n")
+        for name in databases:
+            out.write(f"    {name}: {os.path.join(data, f'{name}.fa')}\n")
+        for resource in AHRD_RESOURCES:
+            out.write(f"{resource}: {os.path.join(data, resource)}\n")
+        out.write("load:\n")
+        for tool in ("blast", "prinseq", "interproscan", "ahrd"):
+            out.write(f'    {tool}: "true"\n')
+        out.write("load_parameters:\n")
+        out.write('    blast: "-evalue 1e-5"\n')
+        out.write('    interproscan: "-goterms -iprlookup"\n')
+        out.write(f"time_command: \"{os.path.join(STAND_INS, 'time')} -v\"\n")
+    return run_config, lengths
+
+
+def write_parse_inputs(work_dir, lengths, rng):
+    """
+    17 column blast table against the reference and mikado style metrics table of the
+    proteome, inputs of parse_blast and create_functional_annotation
+    """
+    blast = os.path.join(work_dir, "query-vs-reference.cov.tblr")
+    metrics = os.path.join(work_dir, "metrics.final_table.tsv")
+    with open(blast, "w") as blast_out, open(metrics, "w") as metrics_out:
+        metrics_out.write("TID\tGID\t" + "\t".join(f"c{i}" for i in range(3, 15)))
+        metrics_out.write("\tbiotype\tconfidence\n")
+        for protein, qlen in lengths.items():
+            gene = protein.rsplit(".", 1)[0]
+            metrics_out.write(
+                f"{protein}\t{gene}\t" + "\t".join("0" for i in range(3, 15))
+            )
+            metrics_out.write(f"\tprotein_coding\t{rng.choice(['High', 'Low'])}\n")
+            if rng.random() < 0.2:
+                continue
+            sseqid = f"AT1G{rng.randint(0, 99999):05d}.1"
+            slen = rng.randint(80, 800)
+            for hsp in range(rng.randint(1, 3)):
+                qstart = rng.randint(1, max(1, qlen - 50))
+                qend = min(qlen, qstart + rng.randint(30, 400))
+                sstart = rng.randint(1, max(1, slen - 50))
+                send = min(slen, sstart + qend - qstart)
+                length = qend - qstart + 1
+                blast_out.write(
+                    f"{protein}\t{sseqid}\t80.0\t{qstart}\t{qend}\t{sstart}\t{send}\t{qlen}\t{slen}"
+                    f"\t{length}\t{length * 4 // 5}\t{length // 5}\t{length * 9 // 10}\t0\t0\t1e-50\t{length}\n"
+                )
+    return blast, metrics
+
+
+def timed(name, timings, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    timings[name] = round(time.perf_counter() - start, 3)
+    print(f"{name:<30}{timings[name]:>10.2f} s")
+    return result
+
+
+def run_logged(cmd, log, cwd, env=None):
+    with open(log, "w") as out:
+        subprocess.run(
+            cmd, cwd=cwd, env=env, stdout=out, stderr=subprocess.STDOUT, check=True
+        )
+
+
+def rule_benchmarks(benchmarks_dir):
+    """
+    Jobs, total and maximum seconds of each rule, from the snakemake benchmark files
+    """
+    rules = {}
+    for name in sorted(os.listdir(benchmarks_dir)):
+        with open(os.path.join(benchmarks_dir, name), "r") as fh:
+            header = fh.readline().rstrip("\n").split("\t")
+            values = fh.readline().rstrip("\n").split("\t")
+        seconds = float(dict(zip(header, values))["s"])
+        rule = rules.setdefault(
+            name.split(".")[0], {"jobs": 0, "total_s": 0.0, "max_s": 0.0}
+        )
+        rule["jobs"] += 1
+        rule["total_s"] = round(rule["total_s"] + seconds, 3)
+        rule["max_s"] = max(rule["max_s"], seconds)
+    return rules
+
+
+def report(logs_dir):
+    usage = resource_report.collect_usage(logs_dir)
+    summary, stragglers, suggested = resource_report.summarise(usage, {})
+    return resource_report.report_text(usage, summary, stragglers)
+
+
+def ahrd_stats(output):
+    try:
+        from eifunannot.__main__ import EiFunAnnotAHRD
+    except ImportError as err:
+        print(f"Skip the stats phase: {err}")
+        return False
+    with contextlib.redirect_stdout(io.StringIO()):
+        EiFunAnnotAHRD.print_ahrd_stats(output, False)
+    return True
+
+
+def compare(results, previous, threshold):
+    """
+    Phases and rules more than threshold times slower than in previous
+    """
+    regressions = []
+    pairs = [
+        (f"phase {name}", seconds, previous.get("phases", {}).get(name))
+        for name, seconds in results["phases"].items()
+    ] + [
+        (
+            f"rule {name}",
+            rule["total_s"],
+            previous.get("rules", {}).get(name, {}).get("total_s"),
+        )
+        for name, rule in results["rules"].items()
+    ]
+    for name, seconds, before in pairs:
+        # sub-second timings are mostly noise
+        if before and seconds > 1 and seconds > before * threshold:
+            regressions.append(
+                f"{name}: {before:.2f} s -> {seconds:.2f} s ({seconds / before:.2f}x)"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "--proteins",
+        type=int,
+        default=5000,
+        help="Number of proteins in the proteome (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--db_proteins",
+        type=int,
+        default=20000,
+        help="Number of proteins in each database (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=500,
+        help="Proteins per chunk (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cores",
+        type=int,
+        default=2,
+        help="Cores used by snakemake (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--work_dir",
+        help="Keep the run in this folder (default: a temporary folder, removed at the end)",
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument(
+        "--compare", help="Results JSON file of an earlier run to compare with"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="Report the phases and rules slower than this many times the --compare results (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    snakemake = shutil.which("snakemake")
+    if snakemake is None:
+        raise SystemExit("Error: snakemake is required on PATH")
+
+    with contextlib.ExitStack() as stack:
+        work_dir = args.work_dir or stack.enter_context(
+            tempfile.TemporaryDirectory(prefix="eifunannot_bench_")
+        )
+        work_dir = os.path.abspath(work_dir)
+        os.makedirs(work_dir, exist_ok=True)
+        run_config, lengths = write_inputs(work_dir, args)
+        output = os.path.join(work_dir, "output")
+        env = {**os.environ, "PATH": f"{STAND_INS}{os.pathsep}{os.environ['PATH']}"}
+        cmd = [
+            snakemake,
+            "--snakefile",
+            SNAKEFILE,
+            "--configfile",
+            run_config,
+            "--config",
+            f"ahrd_config={AHRD_CONFIG}",
+            "--cores",
+            str(args.cores),
+        ]
+        print(
+            f"{args.proteins} proteins, {len(range(0, args.proteins, args.chunk_size))} chunks, {args.cores} cores, in '{work_dir}'"
+        )
+        timings = {}
+        timed(
+            "dag",
+            timings,
+            run_logged,
+            cmd + ["-n"],
+            os.path.join(work_dir, "dag.log"),
+            work_dir,
+            env,
+        )
+        timed(
+            "run",
+            timings,
+            run_logged,
+            cmd,
+            os.path.join(work_dir, "run.log"),
+            work_dir,
+            env,
+        )
+        timed("report", timings, report, os.path.join(work_dir, "logs", "cluster"))
+        if not timed("stats", timings, ahrd_stats, output):
+            del timings["stats"]
+        blast, metrics = write_parse_inputs(work_dir, lengths, random.Random(2))
+        timed(
+            "parse_blast",
+            timings,
+            run_logged,
+            [sys.executable, "-m", "eifunannot.scripts.parse_blast", "-b", blast],
+            os.path.join(work_dir, "parse_blast.tsv"),
+            work_dir,
+        )
+        timed(
+            "create_functional_annotation",
+            timings,
+            run_logged,
+            [
+                sys.executable,
+                "-m",
+                "eifunannot.scripts.create_functional_annotation",
+                "--ahrd_output",
+                os.path.join(output, "ahrd_output.csv"),
+                "--metrics_output",
+                metrics,
+                "--blast_tblr_output",
+                blast,
+            ],
+            os.path.join(work_dir, "functional_annotation.tsv"),
+            work_dir,
+        )
+        rules = rule_benchmarks(os.path.join(work_dir, "logs", "benchmarks"))
+
+    print(f"\n{'rule':<30}{'jobs':>6}{'total_s':>10}{'max_s':>10}")
+    for name, rule in rules.items():
+        print(
+            f"{name:<30}{rule['jobs']:>6}{rule['total_s']:>10.2f}{rule['max_s']:>10.2f}"
+        )
+    results = {
+        "version": eifunannot.__version__,
+        "proteins": args.proteins,
+        "db_proteins": args.db_proteins,
+        "chunk_size": args.chunk_size,
+        "cores": args.cores,
+        "phases": timings,
+        "rules": rules,
+    }
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=4)
+            out.write("\n")
+    if args.compare:
+        with open(args.compare, "r") as fh:
+            regressions = compare(results, json.load(fh), args.threshold)
+        if regressions:
+            print("\nRegressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+        print(f"\nNo regression above {args.threshold}x of '{args.compare}'")
+
+
+if __name__ == "__main__":
+    main()
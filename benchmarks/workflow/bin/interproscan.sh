@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stand-in for InterProScan: write MATCHES (default 5) TSV (-f TSV) matches per protein,
+with InterPro and GO annotations on part of them
+
+Usage:
+    interproscan.sh -i proteins.fa -b prefix -f TSV [other options]
+"""
+
+# import libraries
+import argparse
+import hashlib
+import os
+import random
+
+ANALYSES = ["Pfam", "PANTHER", "Gene3D", "SUPERFAMILY", "SMART", "CDD", "PRINTS"]
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-i", required=True)
+parser.add_argument("-b", required=True)
+args, _ = parser.parse_known_args()
+matches = int(os.environ.get("MATCHES", 5))
+
+proteins = []
+with open(args.i, "r") as fh:
+    for line in fh:
+        if line.startswith(">"):
+            proteins.append([line[1:].split()[0], []])
+        elif proteins:
+            proteins[-1][1].append(line.strip())
+
+with open(f"{args.b}.tsv", "w") as out:
+    for protein, seq_lines in proteins:
+        seq = "".join(seq_lines)
+        md5 = hashlib.md5(seq.encode()).hexdigest()
+        rng = random.Random(protein)
+        for match in range(rng.randint(0, matches * 2)):
+            analysis = rng.choice(ANALYSES)
+            start = rng.randint(1, max(1, len(seq) - 30))
+            stop = min(len(seq), start + rng.randint(20, 200))
+            ipr = rng.randint(0, 40000)
+            fields = [
+                protein,
+                md5,
+                str(len(seq)),
+                analysis,
+                f"{analysis[:2].upper()}{rng.randint(0, 99999):05d}",
+                "Synthetic domain",
+                str(start),
+                str(stop),
+                f"{10 ** -rng.randint(3, 60):.1E}",
+                "T",
+                "19-10-2026",
+            ]
+            if rng.random() < 0.7:
+                fields += [f"IPR{ipr:06d}", f"Synthetic family {ipr}"]
+                if rng.random() < 0.5:
+                    fields.append(f"GO:{rng.randint(0, 99999):07d}")
+            out.write("\t".join(fields) + "\n")
@@ -1,8 +1,16 @@
-import pkg_resources
+try:
+    from importlib.metadata import version
+except ImportError:
+    # Python <3.8
+    from pkg_resources import get_distribution
+
+    def version(name):
+        return get_distribution(name).version
+
 
 __title__ = "eifunannot"
 __author__ = "Gemy Kaithakottil (kaithakg)"
 __email__ = "Gemy.Kaithakottil@earlham.ac.uk"
 __license__ = "GNU General Public License v3.0"
 __copyright__ = "Copyright 2019-2023 Earlham Institute"
-__version__ = pkg_resources.require("eifunannot")[0].version
+__version__ = version("eifunannot")
@@ -10,13 +10,16 @@ import re
 import sys
 import subprocess
 import logging
-import yaml
 import glob
-import pkg_resources
+import json
 from shutil import copy
-import pandas as pd
+
+# pandas and yaml are imported by the commands using them, keeping --help and
+# configure fast
 
 from eifunannot import __version__, __author__, __email__
+from eifunannot.scripts import resource_report
+from eifunannot.scripts.snakemake_progress import SnakemakeProgress
 
 # check python version
 try:
@@ -37,38 +40,47 @@ script = os.path.basename(sys.argv[0])
 # get cwd
 cwd = os.getcwd()
 
-# get pkg_resources
-# get config location
-config_folder = pkg_resources.resource_filename("eifunannot", "config")
-# need to split the file and make uniq list names
-configure_files = [
-    os.path.basename(fname)
-    for fname in glob.iglob(os.path.join(config_folder, "**", "*yaml"), recursive=True)
-]
-# we need the cluster_config as str to concatenate during the subprocess cmd
-cluster_config = "".join(
-    [
+
+def package_path(*parts):
+    """
+    Path of a file or folder installed with the eifunannot package
+    """
+    try:
+        from importlib.resources import files
+    except ImportError:
+        # Python <3.9, the package is installed as plain files
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), *parts)
+    return str(files("eifunannot").joinpath(*parts))
+
+
+def config_files():
+    """
+    Cluster, run and AHRD config files of the package, searched when a command needs them
+    """
+    config_folder = package_path("config")
+    # we need the cluster_config as str to concatenate during the subprocess cmd
+    cluster_config = "".join(
+        [
+            fname
+            for fname in glob.iglob(
+                os.path.join(config_folder, "**", "cluster_config.json"),
+                recursive=True,
+            )
+        ]
+    )
+    run_config = [
         fname
         for fname in glob.iglob(
-            os.path.join(config_folder, "**", "cluster_config.json"), recursive=True
+            os.path.join(config_folder, "**", "run_config.yaml"), recursive=True
         )
     ]
-)
-run_config = [
-    fname
-    for fname in glob.iglob(
-        os.path.join(config_folder, "**", "run_config.yaml"), recursive=True
-    )
-]
-ahrd_config = [
-    fname
-    for fname in glob.iglob(
-        os.path.join(config_folder, "**", "ahrd*generic*yaml"), recursive=True
-    )
-]
-# snakemake path
-# snakemake_file = [fname for fname in glob.iglob(os.path.join(eifunannot_folder, "**", "eifunannot.smk"), recursive=True)]
-snakemake_file = pkg_resources.resource_filename("eifunannot", "eifunannot.smk")
+    ahrd_config = [
+        fname
+        for fname in glob.iglob(
+            os.path.join(config_folder, "**", "ahrd*generic*yaml"), recursive=True
+        )
+    ]
+    return cluster_config, run_config, ahrd_config
 
 
 class EiFunAnnotAHRD(object):
@@ -80,6 +92,7 @@ class EiFunAnnotAHRD(object):
 The commands are:
    configure     Get the configuration files
    run           Run the pipeline
+   report        Report the resource usage of a run
 """,
         )
         parser.add_argument("command", help="Subcommand to run")
@@ -129,7 +142,7 @@ The commands are:
         output = args.output
         force = args.force
         print(f"Running eifunannot configure..")
-        for file in cluster_config, run_config, ahrd_config:
+        for file in config_files():
             abs_file_path = "".join(file)
             file_base = os.path.basename(abs_file_path)
             if force or not os.path.exists(os.path.join(output, file_base)):
@@ -171,7 +184,7 @@ The commands are:
         )
         parser.add_argument(
             "--hpc_config",
-            default=cluster_config,
+            default=config_files()[0],
             nargs="?",
             help="Provide hpc_config.json file (default: %(default)s)",
         )
@@ -189,6 +202,17 @@ The commands are:
             action="store_true",
             help="Dry run (default: %(default)s)",
         )
+        parser.add_argument(
+            "--events",
+            default=os.path.join(cwd, "logs", "eifunannot_run.events.jsonl"),
+            help="JSON lines log of the job events of the run, '' to disable (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--progress_interval",
+            type=int,
+            default=300,
+            help="Seconds between two per rule progress tables printed with the Snakemake log (default: %(default)s)",
+        )
         # args = parser.parse_args()
         # only consider arguments after first two
         args = parser.parse_args(sys.argv[2:])
@@ -198,6 +222,13 @@ The commands are:
         hpc_config = args.hpc_config
         jobs = args.jobs
         dry_run = args.dry_run
+        if args.events:
+            os.makedirs(os.path.dirname(os.path.abspath(args.events)), exist_ok=True)
+        progress = SnakemakeProgress(
+            args.events or None, interval=args.progress_interval, dry_run=dry_run
+        )
+
+        import yaml
 
         output = None
         with open(config, "r") as ymlfile:
@@ -223,13 +254,105 @@ The commands are:
         # run AHRD pipeline
         print("Running eifunannot run..")
         EiFunAnnotAHRD.run_ahrd(
-            output, no_reference, config, ahrd_config, hpc_config, dry_run, jobs
+            output,
+            no_reference,
+            config,
+            ahrd_config,
+            hpc_config,
+            dry_run,
+            jobs,
+            progress,
+        )
+
+    # eifunannot report setup
+    def report(self):
+        parser = argparse.ArgumentParser(
+            description=f"EI FunAnnot version {__version__} - report",
+            formatter_class=RawTextHelpFormatter,
+            epilog="Example report command:\n"
+            + script
+            + " report --suggest cluster_config.suggested.json"
+            + "\n\nContact:"
+            + __author__
+            + "("
+            + __email__
+            + ")",
+        )
+        parser.add_argument(
+            "--logs",
+            default=os.path.join(cwd, "logs", "cluster"),
+            help="Folder of the rule logs with the '/usr/bin/time -v' output (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--hpc_config",
+            default=config_files()[0],
+            help="hpc_config.json file used by the run (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--straggler",
+            type=float,
+            default=2.0,
+            help="Flag the chunks whose wall time is more than this many times the median of their rule (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--min_mem_use",
+            type=float,
+            default=0.5,
+            help="Flag the rules whose maximum resident set size is below this fraction of their memory request (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--headroom",
+            type=float,
+            default=1.2,
+            help="Suggest memory requests of this many times the maximum resident set size of each rule (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--tsv",
+            help="Write the per chunk usage table to this tsv file",
+        )
+        parser.add_argument(
+            "--suggest",
+            help="Write the hpc_config.json with the suggested memory requests to this file",
+        )
+        args = parser.parse_args(sys.argv[2:])
+
+        usage = resource_report.collect_usage(args.logs)
+        if not usage:
+            print(f"No '/usr/bin/time -v' output found in the logs of '{args.logs}'")
+            sys.exit(1)
+        with open(args.hpc_config, "r") as fh:
+            hpc_config = json.load(fh)
+        summary, stragglers, suggested = resource_report.summarise(
+            usage,
+            hpc_config,
+            straggler=args.straggler,
+            headroom=args.headroom,
+            min_mem_use=args.min_mem_use,
         )
+        print(resource_report.report_text(usage, summary, stragglers))
+        if args.tsv:
+            resource_report.write_usage_tsv(usage, args.tsv)
+            print(f"Per chunk usage written to file '{args.tsv}'")
+        if args.suggest:
+            with open(args.suggest, "w") as out:
+                json.dump(suggested, out, indent=4)
+                out.write("\n")
+            print(f"Suggested hpc_config written to file '{args.suggest}'")
 
     @staticmethod
-    def run_ahrd(output, no_reference, config, ahrd_config, hpc_config, dry_run, jobs):
+    def run_ahrd(
+        output,
+        no_reference,
+        config,
+        ahrd_config,
+        hpc_config,
+        dry_run,
+        jobs,
+        progress=None,
+    ):
         # print(output, config, hpc_config, dry_run, jobs)
         # print(type(output), type(config), type(hpc_config), type(dry_run), type(jobs))
+        snakemake_file = package_path("eifunannot.smk")
         cmd = None
         if dry_run:
             print("Enabling dry run..")
@@ -254,137 +377,141 @@ The commands are:
                 + f" --jobs {str(jobs)}"
                 + ' --cluster " sbatch -p {cluster.partition} -c {cluster.c} --mem {cluster.mem} -J {cluster.J} -o {cluster.o} --exclude={cluster.exclude}"'
             )
+        # stream the Snakemake log (stderr) as it is written, instead of keeping all
+        # of it in memory until the end of the run
         p = subprocess.Popen(
-            cmd, shell=True, stdout=subprocess.PIPE, universal_newlines=True
-        )  # for universal_newlines - https://stackoverflow.com/a/4417735
-        (
-            result,
-            error,
-        ) = (
-            p.communicate()
-        )  # https://www.programcreek.com/python/example/50/subprocess.Popen
-        exit_code = p.returncode
+            cmd,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,  # https://stackoverflow.com/a/4417735
+            bufsize=1,
+        )
+        for line in p.stdout:
+            print(line, end="", flush=True)
+            if progress is not None:
+                progress.feed(line)
+        exit_code = p.wait()
+        if progress is not None:
+            progress.close(exit_code)
         if exit_code:
             raise subprocess.CalledProcessError(exit_code, cmd)
-        print(result)
 
         if dry_run:
             print("Dry run completed successfully!\n")
         else:
             print("AHRD pipeline completed successfully!\n")
-            # get the outputs
-            interproscan_output_file = f"{output}/query-vs-interproscan.tsv"
-            if no_reference:
-                pass
-            else:
-                reference_blastp_output_file = (
-                    f"{output}/query-vs-reference.blastp.tblr"
-                )
-            swissprot_blastp_output_file = f"{output}/query-vs-swissprot.blastp.tblr"
-            trembl_blastp_output_file = f"{output}/query-vs-trembl.blastp.tblr"
-            output_file = f"{output}/ahrd_output.csv"
-            # process AHRD output to get stats
-            data = pd.read_csv(
-                output_file, sep="\t", comment="#", keep_default_na=False
-            )
-            # keeping for reference
-            # print(data['AHRD-Quality-Code'].value_counts(dropna=False))
-            # print(data['AHRD-Quality-Code'].value_counts(normalize=True, dropna=False)*100)
-            # # get quality code that are not NaN
-            # hits = data['AHRD-Quality-Code'].isna().value_counts()[False]
-            # # get quality code that are NaN
-            # no_hits = data['AHRD-Quality-Code'].isna().value_counts()[True]
-
-            # =====#
-            # print stats
-            # AHRD-Quality-Code stats
-            # https://stackoverflow.com/a/50169502
-            ahrd_quality_code_stats = pd.concat(
-                [
-                    data["AHRD-Quality-Code"].value_counts(dropna=False),
-                    round(
-                        data["AHRD-Quality-Code"]
-                        .value_counts(normalize=True, dropna=False)
-                        .mul(100),
-                        2,
-                    ),
-                ],
-                axis=1,
-                keys=("counts", "percentages"),
-            )
-            print(
-                f"AHRD-Quality-Code stats: [NaN = No hit, Reference here: https://github.com/groupschoof/AHRD/blob/master/README.textile#241-tab-delimited-table]\n{ahrd_quality_code_stats}\n"
-            )
-            # =====#
-            total_data = len(data)  # get total
-            # get count with and without function
-            unknown = data["Human-Readable-Description"].str.contains(
-                r"^Unknown protein$"
-            )
-            try:
-                hits = unknown.value_counts()[False]
-            except KeyError as err:
-                # print(f"There are no hits that has function: {err}")
-                hits = 0
-            try:
-                no_hits = unknown.value_counts()[True]
-            except KeyError as err:
-                # print(f"There are no hits that are unknown: {err}")
-                no_hits = 0
-
-            # print error if the total_data does not match hits + no_hits
-            assert (
-                total_data == hits + no_hits
-            ), f"ERROR: Total output {total_data} and hits {hits + no_hits} do not match"
-            # get repeat association - based on two columns, 'Human-Readable-Description' and 'Interpro-ID (Description)'
-            # https://stackoverflow.com/a/45709524
-            repeat_associated = data["Human-Readable-Description"].str.contains(
-                r"transpos|helicas"
-            ) | data["Interpro-ID (Description)"].str.contains(r"transpos|helicas")
-            try:
-                repeat_associated_hits = repeat_associated.value_counts()[True]
-            except KeyError as err:
-                # print(f"There are no hits that are repeat associated: {err}")
-                repeat_associated_hits = 0
-            # get unknown with interproscan ids
-            unknown_with_ipr = data["Human-Readable-Description"].str.contains(
-                r"^Unknown protein$"
-            ) & data["Interpro-ID (Description)"].str.contains(r"IPR")
-            try:
-                unknown_with_ipr_hits = unknown_with_ipr.value_counts()[True]
-            except KeyError as err:
-                # print(f"There are no unknown hits with IPR: {err}")
-                unknown_with_ipr_hits = 0
+            EiFunAnnotAHRD.print_ahrd_stats(output, no_reference)
 
-            # =====#
-            # print summary
-            print("Overall summary:")
-            print(f"Of total {total_data} input protein models:")
-            print(
-                f"{hits} ({round(hits / total_data, 4) * 100} %) - have functional annotation (of which {repeat_associated_hits} are repeat associated (transposon|transposase|helicase))"
-            )
-            print(
-                f"{no_hits} ({round(no_hits / total_data, 4) * 100} %) - are unknown proteins (of which {unknown_with_ipr_hits} have an interproscan id)"
-            )
-            print(f"\nMain AHRD output file:\n{output_file}\n")
-            print("Other output files:")
-            if no_reference:
-                pass
-            else:
-                print(
-                    f"Query protein vs reference blastp output file: {reference_blastp_output_file}"
-                )
-            print(
-                f"Query protein vs UniProt Swiss-Prot blastp output file: {swissprot_blastp_output_file}"
-            )
-            print(
-                f"Query protein vs UniProt TrEMBL blastp output file: {trembl_blastp_output_file}"
-            )
+    @staticmethod
+    def print_ahrd_stats(output, no_reference):
+        import pandas as pd
+
+        # get the outputs
+        interproscan_output_file = f"{output}/query-vs-interproscan.tsv"
+        if no_reference:
+            pass
+        else:
+            reference_blastp_output_file = f"{output}/query-vs-reference.blastp.tblr"
+        swissprot_blastp_output_file = f"{output}/query-vs-swissprot.blastp.tblr"
+        trembl_blastp_output_file = f"{output}/query-vs-trembl.blastp.tblr"
+        output_file = f"{output}/ahrd_output.csv"
+        # process AHRD output to get stats
+        data = pd.read_csv(output_file, sep="\t", comment="#", keep_default_na=False)
+        # keeping for reference
+        # print(data['AHRD-Quality-Code'].value_counts(dropna=False))
+        # print(data['AHRD-Quality-Code'].value_counts(normalize=True, dropna=False)*100)
+        # # get quality code that are not NaN
+        # hits = data['AHRD-Quality-Code'].isna().value_counts()[False]
+        # # get quality code that are NaN
+        # no_hits = data['AHRD-Quality-Code'].isna().value_counts()[True]
+
+        # =====#
+        # print stats
+        # AHRD-Quality-Code stats
+        # https://stackoverflow.com/a/50169502
+        ahrd_quality_code_stats = pd.concat(
+            [
+                data["AHRD-Quality-Code"].value_counts(dropna=False),
+                round(
+                    data["AHRD-Quality-Code"]
+                    .value_counts(normalize=True, dropna=False)
+                    .mul(100),
+                    2,
+                ),
+            ],
+            axis=1,
+            keys=("counts", "percentages"),
+        )
+        print(
+            f"AHRD-Quality-Code stats: [NaN = No hit, Reference here: https://github.com/groupschoof/AHRD/blob/master/README.textile#241-tab-delimited-table]\n{ahrd_quality_code_stats}\n"
+        )
+        # =====#
+        total_data = len(data)  # get total
+        # get count with and without function
+        unknown = data["Human-Readable-Description"].str.contains(r"^Unknown protein$")
+        try:
+            hits = unknown.value_counts()[False]
+        except KeyError as err:
+            # print(f"There are no hits that has function: {err}")
+            hits = 0
+        try:
+            no_hits = unknown.value_counts()[True]
+        except KeyError as err:
+            # print(f"There are no hits that are unknown: {err}")
+            no_hits = 0
+
+        # print error if the total_data does not match hits + no_hits
+        assert (
+            total_data == hits + no_hits
+        ), f"ERROR: Total output {total_data} and hits {hits + no_hits} do not match"
+        # get repeat association - based on two columns, 'Human-Readable-Description' and 'Interpro-ID (Description)'
+        # https://stackoverflow.com/a/45709524
+        repeat_associated = data["Human-Readable-Description"].str.contains(
+            r"transpos|helicas"
+        ) | data["Interpro-ID (Description)"].str.contains(r"transpos|helicas")
+        try:
+            repeat_associated_hits = repeat_associated.value_counts()[True]
+        except KeyError as err:
+            # print(f"There are no hits that are repeat associated: {err}")
+            repeat_associated_hits = 0
+        # get unknown with interproscan ids
+        unknown_with_ipr = data["Human-Readable-Description"].str.contains(
+            r"^Unknown protein$"
+        ) & data["Interpro-ID (Description)"].str.contains(r"IPR")
+        try:
+            unknown_with_ipr_hits = unknown_with_ipr.value_counts()[True]
+        except KeyError as err:
+            # print(f"There are no unknown hits with IPR: {err}")
+            unknown_with_ipr_hits = 0
+
+        # =====#
+        # print summary
+        print("Overall summary:")
+        print(f"Of total {total_data} input protein models:")
+        print(
+            f"{hits} ({round(hits / total_data, 4) * 100} %) - have functional annotation (of which {repeat_associated_hits} are repeat associated (transposon|transposase|helicase))"
+        )
+        print(
+            f"{no_hits} ({round(no_hits / total_data, 4) * 100} %) - are unknown proteins (of which {unknown_with_ipr_hits} have an interproscan id)"
+        )
+        print(f"\nMain AHRD output file:\n{output_file}\n")
+        print("Other output files:")
+        if no_reference:
+            pass
+        else:
             print(
-                f"Query protein vs InterProScan output file: {interproscan_output_file}"
+                f"Query protein vs reference blastp output file: {reference_blastp_output_file}"
             )
-            print()
-            # =====#
+        print(
+            f"Query protein vs UniProt Swiss-Prot blastp output file: {swissprot_blastp_output_file}"
+        )
+        print(
+            f"Query protein vs UniProt TrEMBL blastp output file: {trembl_blastp_output_file}"
+        )
+        print(f"Query protein vs InterProScan output file: {interproscan_output_file}")
+        print()
+        # =====#
 
 
 def main():
@@ -106,6 +106,11 @@ chunk_numbers = list(range(1,total_chunks+1)) # need to add chunks+1 to get desi
 cluster_logs_dir = os.path.join(cwd,"logs","cluster")
 if not os.path.exists(cluster_logs_dir):
     os.makedirs(cluster_logs_dir)
+# snakemake benchmark of each job, wall time and memory as seen by snakemake
+benchmarks_dir = os.path.join(cwd,"logs","benchmarks")
+
+# command timing the tools, its output in the logs is read by 'eifunannot report'
+TIME = config.get("time_command", "/usr/bin/time -v")
 
 #######################
 # RULES STARTS HERE
@@ -151,6 +156,8 @@ rule split_fasta:
         expand(os.path.join(CHUNKS_FOLDER,"chunk_{sample}.txt"),sample=chunk_numbers)
     log:
         os.path.join(cluster_logs_dir,"split_fasta.log")
+    benchmark:
+        os.path.join(benchmarks_dir,"split_fasta.tsv")
     params:
         cwd = CHUNKS_FOLDER,
         prefix = "chunk",
@@ -161,7 +168,7 @@ rule split_fasta:
         + " && cd {params.cwd} " \
         + " && ln -sf {input.fasta} "
         # awk script by Pierre Lindenbaum https://www.biostars.org/p/13270/
-        + " && /usr/bin/time -v awk 'BEGIN {{n=0;m=1;}} /^>/ {{ if (n%{params.chunks}==0) {{f=sprintf(\"{params.cwd}/{params.prefix}_%d.txt\",m); m++;}}; n++; }} {{ print >> f }}' {params.basename}"
+        + " && " + TIME + " awk 'BEGIN {{n=0;m=1;}} /^>/ {{ if (n%{params.chunks}==0) {{f=sprintf(\"{params.cwd}/{params.prefix}_%d.txt\",m); m++;}}; n++; }} {{ print >> f }}' {params.basename}"
         + ") 2> {log}"
 
 # run blast makeblastdb
@@ -173,6 +180,8 @@ rule makeblastdb:
         os.path.join(DATABASE_DIR,"{protein}.protein.fa.done")
     log:
         os.path.join(cluster_logs_dir,"makeblastdb.{protein}.log")
+    benchmark:
+        os.path.join(benchmarks_dir,"makeblastdb.{protein}.tsv")
     threads: 1
     params:
         cwd = DATABASE_DIR,
@@ -181,7 +190,7 @@ rule makeblastdb:
         "(set +u" \
         + " && cd {params.cwd} " \
         + " && {params.source} " \
-        + " && /usr/bin/time -v makeblastdb -in {input} -dbtype prot && touch {output}" \
+        + " && " + TIME + " makeblastdb -in {input} -dbtype prot && touch {output}" \
         + ") 2> {log}"
 
 # run blastp
@@ -196,6 +205,8 @@ rule blastp:
         completed = os.path.join(OUTPUT,"output_{protein}","chunk_{sample}.txt-vs-{protein}.blastp.completed")
     log:
         os.path.join(cluster_logs_dir,"blastp.chunk_{sample}_{protein}.log")
+    benchmark:
+        os.path.join(benchmarks_dir,"blastp.chunk_{sample}_{protein}.tsv")
     params:
         cwd = OUTPUT,
         threads = "4",
@@ -205,7 +216,7 @@ rule blastp:
         "(set +u" \
         + " && cd {params.cwd} " \
         + " && {params.source} " \
-        + " && /usr/bin/time -v blastp -db {input.database} -outfmt 6 -num_threads {params.threads} {params.parameters} -query {input.chunk} -out {output.output} " \
+        + " && " + TIME + " blastp -db {input.database} -outfmt 6 -num_threads {params.threads} {params.parameters} -query {input.chunk} -out {output.output} " \
         + " && touch {output.completed} " \
         + ") 2> {log}"
 
@@ -219,6 +230,8 @@ rule interproscan_5_22_61:
         completed = os.path.join(INTERPROSCAN_DIR,"chunk_{sample}","chunk_{sample}.txt.interproscan.completed"),
     log:
         os.path.join(cluster_logs_dir,"interproscan.chunk_{sample}.log")
+    benchmark:
+        os.path.join(benchmarks_dir,"interproscan_5_22_61.chunk_{sample}.tsv")
     params:
         cwd = os.path.join(INTERPROSCAN_DIR,"chunk_{sample}"),
         temp_name = "chunk_{sample}.raw.txt",
@@ -237,7 +250,7 @@ rule interproscan_5_22_61:
         + " && prinseq -fasta {params.temp_name} -aa -rm_header -out_good {params.temp_name}.good -out_bad {params.temp_name}.bad " \
         + " && mv {params.temp_name}.good.fasta {params.input} " \
         + " && {params.source_interproscan} " \
-        + " && /usr/bin/time -v interproscan.sh -i {params.input} -b {params.prefix} -f TSV {params.parameters}" \
+        + " && " + TIME + " interproscan.sh -i {params.input} -b {params.prefix} -f TSV {params.parameters}" \
         + " && touch {output.completed}" \
         + ") 2> {log}"
 
@@ -251,6 +264,8 @@ rule collate_blastp_reference:
         completed = os.path.join(OUTPUT,"query-vs-reference.blastp.completed")
     log:
         os.path.join(cluster_logs_dir,"collate_blastp_reference.log")
+    benchmark:
+        os.path.join(benchmarks_dir,"collate_blastp_reference.tsv")
     threads: 1
     params:
         cwd = OUTPUT,
@@ -271,6 +286,8 @@ rule collate_blastp_swissprot:
         completed = os.path.join(OUTPUT,"query-vs-swissprot.blastp.completed")
     log:
         os.path.join(cluster_logs_dir,"collate_blastp_swissprot.log")
+    benchmark:
+        os.path.join(benchmarks_dir,"collate_blastp_swissprot.tsv")
     threads: 1
     params:
         cwd = OUTPUT,
@@ -291,6 +308,8 @@ rule collate_blastp_trembl:
         completed = os.path.join(OUTPUT,"query-vs-trembl.blastp.completed")
     log:
         os.path.join(cluster_logs_dir,"collate_blastp_trembl.log")
+    benchmark:
+        os.path.join(benchmarks_dir,"collate_blastp_trembl.tsv")
     threads: 1
     params:
         cwd = OUTPUT,
@@ -311,6 +330,8 @@ rule collate_interproscan:
         completed = os.path.join(OUTPUT,"query-vs-interproscan.completed")
     log:
         os.path.join(cluster_logs_dir,"collate_interproscan.log")
+    benchmark:
+        os.path.join(benchmarks_dir,"collate_interproscan.tsv")
     threads: 1
     params:
         cwd = OUTPUT,
@@ -355,6 +376,8 @@ if no_reference:
             completed = os.path.join(AHRD_DIR,"chunk_{sample}","ahrd_output.completed")
         log:
             os.path.join(cluster_logs_dir,"ahrd.chunk_{sample}.log")
+        benchmark:
+            os.path.join(benchmarks_dir,"ahrd.chunk_{sample}.tsv")
         threads: 1
         params:
             cwd = os.path.join(AHRD_DIR,"chunk_{sample}"),
@@ -373,7 +396,7 @@ if no_reference:
             + " && ln -sf {input.blast_trembl} trembl_blastp_tabular.txt" \
             + " && touch prepare_ahrd.done" \
             + " && {params.source} " \
-            + " && /usr/bin/time -v java -Xmx10g -jar /ei/software/testing/ahrd/3.3.3/x86_64/bin/ahrd.jar ahrd_input_go_prediction.yml" \
+            + " && " + TIME + " java -Xmx10g -jar /ei/software/testing/ahrd/3.3.3/x86_64/bin/ahrd.jar ahrd_input_go_prediction.yml" \
             + " && touch {output.completed}" \
             + ") 2> {log}"
 else:
@@ -413,6 +436,8 @@ else:
             completed = os.path.join(AHRD_DIR,"chunk_{sample}","ahrd_output.completed")
         log:
             os.path.join(cluster_logs_dir,"ahrd.chunk_{sample}.log")
+        benchmark:
+            os.path.join(benchmarks_dir,"ahrd.chunk_{sample}.tsv")
         threads: 1
         params:
             cwd = os.path.join(AHRD_DIR,"chunk_{sample}"),
@@ -432,7 +457,7 @@ else:
             + " && ln -sf {input.blast_trembl} trembl_blastp_tabular.txt" \
             + " && touch prepare_ahrd.done" \
             + " && {params.source} " \
-            + " && /usr/bin/time -v java -Xmx10g -jar /ei/software/testing/ahrd/3.3.3/x86_64/bin/ahrd.jar ahrd_input_go_prediction.yml" \
+            + " && " + TIME + " java -Xmx10g -jar /ei/software/testing/ahrd/3.3.3/x86_64/bin/ahrd.jar ahrd_input_go_prediction.yml" \
             + " && touch {output.completed}" \
             + ") 2> {log}"
 
@@ -447,6 +472,8 @@ rule collate_ahrd:
         completed = os.path.join(OUTPUT,"ahrd_output.completed")
     log:
         os.path.join(cluster_logs_dir,"collate_ahrd.log")
+    benchmark:
+        os.path.join(benchmarks_dir,"collate_ahrd.tsv")
     threads: 1
     params:
         cwd = OUTPUT,
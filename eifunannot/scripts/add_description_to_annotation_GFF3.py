@@ -14,12 +14,21 @@ __email__ = "gemygk@gmail.com"
 
 # import libraries
 import argparse
+import io
 import os
 import re
 import logging
+import sqlite3
 import sys
+import tempfile
 from collections import defaultdict
-from requests.utils import quote
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from urllib.parse import quote
+from eifunannot.scripts.bgzf import SortedBgzfGff3Writer
+from eifunannot.scripts.external_sort import SORT_BUFFER
+from eifunannot.scripts.sort_gff3 import sort_gff3
 
 # get script name
 script = os.path.basename(sys.argv[0])
@@ -27,6 +36,10 @@ script = os.path.basename(sys.argv[0])
 # get the GFF3 attributes
 SEQID, SOURCE, TYPE, START, END, SCORE, STRAND, PHASE, ATTRIBUTE = range(9)
 
+# attributes (lower case) used from the gene and transcript lines
+GENE_KEYS = ("id", "name", "biotype", "confidence")
+TRANSCRIPT_KEYS = ("id", "parent", "name", "note", "confidence", "representative")
+
 logging.basicConfig(
     format="%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s",
     datefmt="%d-%b-%y %H:%M:%S",
@@ -34,6 +47,121 @@ logging.basicConfig(
 )
 
 
+@lru_cache(maxsize=4096)
+def encode_description(text):
+    # most transcripts share a handful of descriptions
+    return quote(text, safe="")
+
+
+class GeneIndex:
+    """
+    Gene ID to biotype lookup kept in an on-disk SQLite side table
+    """
+
+    def __init__(self, tmp_dir=None):
+        fd, self.path = tempfile.mkstemp(
+            prefix="eifunannot_genes_", suffix=".sqlite", dir=tmp_dir
+        )
+        os.close(fd)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute("CREATE TABLE genes (id TEXT PRIMARY KEY, biotype TEXT)")
+        self.owner = True
+        # transcripts of a gene are usually adjacent
+        self._last = (None, None)
+
+    def __getstate__(self):
+        # worker processes reopen the same database read only
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        self.owner = False
+        self._last = (None, None)
+
+    def update(self, pairs):
+        # the first biotype seen for a gene ID is kept
+        self.db.executemany("INSERT OR IGNORE INTO genes VALUES (?, ?)", pairs)
+        self.db.commit()
+
+    def __setitem__(self, gene_id, biotype):
+        self.update([(gene_id, biotype)])
+
+    def get(self, gene_id, default=None):
+        if self._last[0] == gene_id:
+            return self._last[1]
+        row = self.db.execute(
+            "SELECT biotype FROM genes WHERE id = ?", (gene_id,)
+        ).fetchone()
+        if row is None:
+            return default
+        self._last = (gene_id, row[0])
+        return row[0]
+
+    def __contains__(self, gene_id):
+        return self.get(gene_id) is not None
+
+    def __getitem__(self, gene_id):
+        biotype = self.get(gene_id)
+        if biotype is None:
+            raise KeyError(gene_id)
+        return biotype
+
+    def close(self):
+        self.db.close()
+        if self.owner and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def partition_gff(gff_file, chunk_size):
+    """
+    Split the GFF3 into (start, end) byte ranges at seqid changes, each at least chunk_size bytes
+
+    Gene hierarchies never cross a seqid, so each range can be decorated on its own.
+    Comments and directives stay in the range they are found in.
+    """
+    ranges = []
+    start = offset = 0
+    seqid = None
+    with open(gff_file, "rb") as fh:
+        for line in fh:
+            if line.strip() and not line.startswith(b"#"):
+                current = line.split(b"\t", 1)[0]
+                if current != seqid:
+                    if seqid is not None and offset - start >= chunk_size:
+                        ranges.append((start, offset))
+                        start = offset
+                    seqid = current
+            offset += len(line)
+    if offset > start:
+        ranges.append((start, offset))
+    return ranges
+
+
+# annotation object of a worker process, set once by the pool initializer
+worker_annotation = None
+
+
+def init_worker(annotation):
+    global worker_annotation
+    worker_annotation = annotation
+
+
+def decorate_range(gff_file, byte_range, browser_flags):
+    """
+    Decorate one byte range of the GFF3 in a worker process, returns the text of every output
+    """
+    start, end = byte_range
+    with open(gff_file, "rb") as fh:
+        fh.seek(start)
+        lines = io.StringIO(fh.read(end - start).decode("utf8"))
+    outputs = [(io.StringIO(), browser_specific) for browser_specific in browser_flags]
+    worker_annotation.decorate_lines(lines, outputs)
+    return [out.getvalue() for out, browser_specific in outputs]
+
+
 class AddDescriptionToAnnotation:
     def __init__(self, args):
         self.args = args
@@ -42,12 +170,20 @@ class AddDescriptionToAnnotation:
         self.annot_column = args.annot_column
         self.source = args.source
         self.browser_specific = args.browser_specific
+        # options for out of order GFF3 files
+        self.gene_index = getattr(args, "gene_index", False)
+        self.sort_gff = getattr(args, "sort_gff", False)
+        self.sort_buffer = getattr(args, "sort_buffer", SORT_BUFFER)
+        self.tmp_dir = getattr(args, "tmp_dir", None)
+        self.threads = getattr(args, "threads", 1)
+        self.bgzf_output = getattr(args, "bgzf_output", None)
 
         self.gene_info = defaultdict()
         self.annot_info = defaultdict()
+        self.missing_annot = set()
 
     def _encode(self, text):
-        return quote(text, safe="")
+        return encode_description(text)
 
     def process_annot_output(self):
         index = self.annot_column - 1
@@ -62,139 +198,284 @@ class AddDescriptionToAnnotation:
                 trans_id = x[0]
                 if trans_id not in self.annot_info:
                     # print(trans_id, x[index])
-                    self.annot_info[trans_id] = (
-                        self._encode(x[index]) if self.browser_specific else x[index]
-                    )
+                    # descriptions are encoded when written for the browser
+                    self.annot_info[trans_id] = x[index]
 
-    def process_gff(self):
-        with open(self.gff_file, "r") as fh:
-            for line in fh:
-                line = line.rstrip("\n")
-                if re.match(r"^\s*$", line):
-                    continue
-                if line.startswith("#"):
-                    print(line)
-                else:
-                    row = line.split("\t")
-                    if len(row) != 9:
-                        raise ValueError(
-                            f"Error: Not a standard GFF3 9 column line, see below:\n{line}"
-                        )
-                    # change source
-                    if self.source:
-                        row[SOURCE] = self.source
-                    if row[TYPE].strip().lower() in [
+    @staticmethod
+    def parse_attributes(row, keys):
+        """
+        Get the attributes in keys (lower case) from the GFF3 column 9
+
+        Attribute names are matched case insensitively, only the requested attributes
+        are kept and values may contain '='. A repeated attribute keeps its last value.
+        """
+        attrib = {}
+        for item in row[ATTRIBUTE].strip(" ;").split(";"):
+            key, sep, value = item.partition("=")
+            key = key.lower()
+            if key in keys:
+                attrib[key] = value
+        return attrib
+
+    def get_description(self, trans_id):
+        # returns the description and whether it comes from the annotation file
+        if trans_id in self.annot_info:
+            return self.annot_info[trans_id], True
+        if trans_id not in self.missing_annot:
+            logging.warning(
+                f"Looks like the transcript {trans_id} is not present in the input annotation file {self.annot_output}. Assigning as 'Unknown function'."
+            )
+            self.missing_annot.add(trans_id)
+        return "Unknown function", False
+
+    def format_gene(self, row, browser_specific):
+        if browser_specific:
+            row = row[:TYPE] + ["gene"] + row[TYPE + 1 :]
+        return "\t".join(row)
+
+    def format_transcript(
+        self, row, attrib, biotype, description, annotated, browser_specific
+    ):
+        if browser_specific and annotated:
+            description = self._encode(description)
+        new_name = "|".join(
+            [
+                f"{attrib['id']}",
+                f"{attrib['parent']}",
+                f"{biotype}",
+                f"conf:{attrib['confidence']}",
+                f"rep:{attrib['representative']}",
+            ]
+        )
+        new_attrib = ";".join(
+            [
+                f"ID={attrib['id']}",
+                f"Parent={attrib['parent']}",
+                f"Name={new_name}",
+                f"description={description}",
+            ]
+        )
+        if browser_specific:
+            return "\t".join(
+                row[:TYPE] + ["mRNA"] + row[TYPE + 1 : ATTRIBUTE] + [new_attrib]
+            )
+        return "\t".join(
+            row[:ATTRIBUTE]
+            + [row[ATTRIBUTE].rstrip(" ;") + f";description={description}"]
+        )
+
+    def format_other(self, row, browser_specific):
+        if browser_specific and row[TYPE] == "pseudogenic_exon":
+            row = row[:TYPE] + ["exon"] + row[TYPE + 1 :]
+        return "\t".join(row)
+
+    def index_genes(self, gff_file):
+        """
+        First pass over the GFF3, store the biotype of every gene in the on-disk gene index
+        """
+        self.gene_info = GeneIndex(self.tmp_dir)
+
+        def iter_genes():
+            with open(gff_file, "r") as fh:
+                for line in fh:
+                    if line.startswith("#"):
+                        continue
+                    row = line.rstrip("\n").split("\t")
+                    if len(row) != 9 or row[TYPE].strip().lower() not in [
                         "gene",
                         "ncrna_gene",
                         "pseudogene",
                     ]:
-                        gattrib = {
-                            k.lower(): v
-                            for k, v in (
-                                item.split("=")
-                                for item in row[8].strip(" ;").split(";")
-                            )
-                        }
-                        if any(
-                            map(
-                                lambda x: x is None,
-                                (
-                                    gattrib.get("ID".lower()),
-                                    gattrib.get("Name".lower()),
-                                    gattrib.get("biotype"),
-                                    gattrib.get("confidence"),
-                                ),
-                            )
-                        ):
-                            raise ValueError(
-                                "Error: Cannot parse all variables (ID, Name, biotype, confidence). It is required generating correct output. Please check entry:\n{}\n".format(
-                                    "\t".join(row)
-                                )
-                            )
-                        if gattrib["id"] not in self.gene_info:
-                            self.gene_info[gattrib["id"]] = gattrib["biotype"]
+                        continue
+                    gattrib = self.parse_attributes(row, ("id", "biotype"))
+                    if "id" in gattrib and "biotype" in gattrib:
+                        yield gattrib["id"], gattrib["biotype"]
 
-                        if self.browser_specific:
-                            row[TYPE] = "gene"
-                        print(*row, sep="\t")
+        self.gene_info.update(iter_genes())
 
-                    elif row[TYPE].strip().lower() in [
-                        "mrna",
-                        "ncrna",
-                        "pseudogenic_transcript",
-                    ]:
-                        attrib = {
-                            k.lower(): v
-                            for k, v in (
-                                item.split("=")
-                                for item in row[8].strip(" ;").split(";")
-                            )
-                        }
-                        if any(
-                            map(
-                                lambda x: x is None,
-                                (
-                                    attrib.get("ID".lower()),
-                                    attrib.get("Parent".lower()),
-                                    attrib.get("Name".lower()),
-                                    attrib.get("Note".lower()),
-                                    attrib.get("confidence"),
-                                    attrib.get("representative"),
-                                ),
-                            )
-                        ):
-                            raise ValueError(
-                                "Error: Cannot parse all variables (ID, Parent, Name, Note, confidence, representative). It is required generating correct output. Please check entry:\n{}\n".format(
-                                    "\t".join(row)
-                                )
+    def process_gff(self, outputs=None):
+        """
+        Decorate the GFF3 once for every (file handle, browser_specific) pair in outputs
+
+        Defaults to stdout with --browser_specific. With --sort_gff the GFF3 is first
+        sorted hierarchically into a temporary file, with --gene_index the gene biotypes
+        are looked up from an on-disk index built in a first pass, so the genes do not
+        need to come before their transcripts. With --threads the GFF3 is split at
+        seqid boundaries and the parts are decorated in worker processes.
+        """
+        if outputs is None:
+            outputs = [(sys.stdout, self.browser_specific)]
+        gff_file = self.gff_file
+        sorted_gff = None
+        try:
+            if self.sort_gff:
+                with tempfile.NamedTemporaryFile(
+                    mode="w",
+                    prefix="eifunannot_sorted_",
+                    suffix=".gff3",
+                    dir=self.tmp_dir,
+                    delete=False,
+                ) as out:
+                    sorted_gff = out.name
+                    logging.info(f"Sorting input file '{self.gff_file}'")
+                    sort_gff3(self.gff_file, out, self.sort_buffer, self.tmp_dir)
+                gff_file = sorted_gff
+            if self.gene_index:
+                logging.info(f"Indexing genes of input file '{self.gff_file}'")
+                self.index_genes(gff_file)
+            if self.threads > 1:
+                self.decorate_gff_parallel(gff_file, outputs)
+            else:
+                self.decorate_gff(gff_file, outputs)
+        finally:
+            if isinstance(self.gene_info, GeneIndex):
+                self.gene_info.close()
+                self.gene_info = defaultdict()
+            if sorted_gff is not None and os.path.exists(sorted_gff):
+                os.remove(sorted_gff)
+
+    def process_gff_bgzf(self, output, browser_specific):
+        """
+        Decorate the GFF3 to a coordinate sorted BGZF file with its tabix index in output.tbi
+        """
+        logging.info(f"Writing sorted BGZF output to '{output}' and '{output}.tbi'")
+        writer = SortedBgzfGff3Writer(output, self.sort_buffer, self.tmp_dir)
+        try:
+            self.process_gff([(writer, browser_specific)])
+        except BaseException:
+            writer.discard()
+            raise
+        writer.close()
+
+    def decorate_gff(self, gff_file, outputs):
+        with open(gff_file, "r") as fh:
+            self.decorate_lines(fh, outputs)
+
+    def decorate_gff_parallel(self, gff_file, outputs):
+        # a few parts per worker to balance uneven seqid sizes
+        chunk_size = os.path.getsize(gff_file) // (self.threads * 4) + 1
+        ranges = partition_gff(gff_file, chunk_size)
+        if len(ranges) < 2:
+            return self.decorate_gff(gff_file, outputs)
+        logging.info(
+            f"Decorating {len(ranges)} parts of input file '{self.gff_file}' with {self.threads} worker processes"
+        )
+        browser_flags = [browser_specific for out, browser_specific in outputs]
+        with ProcessPoolExecutor(
+            max_workers=min(self.threads, len(ranges)),
+            initializer=init_worker,
+            initargs=(self,),
+        ) as executor:
+            # map returns the parts in input order
+            for texts in executor.map(
+                decorate_range, repeat(gff_file), ranges, repeat(browser_flags)
+            ):
+                for (out, browser_specific), text in zip(outputs, texts):
+                    out.write(text)
+
+    def decorate_lines(self, lines, outputs):
+        for line in lines:
+            line = line.rstrip("\n")
+            if re.match(r"^\s*$", line):
+                continue
+            if line.startswith("#"):
+                for out, browser_specific in outputs:
+                    out.write(f"{line}\n")
+            else:
+                row = line.split("\t")
+                if len(row) != 9:
+                    raise ValueError(
+                        f"Error: Not a standard GFF3 9 column line, see below:\n{line}"
+                    )
+                # change source
+                if self.source:
+                    row[SOURCE] = self.source
+                if row[TYPE].strip().lower() in [
+                    "gene",
+                    "ncrna_gene",
+                    "pseudogene",
+                ]:
+                    gattrib = self.parse_attributes(row, GENE_KEYS)
+                    if any(
+                        map(
+                            lambda x: x is None,
+                            (
+                                gattrib.get("ID".lower()),
+                                gattrib.get("Name".lower()),
+                                gattrib.get("biotype"),
+                                gattrib.get("confidence"),
+                            ),
+                        )
+                    ):
+                        raise ValueError(
+                            "Error: Cannot parse all variables (ID, Name, biotype, confidence). It is required generating correct output. Please check entry:\n{}\n".format(
+                                "\t".join(row)
                             )
-                        if attrib["id"] not in self.annot_info:
-                            logging.warning(
-                                f"Looks like the transcript {attrib['id']} is not present in the input annotation file {self.annot_output}. Assigning as 'Unknown function'."
+                        )
+                    if gattrib["id"] not in self.gene_info:
+                        self.gene_info[gattrib["id"]] = gattrib["biotype"]
+
+                    for out, browser_specific in outputs:
+                        out.write(f"{self.format_gene(row, browser_specific)}\n")
+
+                elif row[TYPE].strip().lower() in [
+                    "mrna",
+                    "ncrna",
+                    "pseudogenic_transcript",
+                ]:
+                    attrib = self.parse_attributes(row, TRANSCRIPT_KEYS)
+                    if any(
+                        map(
+                            lambda x: x is None,
+                            (
+                                attrib.get("ID".lower()),
+                                attrib.get("Parent".lower()),
+                                attrib.get("Name".lower()),
+                                attrib.get("Note".lower()),
+                                attrib.get("confidence"),
+                                attrib.get("representative"),
+                            ),
+                        )
+                    ):
+                        raise ValueError(
+                            "Error: Cannot parse all variables (ID, Parent, Name, Note, confidence, representative). It is required generating correct output. Please check entry:\n{}\n".format(
+                                "\t".join(row)
                             )
-                            self.annot_info[attrib["id"]] = "Unknown function"
-                        description = self.annot_info[attrib["id"]]
-                        if attrib["parent"] not in self.gene_info:
+                        )
+                    description, annotated = self.get_description(attrib["id"])
+                    if attrib["parent"] not in self.gene_info:
+                        if self.gene_index:
                             raise ValueError(
-                                f"Error: Looks like the input file is not sorted. The Parent {attrib['parent']} is not encountered before."
+                                f"Error: The Parent {attrib['parent']} is not present in the input file."
                             )
-                        biotype = self.gene_info[attrib["parent"]]
-                        new_name = "|".join(
-                            [
-                                f"{attrib['id']}",
-                                f"{attrib['parent']}",
-                                f"{biotype}",
-                                f"conf:{attrib['confidence']}",
-                                f"rep:{attrib['representative']}",
-                            ]
-                        )
-                        new_attrib = ";".join(
-                            [
-                                f"ID={attrib['id']}",
-                                f"Parent={attrib['parent']}",
-                                f"Name={new_name}",
-                                f"description={description}",
-                            ]
+                        raise ValueError(
+                            f"Error: Looks like the input file is not sorted. The Parent {attrib['parent']} is not encountered before. Use --gene_index or --sort_gff for unsorted input."
                         )
-                        if self.browser_specific:
-                            row[TYPE] = "mRNA"
-                            print(*row[:8], new_attrib, sep="\t")
-                        else:
-                            row[-1] = (
-                                row[-1].rstrip(" ;") + f";description={description}"
+                    biotype = self.gene_info[attrib["parent"]]
+                    for out, browser_specific in outputs:
+                        out.write(
+                            self.format_transcript(
+                                row,
+                                attrib,
+                                biotype,
+                                description,
+                                annotated,
+                                browser_specific,
                             )
-                            print(*row, sep="\t")
-                    else:
-                        if self.browser_specific:
-                            if row[TYPE] == "pseudogenic_exon":
-                                row[TYPE] = "exon"
-                        print(*row, sep="\t")
+                            + "\n"
+                        )
+                else:
+                    for out, browser_specific in outputs:
+                        out.write(f"{self.format_other(row, browser_specific)}\n")
 
     def run(self):
         logging.info(f"Processing input file '{self.annot_output}'")
         self.process_annot_output()
         logging.info(f"Processing input file '{self.gff_file}'")
-        self.process_gff()
+        if self.bgzf_output:
+            self.process_gff_bgzf(self.bgzf_output, self.browser_specific)
+        else:
+            self.process_gff()
         logging.info("Analysis complete")
 
 
@@ -239,6 +520,36 @@ def main():
         action="store_true",
         help="Enable this to change all type to standard format to load to apollo (default: %(default)s)",
     )
+    parser.add_argument(
+        "--gene_index",
+        action="store_true",
+        help="Look up the gene biotypes from an on-disk index built in a first pass, for GFF3 files with transcripts before their genes (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sort_gff",
+        action="store_true",
+        help="Sort the GFF3 hierarchically with bounded memory before adding the descriptions (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sort_buffer",
+        type=int,
+        default=SORT_BUFFER,
+        help="Number of lines sorted in memory before spilling to a temporary file, with --sort_gff or --bgzf_output",
+    )
+    parser.add_argument(
+        "--tmp_dir",
+        help="Directory for the temporary index and sort files (default: system temporary directory)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of worker processes, the GFF3 is split at seqid boundaries and decorated in parallel. The genes must be in the same seqid block as their transcripts, unless --gene_index or --sort_gff is used",
+    )
+    parser.add_argument(
+        "--bgzf_output",
+        help="[optional] Write the output coordinate sorted and BGZF compressed to this file (e.g. release.gff3.gz) with its tabix index (.tbi), instead of to stdout",
+    )
     args = parser.parse_args()
     AddDescriptionToAnnotation(args).run()
 
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BGZF compression and tabix (.tbi) indexing of GFF3 output, using only zlib
+
+BGZF files are a series of gzip members of at most 64 KiB, readable with any gzip
+reader, and are addressed by virtual offsets (compressed offset of the block << 16 |
+offset in the uncompressed block). The index follows the tabix specification with
+the GFF preset (sequence column 1, start column 4, end column 5, '#' comments).
+
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+# import libraries
+import os
+import struct
+import tempfile
+import zlib
+from collections import defaultdict
+from eifunannot.scripts.external_sort import SORT_BUFFER, sort_lines
+
+# uncompressed bytes per block, leaves room for incompressible data within 64 KiB
+BLOCK_SIZE = 0xFF00
+BLOCK_HEADER = bytes.fromhex("1f8b08040000000000ff060042430200")
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+# tabix binning scheme
+MIN_SHIFT = 14
+DEPTH = 5
+META_BIN = 37450
+
+# GFF3 columns
+SEQID, START, END = 0, 3, 4
+
+
+class BgzfWriter:
+    """
+    Binary file writer compressing to BGZF blocks
+    """
+
+    def __init__(self, path, level=6):
+        self.fh = open(path, "wb")
+        self.level = level
+        self.buffer = bytearray()
+        self.block_offset = 0  # compressed offset of the current block
+
+    def tell(self):
+        """
+        Virtual offset of the next byte written
+        """
+        return (self.block_offset << 16) | len(self.buffer)
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            size = min(BLOCK_SIZE - len(self.buffer), len(view))
+            self.buffer += view[:size]
+            view = view[size:]
+            if len(self.buffer) >= BLOCK_SIZE:
+                self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        data = compressor.compress(bytes(self.buffer)) + compressor.flush()
+        # gzip header with the BC extra field holding the block size - 1
+        block = BLOCK_HEADER + struct.pack("<H", len(data) + 25)
+        block += data
+        block += struct.pack("<II", zlib.crc32(self.buffer), len(self.buffer))
+        self.fh.write(block)
+        self.block_offset += len(block)
+        self.buffer = bytearray()
+
+    def close(self):
+        self.flush()
+        self.fh.write(EOF_BLOCK)
+        self.fh.close()
+
+
+def reg2bin(beg, end):
+    """
+    Smallest bin containing the 0-based half open interval [beg, end)
+    """
+    end -= 1
+    shift = MIN_SHIFT
+    offset = ((1 << (DEPTH * 3)) - 1) // 7
+    for level in range(DEPTH, 0, -1):
+        if beg >> shift == end >> shift:
+            return offset + (beg >> shift)
+        shift += 3
+        offset = ((1 << ((level - 1) * 3)) - 1) // 7
+    return 0
+
+
+def compress_bins(bins):
+    """
+    Move chunks of bins spanning less than one BGZF block to the parent bin and merge
+    chunks starting in the block where the previous chunk ends, as htslib does
+    """
+    bins = {bin_number: list(chunks) for bin_number, chunks in bins.items()}
+    for level in range(DEPTH, 0, -1):
+        first = ((1 << (level * 3)) - 1) // 7
+        last = ((1 << ((level + 1) * 3)) - 1) // 7
+        for bin_number in [b for b in bins if first <= b < last]:
+            chunks = bins[bin_number]
+            if level < DEPTH:
+                chunks.sort()
+            parent = (bin_number - 1) >> 3
+            if (chunks[-1][1] >> 16) - (
+                chunks[0][0] >> 16
+            ) < 1 << 16 and parent in bins:
+                bins[parent].extend(chunks)
+                del bins[bin_number]
+    if 0 in bins:
+        bins[0].sort()
+    for bin_number, chunks in bins.items():
+        merged = [list(chunks[0])]
+        for chunk in chunks[1:]:
+            if merged[-1][1] >> 16 >= chunk[0] >> 16:
+                merged[-1][1] = max(merged[-1][1], chunk[1])
+            else:
+                merged.append(list(chunk))
+        bins[bin_number] = merged
+    return bins
+
+
+class TabixIndex:
+    """
+    Tabix index of a coordinate sorted BGZF file, records are added in file order
+    """
+
+    def __init__(self, col_seq=1, col_beg=4, col_end=5, meta="#", skip=0):
+        self.conf = (0, col_seq, col_beg, col_end, ord(meta), skip)
+        self.names = []
+        self.bins = []  # per reference: bin -> [[chunk start, chunk end], ...]
+        self.linear = []  # per reference: 16 KiB window -> lowest virtual offset
+        self.stats = []  # per reference: [first offset, last offset, records]
+        self.last_chunk = None
+
+    def finish(self, end_offset):
+        """
+        Set the end of the last record to end_offset, the same position after the last block is flushed
+        """
+        if self.last_chunk is not None:
+            self.last_chunk[1] = self.stats[-1][1] = end_offset
+
+    def add(self, seqid, beg, end, start_offset, end_offset):
+        """
+        Add a record covering the 0-based half open interval [beg, end)
+        """
+        if not self.names or self.names[-1] != seqid:
+            if seqid in self.names:
+                raise ValueError(
+                    f"Error: Records of '{seqid}' are not contiguous, cannot index the file"
+                )
+            self.names.append(seqid)
+            self.bins.append(defaultdict(list))
+            self.linear.append([])
+            self.stats.append([start_offset, end_offset, 0])
+        end = max(end, beg + 1)
+        chunks = self.bins[-1][reg2bin(beg, end)]
+        if not chunks or chunks[-1][1] != start_offset:
+            chunks.append([start_offset, end_offset])
+        chunks[-1][1] = end_offset
+        self.last_chunk = chunks[-1]
+        linear = self.linear[-1]
+        last_window = (end - 1) >> MIN_SHIFT
+        if len(linear) <= last_window:
+            linear.extend([None] * (last_window + 1 - len(linear)))
+        for window in range(beg >> MIN_SHIFT, last_window + 1):
+            if linear[window] is None:
+                linear[window] = start_offset
+        stats = self.stats[-1]
+        stats[1] = end_offset
+        stats[2] += 1
+
+    def write(self, path):
+        names = b"".join(name.encode("utf8") + b"\0" for name in self.names)
+        out = BgzfWriter(path)
+        out.write(b"TBI\1")
+        out.write(struct.pack("<8i", len(self.names), *self.conf, len(names)))
+        out.write(names)
+        for bins, linear, stats in zip(self.bins, self.linear, self.stats):
+            bins = compress_bins(bins)
+            out.write(struct.pack("<i", len(bins) + 1))
+            for bin_number in sorted(bins):
+                chunks = bins[bin_number]
+                out.write(struct.pack("<Ii", bin_number, len(chunks)))
+                for chunk in chunks:
+                    out.write(struct.pack("<QQ", *chunk))
+            # pseudo bin with the offsets and the number of records of the reference
+            out.write(
+                struct.pack("<IiQQQQ", META_BIN, 2, stats[0], stats[1], stats[2], 0)
+            )
+            # empty windows point at the previous record, leading ones at the first
+            previous = stats[0]
+            offsets = []
+            for offset in linear:
+                if offset is not None:
+                    previous = offset
+                offsets.append(previous)
+            out.write(struct.pack(f"<i{len(offsets)}Q", len(offsets), *offsets))
+        out.write(struct.pack("<Q", 0))
+        out.close()
+
+
+class SortedBgzfGff3Writer:
+    """
+    Text file-like sink writing GFF3 lines coordinate sorted to BGZF with a tabix index
+
+    Lines given to write() are spooled to a temporary file and sorted on close() with the
+    bounded memory external sort (seqids in order of first appearance, then start, ties
+    in input order). The output is written with its index in output.tbi. Comments are
+    written first and '###' separators are dropped.
+    """
+
+    def __init__(self, output, sort_buffer=SORT_BUFFER, tmp_dir=None):
+        self.output = output
+        self.sort_buffer = sort_buffer
+        self.comments = []
+        self.seqids = {}
+        self.partial = ""
+        self.spool = tempfile.NamedTemporaryFile(
+            mode="w+",
+            encoding="utf8",
+            prefix="eifunannot_bgzf_",
+            suffix=".txt",
+            dir=tmp_dir,
+            delete=False,
+        )
+        self.tmp_dir = tmp_dir
+
+    def write(self, text):
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        for line in lines:
+            if not line.strip() or line.startswith("###"):
+                continue
+            if line.startswith("#"):
+                self.comments.append(line)
+                continue
+            row = line.split("\t", 4)
+            seqid = self.seqids.setdefault(row[SEQID], len(self.seqids))
+            self.spool.write(f"{seqid:012d}{int(row[START]):012d}\t{line}\n")
+
+    def discard(self):
+        self.spool.close()
+        os.remove(self.spool.name)
+
+    def close(self):
+        if self.partial:
+            self.write("\n")
+        try:
+            self.spool.seek(0)
+            out = BgzfWriter(self.output)
+            index = TabixIndex()
+            for line in self.comments:
+                out.write(f"{line}\n".encode("utf8"))
+            lines = (line[:-1] for line in self.spool)
+            for line in sort_lines(
+                lines, lambda x: x[:24], self.sort_buffer, self.tmp_dir
+            ):
+                row = line.split("\t", 6)
+                start_offset = out.tell()
+                out.write(f"{line[25:]}\n".encode("utf8"))
+                index.add(
+                    row[SEQID + 1],
+                    int(row[START + 1]) - 1,
+                    int(row[END + 1]),
+                    start_offset,
+                    out.tell(),
+                )
+            # point at the start of the next block as htslib does
+            out.flush()
+            index.finish(out.tell())
+            out.close()
+            index.write(f"{self.output}.tbi")
+        finally:
+            self.spool.close()
+            os.remove(self.spool.name)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Binary columnar cache of parsed blast coverage
+
+The cache is written next to the blast tabular file as '<blast_tblr_output>.eifunannot_cache'
+and is only reused when the size, modification time and content digest of the source
+file still match. Layout of the cache file:
+
+    MAGIC | header length (uint32, little endian) | JSON header | column blobs
+
+String columns are stored as a newline separated string table and integer columns
+as int64 arrays. The columns are read back from a memory map.
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+# import libraries
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+from array import array
+
+MAGIC = b"EIFBLASTCACHE1\n"
+CACHE_SUFFIX = ".eifunannot_cache"
+# bytes read from the start and the end of the source file for the digest
+DIGEST_BLOCK = 1 << 20
+
+# columns of compute_blast_coverage() output, in the order they are stored
+STR_COLUMNS = ("qseqid", "qlen", "qper", "sseqid", "slen", "sper")
+INT_COLUMNS = ("qcov", "scov")
+
+
+def cache_path(blast_tblr_output):
+    return f"{blast_tblr_output}{CACHE_SUFFIX}"
+
+
+def fingerprint(blast_tblr_output):
+    """
+    Key the cache on size, mtime and a digest of the first and last block of the file
+    """
+    stat = os.stat(blast_tblr_output)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(stat.st_size).encode())
+    with open(blast_tblr_output, "rb") as fh:
+        digest.update(fh.read(DIGEST_BLOCK))
+        if stat.st_size > DIGEST_BLOCK:
+            fh.seek(max(DIGEST_BLOCK, stat.st_size - DIGEST_BLOCK))
+            digest.update(fh.read(DIGEST_BLOCK))
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "digest": digest.hexdigest(),
+    }
+
+
+def write_cache(blast_tblr_output, blast_info):
+    """
+    Write compute_blast_coverage() output to the cache, returns the cache path or None if it cannot be written
+    """
+    qseqids = list(blast_info)
+    blobs = []
+    columns = []
+    offset = 0
+    for name in STR_COLUMNS:
+        if name == "qseqid":
+            values = qseqids
+        else:
+            values = [str(blast_info[qseqid][name]) for qseqid in qseqids]
+        blob = "\n".join(values).encode("utf8")
+        columns.append([name, "str", offset, len(blob)])
+        blobs.append(blob)
+        offset += len(blob)
+    for name in INT_COLUMNS:
+        blob = array("q", (blast_info[qseqid][name] for qseqid in qseqids)).tobytes()
+        columns.append([name, "int", offset, len(blob)])
+        blobs.append(blob)
+        offset += len(blob)
+    header = dict(fingerprint(blast_tblr_output), rows=len(qseqids), columns=columns)
+    header = json.dumps(header).encode("utf8")
+
+    output = cache_path(blast_tblr_output)
+    tmp_output = f"{output}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_output, "wb") as fh:
+            fh.write(MAGIC)
+            fh.write(struct.pack("<I", len(header)))
+            fh.write(header)
+            for blob in blobs:
+                fh.write(blob)
+        os.replace(tmp_output, output)
+    except OSError as err:
+        logging.warning(
+            f"Cannot write blast cache '{output}', continuing without it: {err}"
+        )
+        if os.path.exists(tmp_output):
+            os.remove(tmp_output)
+        return None
+    return output
+
+
+def read_cache(blast_tblr_output):
+    """
+    Read the cache if it is valid for blast_tblr_output, returns None otherwise
+    """
+    input_cache = cache_path(blast_tblr_output)
+    if not os.path.exists(input_cache) or os.path.getsize(input_cache) <= len(MAGIC):
+        return None
+    with open(input_cache, "rb") as fh, mmap.mmap(
+        fh.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        if mm[: len(MAGIC)] != MAGIC:
+            logging.warning(f"Ignoring blast cache '{input_cache}' with unknown format")
+            return None
+        start = len(MAGIC) + 4
+        (header_length,) = struct.unpack("<I", mm[len(MAGIC) : start])
+        header = json.loads(mm[start : start + header_length].decode("utf8"))
+        if any(
+            header[key] != value
+            for key, value in fingerprint(blast_tblr_output).items()
+        ):
+            logging.info(f"Blast cache '{input_cache}' is stale, recomputing")
+            return None
+        data_start = start + header_length
+        values = {}
+        for name, kind, offset, length in header["columns"]:
+            blob = mm[data_start + offset : data_start + offset + length]
+            if kind == "str":
+                values[name] = blob.decode("utf8").split("\n") if header["rows"] else []
+            else:
+                values[name] = array("q", blob)
+    blast_info = {}
+    for row, qseqid in enumerate(values["qseqid"]):
+        blast_info[qseqid] = {
+            name: values[name][row] for name in STR_COLUMNS[1:] + INT_COLUMNS
+        }
+    return blast_info
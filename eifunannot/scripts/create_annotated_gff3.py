@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to create the functional annotation file and add the descriptions to the release GFF3 in one pass
+
+Combines create_functional_annotation and add_description_to_annotation_GFF3. The
+annotation is joined once and the release GFF3 is read once, writing the annotation
+tsv, the standard GFF3 and the browser specific GFF3 together.
+
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+
+# import libraries
+import argparse
+from argparse import RawTextHelpFormatter
+import logging
+import os
+import sys
+from eifunannot.scripts import create_functional_annotation
+from eifunannot.scripts.add_description_to_annotation_GFF3 import (
+    AddDescriptionToAnnotation,
+)
+from eifunannot.scripts.bgzf import SortedBgzfGff3Writer
+
+# get script name
+script = os.path.basename(sys.argv[0])
+
+
+def write_annotation(args, annot_output):
+    """
+    Write the functional annotation tsv and return the descriptions from --annot_column
+    """
+    index = args.annot_column - 1
+    annot_info = {}
+    with open(annot_output, "w") as out:
+        for num, output_line in enumerate(
+            create_functional_annotation.iter_annotation(args)
+        ):
+            # same text as print(*output_line, sep="\t")
+            fields = [str(value) for value in output_line]
+            out.write("\t".join(fields) + "\n")
+            if num == 0:
+                if len(fields) < args.annot_column:
+                    raise ValueError(
+                        f"--annot_column {args.annot_column} is larger than the {len(fields)} columns of the annotation output"
+                    )
+                continue
+            if fields[0] not in annot_info:
+                annot_info[fields[0]] = fields[index]
+    return annot_info
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Script to create functional annotation file and add the descriptions to the release GFF3 in one pass",
+        formatter_class=RawTextHelpFormatter,
+        epilog="Example command:\n"
+        + script
+        + " --ahrd_output ahrd_output.csv --metrics_output final_table.tsv --gff_file minos.annotation.gff3 --annot_column 9 --output_prefix release"
+        + "\n\nOutputs:"
+        + "\n[output_prefix].annotation.tsv - create_functional_annotation output"
+        + "\n[output_prefix].gff3 - add_description_to_annotation_GFF3 output"
+        + "\n[output_prefix].browser.gff3 - add_description_to_annotation_GFF3 --browser_specific output"
+        + "\n[output_prefix].browser.gff3.gz(.tbi) - instead of the above with --bgzip, coordinate sorted and tabix indexed"
+        + "\n\nContact:"
+        + __author__
+        + "("
+        + __email__
+        + ")",
+    )
+    create_functional_annotation.add_arguments(parser)
+    parser.add_argument(
+        "--gff_file",
+        required=True,
+        help="Provide minos.annotation.gff3 file",
+    )
+    parser.add_argument(
+        "--annot_column",
+        required=True,
+        type=int,
+        help="Provide annotation output column number to be used as description",
+    )
+    parser.add_argument(
+        "--source",
+        help="[optional] Provide a new source for the GFF3 files",
+    )
+    parser.add_argument(
+        "--gene_index",
+        action="store_true",
+        help="Look up the gene biotypes from an on-disk index built in a first pass, for GFF3 files with transcripts before their genes",
+    )
+    parser.add_argument(
+        "--sort_gff",
+        action="store_true",
+        help="Sort the GFF3 hierarchically with bounded memory before adding the descriptions",
+    )
+    parser.add_argument(
+        "--bgzip",
+        action="store_true",
+        help="Write the browser specific GFF3 coordinate sorted, BGZF compressed and tabix indexed",
+    )
+    parser.add_argument(
+        "--output_prefix",
+        required=True,
+        help="Prefix for the output files, see below",
+    )
+    args = parser.parse_args()
+
+    annot_output = f"{args.output_prefix}.annotation.tsv"
+    gff_output = f"{args.output_prefix}.gff3"
+    browser_gff_output = f"{args.output_prefix}.browser.gff3"
+    if args.bgzip:
+        browser_gff_output += ".gz"
+
+    logging.info(f"Writing functional annotation to '{annot_output}'")
+    annot_info = write_annotation(args, annot_output)
+
+    args.annot_output = annot_output
+    args.browser_specific = False
+    annotation = AddDescriptionToAnnotation(args)
+    annotation.annot_info.update(annot_info)
+    logging.info(
+        f"Processing input file '{args.gff_file}' to '{gff_output}' and '{browser_gff_output}'"
+    )
+    if args.bgzip:
+        browser_out = SortedBgzfGff3Writer(
+            browser_gff_output, args.sort_buffer, args.tmp_dir
+        )
+    else:
+        browser_out = open(browser_gff_output, "w")
+    try:
+        with open(gff_output, "w") as out:
+            annotation.process_gff([(out, False), (browser_out, True)])
+    except BaseException:
+        if args.bgzip:
+            browser_out.discard()
+        raise
+    browser_out.close()
+    logging.info("Analysis complete")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,7 +20,22 @@ import os
 import re
 import sys
 from collections import defaultdict, namedtuple
-from eifunannot.scripts.parse_blast import compute_blast_coverage
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from operator import attrgetter
+from eifunannot.scripts.parse_blast import (
+    iter_blast_coverage,
+    load_blast_coverage,
+    pop_blast_coverage,
+)
+from eifunannot.scripts.record_store import RecordStore
+from eifunannot.scripts.external_sort import (
+    SORT_BUFFER,
+    SortedLookup,
+    check_sorted,
+    sort_lines,
+    unique_by_key,
+)
 
 # get script name
 script = os.path.basename(sys.argv[0])
@@ -44,21 +59,50 @@ Ahrd = namedtuple("Ahrd", "id blast_hit ahrd_qc hrd iprid go_term")
 TRANS, GENE, CONFIDENCE, BIOTYPE = range(4)
 Metrics = namedtuple("Metrics", "trans gene confidence biotype")
 
+# for blast references, either tblr_output or details can be None
+BlastReference = namedtuple("BlastReference", "name tblr_output details")
+
+
+# record stores with the low cardinality columns dictionary encoded
+def ahrd_store():
+    return RecordStore(Ahrd, categorical=("ahrd_qc", "hrd"))
+
+
+def metrics_store():
+    return RecordStore(Metrics, categorical=("confidence", "biotype"))
+
+
+def blast_store():
+    return RecordStore(
+        Blast, categorical=("qlen", "qcov", "qper", "target", "tlen", "tcov", "tper")
+    )
+
+
+def blast_ref_store():
+    return RecordStore(BlastRef, categorical=("symbol", "desc"))
+
+
+def to_blast(qseqid, info):
+    return Blast(
+        qseqid,
+        info["qlen"],
+        info["qcov"],
+        info["qper"],
+        info["sseqid"],
+        info["slen"],
+        info["scov"],
+        info["sper"],
+    )
+
 
 # process blast
-def process_blast(blast_tblr_output, blast_info):
-    info = compute_blast_coverage(blast_tblr_output)
-    for tid in info:
-        blast_info[tid] = Blast(
-            tid,
-            info[tid]["qlen"],
-            info[tid]["qcov"],
-            info[tid]["qper"],
-            info[tid]["sseqid"],
-            info[tid]["slen"],
-            info[tid]["scov"],
-            info[tid]["sper"],
-        )
+def process_blast(blast_tblr_output, blast_info, use_cache=False):
+    if use_cache:
+        info = load_blast_coverage(blast_tblr_output, use_cache).items()
+    else:
+        info = pop_blast_coverage(blast_tblr_output)
+    for tid, values in info:
+        blast_info[tid] = to_blast(tid, values)
     return blast_info
 
 # process reference blast
@@ -84,7 +128,7 @@ def process_ref_blast_line(line):
 
 
 # process ahrd
-def process_ahrd(ahrd_parsed_output, ahrd_info):
+def iter_ahrd_lines(ahrd_parsed_output):
     for line in open(ahrd_parsed_output, encoding="utf8"):
         if (
             line
@@ -92,11 +136,15 @@ def process_ahrd(ahrd_parsed_output, ahrd_info):
             and not line.startswith("#")
             and not line.startswith("Protein-Accession")
         ):  # ignore ahrd headers
-            line = line.rstrip(
+            yield line.rstrip(
                 "\n"
             )  # only strip with "\n" otherwise any empty tabs will be removed causing downstream issues
-            ahrd_results = process_ahrd_line(line)
-            ahrd_info[ahrd_results.id] = ahrd_results  # store to dict with the id
+
+
+def process_ahrd(ahrd_parsed_output, ahrd_info):
+    for line in iter_ahrd_lines(ahrd_parsed_output):
+        ahrd_results = process_ahrd_line(line)
+        ahrd_info[ahrd_results.id] = ahrd_results  # store to dict with the id
     return ahrd_info
 
 
@@ -124,7 +172,7 @@ def process_ahrd_line(line):
 
 
 # process metrics
-def process_metrics(metrics_parsed_output, metrics_output_cols, metrics_info):
+def iter_metrics_lines(metrics_parsed_output):
     for line in open(metrics_parsed_output, encoding="utf8"):
         if (
             line
@@ -133,13 +181,17 @@ def process_metrics(metrics_parsed_output, metrics_output_cols, metrics_info):
             and not line.startswith("#trans")
             and not line.startswith("TID")
         ):  # ignore metrics headers
-            line = line.rstrip(
+            yield line.rstrip(
                 "\n"
             )  # only strip with "\n" otherwise any empty tabs will be removed causing downstream issues
-            metrics_results = process_metrics_line(metrics_output_cols, line)
-            metrics_info[
-                metrics_results.trans
-            ] = metrics_results  # store to dict with the id
+
+
+def process_metrics(metrics_parsed_output, metrics_output_cols, metrics_info):
+    for line in iter_metrics_lines(metrics_parsed_output):
+        metrics_results = process_metrics_line(metrics_output_cols, line)
+        metrics_info[
+            metrics_results.trans
+        ] = metrics_results  # store to dict with the id
     return metrics_info
 
 
@@ -155,19 +207,218 @@ def process_metrics_line(metrics_output_cols, line):
     return metrics_results
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Script to create functional annotation file",
-        formatter_class=RawTextHelpFormatter,
-        epilog="Example command:\n"
-        + script
-        + " --ahrd_output ahrd_output.csv --blast_tblr_output blastp.tblr.overall_cov.txt"
-        + "\n\nContact:"
-        + __author__
-        + "("
-        + __email__
-        + ")",
+def build_header(blast_references):
+    header = ["#Transcipt", "#Gene", "#Confidence", "#Biotype"]
+
+    for blast_reference in blast_references:
+        blast_ref_name = blast_reference.name
+        if blast_reference.tblr_output:
+            header.extend(
+                [
+                    f"#{blast_ref_name}-Blast-Hit",
+                    f"#Transcript-Blast-Hit-Coverage-By-{blast_ref_name}",
+                    f"#{blast_ref_name}-Blast-Hit-Coverage-By-Transcipt",
+                ]
+            )
+        if blast_reference.details:
+            header.extend(
+                [
+                    f"#{blast_ref_name}-Blast-Hit-Symbol",
+                    f"#{blast_ref_name}-Blast-Hit-Description",
+                ]
+            )
+    header.extend(
+        [
+            "#AHRD-Blast-Hit-Accession",
+            "#AHRD-Quality-Code",
+            "#Human-Readable-Description",
+            "#Interpro-ID (Description)",
+            "#Gene-Ontology-Term",
+        ]
     )
+    return header
+
+
+def build_output_line(
+    trans_id,
+    metrics_info,
+    ahrd_info,
+    blast_references,
+    blast_results,
+):
+    # *_info can be a dict, a RecordStore or a SortedLookup, so only use get() and []
+    # blast_results has a (blast_info, blast_ref_info) pair for each of the blast_references
+    metrics = metrics_info[trans_id]
+    ahrd = ahrd_info.get(trans_id)
+    if ahrd is None:
+        # raise ValueError("Transcript not found in AHRD output file - '{0}'".format(trans_id))
+        print(
+            f"Warning: {trans_id} is not in AHRD, defining all as empty. Most likely these are not having protein sequences (like ncRNA's)",
+            file=sys.stderr,
+        )
+        ahrd = Ahrd(trans_id, None, None, None, None, None)
+
+    output_line = [trans_id, metrics.gene, metrics.confidence, metrics.biotype]
+    for blast_reference, (blast_info, blast_ref_info) in zip(
+        blast_references, blast_results
+    ):
+        blast = Blast(None, None, None, None, None, None, None, None)
+        if blast_reference.tblr_output:
+            # print (trans_id, "not found in blast, defining all as empty")
+            blast = blast_info.get(trans_id) or Blast(
+                trans_id, None, None, None, None, None, None, None
+            )
+            output_line.extend(
+                [
+                    blast.target,
+                    blast.qper,
+                    blast.tper,
+                ]
+            )
+        if blast_reference.details:
+            # print(blast.target, "not found in blast, defining all as empty")
+            blast_ref = blast_ref_info.get(blast.target) or BlastRef(
+                blast.target, None, None
+            )
+            output_line.extend(
+                [
+                    blast_ref.symbol,
+                    blast_ref.desc,
+                ]
+            )
+    output_line.extend(
+        [ahrd.blast_hit, ahrd.ahrd_qc, ahrd.hrd, ahrd.iprid, ahrd.go_term]
+    )
+    return output_line
+
+
+def load_blast_reference(blast_reference, use_cache=False):
+    # load the blast coverage and reference details of one reference, runs in a worker process with --threads
+    blast_info = {}
+    blast_ref_info = {}
+    if blast_reference.tblr_output:
+        blast_info = process_blast(
+            blast_reference.tblr_output, blast_store(), use_cache
+        )
+    if blast_reference.details:
+        blast_ref_info = process_ref_blast(blast_reference.details, blast_ref_store())
+    return blast_info, blast_ref_info
+
+
+def stream_annotation(
+    ahrd_output,
+    metrics_output,
+    metrics_output_cols,
+    blast_references,
+    use_metrics_output_id,
+    presorted=False,
+    sort_buffer=SORT_BUFFER,
+    tmp_dir=None,
+):
+    """
+    Sort-merge join of the inputs on transcript id, yields output lines in the same order as main()
+
+    Only the blast reference details (keyed on the blast target) are held in memory.
+    """
+
+    def sorted_lines(lines, key, name):
+        if presorted:
+            return check_sorted(lines, key, name)
+        return sort_lines(lines, key, sort_buffer, tmp_dir)
+
+    metrics_key = metrics_output_cols[0]
+    ahrd_records = unique_by_key(
+        map(
+            process_ahrd_line,
+            sorted_lines(
+                iter_ahrd_lines(ahrd_output),
+                lambda line: line.split("\t", 1)[0],
+                ahrd_output,
+            ),
+        ),
+        attrgetter("id"),
+    )
+    metrics_records = unique_by_key(
+        (
+            process_metrics_line(metrics_output_cols, line)
+            for line in sorted_lines(
+                iter_metrics_lines(metrics_output),
+                lambda line: line.split("\t")[metrics_key],
+                metrics_output,
+            )
+        ),
+        attrgetter("trans"),
+    )
+    if use_metrics_output_id:
+        primary = metrics_records
+        metrics_info = None
+        ahrd_info = SortedLookup(ahrd_records)
+    else:
+        primary = ahrd_records
+        metrics_info = SortedLookup(metrics_records)
+        ahrd_info = None
+
+    blast_results = []
+    for blast_reference in blast_references:
+        blast_info = {}
+        if blast_reference.tblr_output:
+            blast_lines = sorted_lines(
+                (
+                    line.rstrip("\n")
+                    for line in open(blast_reference.tblr_output, encoding="utf8")
+                    if not line.startswith("#") and not re.match(r"^\s*$", line)
+                ),
+                lambda line: line.split("\t", 1)[0],
+                blast_reference.tblr_output,
+            )
+            blast_info = SortedLookup(
+                (qseqid, to_blast(qseqid, info))
+                for qseqid, info in iter_blast_coverage(blast_lines)
+            )
+        blast_ref_info = {}
+        if blast_reference.details:
+            blast_ref_info = process_ref_blast(
+                blast_reference.details, blast_ref_store()
+            )
+        blast_results.append((blast_info, blast_ref_info))
+
+    for trans_id, record in primary:
+        yield build_output_line(
+            trans_id,
+            {trans_id: record} if use_metrics_output_id else metrics_info,
+            {trans_id: record} if not use_metrics_output_id else ahrd_info,
+            blast_references,
+            blast_results,
+        )
+
+
+def get_blast_references(args):
+    # the single reference options come first, followed by the repeated --blast_reference
+    blast_references = []
+    if args.blast_tblr_output or args.blast_reference_details:
+        blast_references.append(
+            BlastReference(
+                args.blast_ref_name,
+                args.blast_tblr_output,
+                args.blast_reference_details,
+            )
+        )
+    for values in args.blast_reference or []:
+        if len(values) not in (2, 3):
+            raise ValueError(
+                f"--blast_reference expects 'REF_NAME BLAST_TBLR_OUTPUT [BLAST_REFERENCE_DETAILS]', but provided '{' '.join(values)}'"
+            )
+        blast_references.append(BlastReference(*values, *[None] * (3 - len(values))))
+    names = [blast_reference.name for blast_reference in blast_references]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(
+            f"Blast reference names should be unique, but '{', '.join(duplicates)}' provided more than once"
+        )
+    return blast_references
+
+
+def add_arguments(parser):
     parser.add_argument(
         "--ahrd_output",
         required=True,
@@ -187,6 +438,11 @@ def main():
         "--blast_tblr_output",
         help="Provide parsed blast tabular file. blastp output generated in the format '-max_target_seqs 1 -evalue 1e-5 -outfmt \"6 qseqid sseqid pident qstart qend sstart send qlen slen length nident mismatch positive gapopen gaps evalue bitscore\"' is recommended",
     )
+    parser.add_argument(
+        "--blast_cache",
+        action="store_true",
+        help="Reuse or create a binary cache of the parsed blast coverage next to the '--blast_tblr_output' file (default: %(default)s)",
+    )
     parser.add_argument(
         "--blast_ref_name",
         default="Reference",
@@ -196,20 +452,56 @@ def main():
         "--blast_reference_details",
         help="Provide a TSV file with additional functional information. Expect a three column TSV file - 'blast_ref_id symbol description' format (default: %(default)s)",
     )
+    parser.add_argument(
+        "--blast_reference",
+        action="append",
+        nargs="+",
+        metavar=("REF_NAME", "BLAST_TBLR_OUTPUT"),
+        help="Provide an additional blast reference as 'REF_NAME BLAST_TBLR_OUTPUT [BLAST_REFERENCE_DETAILS]'. Repeat the option for each reference, the columns are added in the order given after the '--blast_tblr_output' reference, if any (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse the blast references in parallel (default: %(default)s)",
+    )
     parser.add_argument(
         "--use_metrics_output_id",
         action="store_true",
         help="Enable this to use transcripts from metrics output file as reference, so that transposable_element_gene and ncrna_gene becomes part of the output. Default is to use transcripts from ahrd output as reference. (default: %(default)s)",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Enable this to join the inputs with a bounded memory sort-merge on transcript id instead of loading them into memory. Output is identical. Only '--blast_reference_details' is held in memory (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--presorted",
+        action="store_true",
+        help="With '--streaming', the ahrd, metrics and blast inputs are already sorted on the transcript id with 'LC_ALL=C sort -t $'\\t' -k1,1' (metrics on its TID column), skip the external sort (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sort_buffer",
+        type=int,
+        default=SORT_BUFFER,
+        help="With '--streaming', number of lines sorted in memory before spilling to a temporary file (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--tmp_dir",
+        help="With '--streaming', directory for the temporary sort files (default: system temporary directory)",
+    )
+
 
+def iter_annotation(args):
+    """
+    Yields the header followed by the output lines of the functional annotation table
+    """
     ahrd_output = args.ahrd_output
     metrics_output = args.metrics_output
     metrics_output_cols = args.metrics_output_cols.split(",")
-    blast_tblr_output = args.blast_tblr_output
-    blast_ref_name = args.blast_ref_name
-    blast_reference_details = args.blast_reference_details
+    blast_cache = args.blast_cache
     use_metrics_output_id = args.use_metrics_output_id
+    blast_references = get_blast_references(args)
 
     if len(metrics_output_cols) != 4:
         raise ValueError(
@@ -219,114 +511,78 @@ def main():
         )
     metrics_output_cols = [int(i) - 1 for i in metrics_output_cols]
 
-    blast_info = {}  # create blast dictionary
-    blast_ref_info = {}  # create blast reference dictionary
-    if blast_tblr_output:
-        # process blast
-        blast_info = process_blast(blast_tblr_output, blast_info)
-    if blast_reference_details:
-        # process blast reference details
-        blast_ref_info = process_ref_blast(blast_reference_details, blast_ref_info)
+    if args.streaming:
+        if blast_cache:
+            print(
+                "Warning: '--blast_cache' is not used with '--streaming'",
+                file=sys.stderr,
+            )
+        yield build_header(blast_references)
+        yield from stream_annotation(
+            ahrd_output,
+            metrics_output,
+            metrics_output_cols,
+            blast_references,
+            use_metrics_output_id,
+            args.presorted,
+            args.sort_buffer,
+            args.tmp_dir,
+        )
+        return
+
+    # process blast references, in parallel worker processes with --threads
+    executor = None
+    if args.threads > 1 and len(blast_references) > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=min(args.threads, len(blast_references))
+        )
+    blast_results = (executor.map if executor else map)(
+        load_blast_reference, blast_references, repeat(blast_cache)
+    )
 
     # process ahrd
-    ahrd_info = {}  # create ahrd dictionary
+    ahrd_info = ahrd_store()  # create ahrd store
     ahrd_info = process_ahrd(ahrd_output, ahrd_info)
 
-    # process ahrd
-    metrics_info = {}  # create metrics dictionary
+    # process metrics
+    metrics_info = metrics_store()  # create metrics store
     metrics_info = process_metrics(metrics_output, metrics_output_cols, metrics_info)
 
-    # pull together all the information
-    header = ["#Transcipt", "#Gene", "#Confidence", "#Biotype"]
+    blast_results = list(blast_results)
+    if executor:
+        executor.shutdown()
 
-    if blast_tblr_output:
-        header.extend(
-            [
-                f"#{blast_ref_name}-Blast-Hit",
-                f"#Transcript-Blast-Hit-Coverage-By-{blast_ref_name}",
-                f"#{blast_ref_name}-Blast-Hit-Coverage-By-Transcipt",
-            ]
-        )
-    if blast_reference_details:
-        header.extend(
-            [
-                f"#{blast_ref_name}-Blast-Hit-Symbol",
-                f"#{blast_ref_name}-Blast-Hit-Description",
-            ]
-        )
-    header.extend(
-        [
-            "#AHRD-Blast-Hit-Accession",
-            "#AHRD-Quality-Code",
-            "#Human-Readable-Description",
-            "#Interpro-ID (Description)",
-            "#Gene-Ontology-Term",
-        ]
-    )
-    print(*header, sep="\t")
+    # pull together all the information
+    yield build_header(blast_references)
 
     for trans_id in (
         sorted(metrics_info) if use_metrics_output_id else sorted(ahrd_info)
     ):
-        # ahrd = ahrd_info[trans_id]
-        # print (ahrd)
-        metrics = metrics_info[trans_id]
-        ahrd = {}
-        blast = Blast(None, None, None, None, None, None, None, None)
-        blast_ref = BlastRef(None, None, None)
-        if trans_id not in ahrd_info:
-            # raise ValueError("Transcript not found in AHRD output file - '{0}'".format(trans_id))
-            # sys.stderr(trans_id, "not found in Ahrd, defining all as empty")
-            print(
-                f"Warning: {trans_id} is not in AHRD, defining all as empty. Most likely these are not having protein sequences (like ncRNA's)",
-                file=sys.stderr,
-            )
-            ahrd_results = Ahrd(trans_id, None, None, None, None, None)
-            ahrd_info[ahrd_results.id] = ahrd_results
-            ahrd = ahrd_info[trans_id]
-        else:
-            ahrd = ahrd_info[trans_id]
-
-        if blast_tblr_output:
-            if trans_id not in blast_info:
-                # print (trans_id, "not found in blast, defining all as empty")
-                blast_results = Blast(
-                    trans_id, None, None, None, None, None, None, None
-                )
-                blast_info[blast_results.query] = blast_results
-                blast = blast_info[trans_id]
-            else:
-                blast = blast_info[trans_id]
-
-        if blast_reference_details:
-            if blast.target not in blast_ref_info:
-                # print(blast.target, "not found in blast, defining all as empty")
-                blast_ref_results = BlastRef(blast.target, None, None)
-                blast_ref_info[blast_ref_results.query] = blast_ref_results
-                blast_ref = blast_ref_info[blast.target]
-            else:
-                blast_ref = blast_ref_info[blast.target]
-
-        # now print
-        output_line = [trans_id, metrics.gene, metrics.confidence, metrics.biotype]
-        if blast_tblr_output:
-            output_line.extend(
-                [
-                    blast.target,
-                    blast.qper,
-                    blast.tper,
-                ]
-            )
-        if blast_reference_details:
-            output_line.extend(
-                [
-                    blast_ref.symbol,
-                    blast_ref.desc,
-                ]
-            )
-        output_line.extend(
-            [ahrd.blast_hit, ahrd.ahrd_qc, ahrd.hrd, ahrd.iprid, ahrd.go_term]
+        yield build_output_line(
+            trans_id,
+            metrics_info,
+            ahrd_info,
+            blast_references,
+            blast_results,
         )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Script to create functional annotation file",
+        formatter_class=RawTextHelpFormatter,
+        epilog="Example command:\n"
+        + script
+        + " --ahrd_output ahrd_output.csv --blast_tblr_output blastp.tblr.overall_cov.txt"
+        + "\n\nContact:"
+        + __author__
+        + "("
+        + __email__
+        + ")",
+    )
+    add_arguments(parser)
+    args = parser.parse_args()
+    for output_line in iter_annotation(args):
         print(*output_line, sep="\t")
 
 
@@ -32,26 +32,322 @@ except AssertionError:
     sys.exit("Error: Python3 required, please 'source python_miniconda-4.8.3_py3.8_gk'")
 import argparse
 from argparse import RawTextHelpFormatter
+import codecs
+import glob
+import json
+import multiprocessing
 import os
 import re
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 
-import requests
-from requests.adapters import HTTPAdapter, Retry
 from datetime import datetime
 import logging
-from collections import defaultdict
 from pathlib import Path
 from ftplib import FTP
+from eifunannot.scripts.download_metrics import DownloadMetrics, MetricsWriter
+from eifunannot.scripts.isoform_store import IsoformStore
+from eifunannot.scripts.record_ranges import RANGE_SIZE, read_range, record_ranges
+from eifunannot.scripts.uniprot_mirror import UniprotMirror
 
 # get script name
 script = os.path.basename(sys.argv[0])
 
 choices = ["fasta", "xlsx", "xml", "dat", "txt", "gff", "list"]
+endpoints = ["auto", "stream", "search"]
+
+UNIPROT_URL = "https://rest.uniprot.org/uniprotkb"
+# bytes of a response body written to disk at a time
+CHUNK_SIZE = 1 << 20
+# sidecar file of a paged download, to resume it after a failure
+CHECKPOINT_SUFFIX = ".checkpoint"
+# with '--endpoint auto', larger downloads page through the search endpoint, which
+# can be resumed, instead of the single stream response, which cannot
+RESUMABLE_ENTRIES = 100000
+# start of the line of every entry, used to count the downloaded entries
+entry_markers = {"fasta": b">", "dat": b"//", "txt": b"//", "list": b""}
+# markers of the entries in the progress metrics, those of xml and gff are not checked
+progress_markers = dict(entry_markers, xml=b"<entry", gff=b"##sequence-region")
 
 re_next_link = re.compile(r'<(.+)>; rel="next"')
-retries = Retry(total=5, backoff_factor=0.25, status_forcelist=[500, 502, 503, 504])
-session = requests.Session()
-session.mount("https://", HTTPAdapter(max_retries=retries))
+# .dat line patterns, only tried on lines with the matching two letter code
+re_id = re.compile(r"ID\s+(\w+)\s+(\w+);")
+re_ac = re.compile(r"AC\s+(\w+);")
+re_de = re.compile(r"DE\s+(.+);")
+re_os = re.compile(r"OS\s+([^\(]+)")
+re_ox = re.compile(r"OX\s+\w+=(\d+);")
+re_gn = re.compile(r"GN\s+\w+=([^;]+)")
+re_pe = re.compile(r"PE\s+(\d+):")
+re_sv = re.compile(r"DT\s+.*sequence version\s+(\d+).")
+re_non_ter = re.compile(r"FT\s+NON_TER\s+")
+re_non_cons = re.compile(r"FT\s+NON_CONS\s+(\d+)\s+")
+re_seq = re.compile(r"\s+([\w\s]+)")
+# unwrapped isoform sequences and their accession index, built from the download
+ISOFORM_STORE = "uniprot_sprot_varsplic.isoforms"
+# characters of filtered output collected before each write
+WRITE_BLOCK = 1 << 20
+thread_local = threading.local()
+
+
+def get_session():
+    # requests sessions are not thread safe, each download thread gets its own
+    session = getattr(thread_local, "session", None)
+    if session is None:
+        # requests is only imported by the downloads, keeping --help fast
+        import requests
+        from requests.adapters import HTTPAdapter, Retry
+
+        retries = Retry(
+            total=5, backoff_factor=0.25, status_forcelist=[500, 502, 503, 504]
+        )
+        session = thread_local.session = requests.Session()
+        session.mount("https://", HTTPAdapter(max_retries=retries))
+        session.mount("http://", HTTPAdapter(max_retries=retries))
+    return session
+
+
+class EntryCounter:
+    # count entries in a stream of chunks by the text at the start of their line
+    def __init__(self, marker):
+        self.marker = b"\n" + marker
+        self.tail = b"" if marker == b"" else b"\n"
+        self.count = 0
+
+    def update(self, chunk):
+        data = self.tail + chunk
+        self.count += data.count(self.marker)
+        # a marker split over two chunks is counted with the next one
+        self.tail = data[len(data) - len(self.marker) + 1 :]
+
+
+def write_checkpoint(output, checkpoint):
+    # replace the checkpoint in one step, so a failure never leaves half of it
+    tmp_checkpoint = f"{output}{CHECKPOINT_SUFFIX}.tmp"
+    with open(tmp_checkpoint, "w") as fh:
+        json.dump(checkpoint, fh)
+    os.replace(tmp_checkpoint, f"{output}{CHECKPOINT_SUFFIX}")
+
+
+def find_checkpoint(prefix, url, filtered=False):
+    # an unfinished download of the same query, it keeps the output name of the first
+    # run. The checkpoints of '--filter_stream' point to the partial filtered fasta
+    # (and .dat.gz) instead of the .dat file, they are only resumed in the same mode
+    for checkpoint_file in sorted(glob.glob(f"{prefix}_*{CHECKPOINT_SUFFIX}")):
+        with open(checkpoint_file, "r") as fh:
+            checkpoint = json.load(fh)
+        output = checkpoint_file[: -len(CHECKPOINT_SUFFIX)]
+        partials = [checkpoint.get("filtered", output), checkpoint.get("raw")]
+        if (
+            checkpoint["url"] == url
+            and ("filtered" in checkpoint) == filtered
+            and all(os.path.exists(partial) for partial in partials if partial)
+        ):
+            return output, checkpoint
+    return None, None
+
+
+def filter_dat(lines, isoforms):
+    """
+    Yield the FASTA entry, followed by its isoforms, of every complete sequence in
+    the lines of a UniProt .dat file
+    """
+    in_entry = False
+    acc_id = ""
+    for line in lines:
+        code = line[:2]
+        if not in_entry:
+            if code == "ID":
+                id_match_region = re_id.match(line.rstrip())
+                if id_match_region:
+                    id_id, reviewed_status = id_match_region.groups()
+                    in_entry = True
+                    description = ""
+                    organism_name = ""
+                    organism_taxid = ""
+                    gene_name = ""
+                    protein_existence = ""
+                    sequence_version = ""
+                    seq = []
+                    print_seq = True
+        elif line[:1].isspace():
+            # sequence line, split into blocks of ten residues
+            residues = "".join(line.split())
+            if not residues.isalnum():
+                seq_match_region = re_seq.match(line.rstrip())
+                residues = (
+                    "".join(seq_match_region.group(1).split())
+                    if seq_match_region
+                    else ""
+                )
+            seq.append(residues)
+        elif code == "FT":
+            if "NON_" in line:
+                line = line.rstrip()
+                if re_non_ter.match(line) or re_non_cons.match(line):
+                    print_seq = False
+        elif code == "//":
+            sequence = "".join(seq)
+            in_entry = False
+            if not print_seq or sequence[:1].lower() != "m":
+                continue
+            header = "sp|" if reviewed_status == "Reviewed" else "tr|"
+            header += f"{acc_id}|{id_id} {description} "
+            header += f"OS={organism_name} "
+            header += f"OX={organism_taxid} "
+            header += f"GN={gene_name} "
+            header += f"PE={protein_existence} "
+            header += f"SV={sequence_version}"
+            line_width = 60
+            wrapped = "\n".join(
+                [
+                    sequence[i : i + line_width]
+                    for i in range(0, len(sequence), line_width)
+                ]
+            )
+            entry = f">{header}\n{wrapped}\n"
+            # add the splice variants
+            if acc_id in isoforms:
+                entry += f"{isoforms[acc_id]}\n"
+            yield entry
+        elif code == "AC":
+            ac_match_region = re_ac.match(line.rstrip())
+            if ac_match_region:
+                acc_id = ac_match_region.group(1)
+        elif code == "DE":
+            line = line.rstrip()
+            de_match_region = re_de.match(line)
+            if de_match_region:
+                if description == "":
+                    description = (
+                        de_match_region.group(1)
+                        .replace("RecName: Full=", "")
+                        .replace("SubName: Full=", "")
+                        .split("{")[0]
+                        .strip()
+                    )
+                if "Flags: Fragment" in line:
+                    print_seq = False
+        elif code == "OS":
+            if organism_name == "":
+                os_match_region = re_os.match(line.rstrip())
+                if os_match_region:
+                    organism_name = os_match_region.group(1).strip().rstrip(".")
+        elif code == "OX":
+            ox_match_region = re_ox.match(line.rstrip())
+            if ox_match_region:
+                organism_taxid = ox_match_region.group(1)
+        elif code == "GN":
+            if gene_name == "":
+                gn_match_region = re_gn.match(line.rstrip())
+                if gn_match_region:
+                    gene_name = gn_match_region.group(1).split("{")[0].strip()
+        elif code == "PE":
+            pe_match_region = re_pe.match(line.rstrip())
+            if pe_match_region:
+                protein_existence = pe_match_region.group(1)
+        elif code == "DT":
+            sv_match_region = re_sv.match(line.rstrip())
+            if sv_match_region:
+                sequence_version = sv_match_region.group(1)
+
+
+# isoform sequences of a worker process, set once by the pool initializer
+worker_isoforms = None
+
+
+def init_filter_worker(isoforms):
+    global worker_isoforms
+    worker_isoforms = isoforms
+
+
+def filter_pool(threads, isoforms):
+    """
+    Pool of worker processes filtering .dat byte ranges
+
+    The downloads run in threads, which may hold the locks of requests, ssl or
+    logging when a worker is started. Forking them could deadlock the worker, so
+    the workers are started by a fork server (or spawned where there is none) and
+    get the isoform store through the pool initializer.
+    """
+    method = (
+        "forkserver"
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else "spawn"
+    )
+    return ProcessPoolExecutor(
+        max_workers=threads,
+        mp_context=multiprocessing.get_context(method),
+        initializer=init_filter_worker,
+        initargs=(isoforms,),
+    )
+
+
+def filter_range(input_file, byte_range):
+    """
+    Filter one byte range of whole .dat entries in a worker process
+    """
+    return "".join(filter_dat(read_range(input_file, byte_range), worker_isoforms))
+
+
+def write_blocks(output_file, texts):
+    # collect the texts and write them in blocks of about WRITE_BLOCK characters
+    block = []
+    block_size = 0
+    for text in texts:
+        block.append(text)
+        block_size += len(text)
+        if block_size >= WRITE_BLOCK:
+            output_file.write("".join(block))
+            block = []
+            block_size = 0
+    output_file.write("".join(block))
+
+
+def iter_lines(chunks):
+    # lines of a stream of utf8 encoded chunks, lines may be split over chunks
+    decoder = codecs.getincrementaldecoder("utf8")()
+    partial = ""
+    for chunk in chunks:
+        lines = (partial + decoder.decode(chunk)).split("\n")
+        partial = lines.pop()
+        for line in lines:
+            yield f"{line}\n"
+    partial += decoder.decode(b"", final=True)
+    if partial:
+        yield partial
+
+
+def iter_body(response, raw_fh=None):
+    """
+    Decompressed chunks of a streamed response body, copied gzip compressed to raw_fh
+
+    The bytes of a gzip encoded response are copied as received, without compressing
+    them again. Other responses are compressed into a gzip member of their own.
+    """
+    if raw_fh is None:
+        yield from response.iter_content(chunk_size=CHUNK_SIZE)
+    elif response.headers.get("Content-Encoding", "").lower() == "gzip":
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        for data in response.raw.stream(CHUNK_SIZE, decode_content=False):
+            raw_fh.write(data)
+            while data:
+                chunk = decompressor.decompress(data)
+                if chunk:
+                    yield chunk
+                data = b""
+                if decompressor.eof:
+                    # the next gzip member of the body
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            raw_fh.write(compressor.compress(chunk))
+            yield chunk
+        raw_fh.write(compressor.flush())
+
 
 date_fmt = datetime.now().strftime("%d_%m_%y_%H%M")
 
@@ -71,7 +367,11 @@ class DownloadFromUniprot:
     @staticmethod
     def get_batch_details(batch_url):
         while batch_url:
-            response = session.get(batch_url)
+            # only the headers are needed, fall back to a GET without reading the body
+            response = get_session().head(batch_url)
+            if response.status_code in (405, 501):
+                with get_session().get(batch_url, stream=True) as response:
+                    pass
             response.raise_for_status()
             total = response.headers["x-total-results"]
             # print(f"headers:{response.headers}")
@@ -83,7 +383,7 @@ class DownloadFromUniprot:
     @staticmethod
     def get_batch(batch_url):
         while batch_url:
-            response = session.get(batch_url)
+            response = get_session().get(batch_url, stream=True)
             response.raise_for_status()
             total = response.headers["x-total-results"]
             yield response, total
@@ -96,6 +396,13 @@ class DownloadFromUniprot:
         self.format = args.format
         self.exclude_taxon_id = args.exclude_taxon_id
         self.filter_database = args.filter_database
+        self.filter_stream = getattr(args, "filter_stream", False)
+        self.keep_dat = getattr(args, "keep_dat", False)
+        if self.filter_stream and not self.filter_database:
+            logging.info(
+                "Enable '--filter_database' as '--filter_stream' option is enabled"
+            )
+            self.filter_database = True
         if self.filter_database:
             logging.info(
                 "Change download '--format' to 'dat' as '--filter_database' option is enabled"
@@ -103,24 +410,240 @@ class DownloadFromUniprot:
             self.format = "dat"
         self.size = args.size
         self.progress = args.progress
-        self.isoform_hash = defaultdict()
+        self.metrics = MetricsWriter(self.progress, getattr(args, "metrics_file", None))
+        self.threads = getattr(args, "threads", 1)
+        self.endpoint = getattr(args, "endpoint", "auto")
+        self.base_url = getattr(args, "base_url", UNIPROT_URL)
+        self.mirror = None
+        if getattr(args, "mirror_dir", None):
+            self.mirror = UniprotMirror(args.mirror_dir)
+        self.isoforms = {}
+        # modification time and size of the isoform file, when it is mirrored
+        self.isoform_version = None
+        self.filter_pool = None
+
+    def get_counter(self, markers=entry_markers):
+        marker = markers.get(self.format)
+        return None if marker is None else EntryCounter(marker)
+
+    def get_metrics(self, url, database, total, entries=None):
+        # progress of a download, resumed downloads start from their checkpoint
+        counter = self.get_counter(progress_markers)
+        if counter is not None and entries:
+            counter.count = entries
+        return DownloadMetrics(
+            self.metrics,
+            database,
+            total,
+            counter,
+            url=url,
+            format=self.format,
+            resumed_entries=entries,
+        )
+
+    def count_chunks(self, chunks, metrics, counter=None):
+        # pass the body chunks through, counting the entries
+        for chunk in chunks:
+            if chunk:
+                if counter is not None:
+                    counter.update(chunk)
+                metrics.update(chunk)
+            yield chunk
+
+    def write_response(self, response, fh, metrics, counter=None):
+        # write the (transfer decompressed) body to disk in chunks, counting the entries
+        page_start = metrics.page_start()
+        for chunk in self.count_chunks(iter_body(response), metrics, counter):
+            fh.write(chunk)
+        metrics.page(response, page_start)
+
+    def check_total(self, counter, output, total):
+        if counter is None:
+            logging.info(
+                f"Cannot count '{self.format}' entries, not checking '{output}' against the {total} entries reported by UniProt"
+            )
+        elif counter.count != int(total):
+            raise ValueError(
+                f"Error: Downloaded {counter.count} entries to '{output}' but UniProt reported {total} entries (x-total-results)"
+            )
 
     #  valid searches
-    def download_from_uniprot(self, url, output):
-        progress = 0
-        with open(output, "w") as f:
-            for batch, total in DownloadFromUniprot.get_batch(url):
-                # lines = batch.text.splitlines()
-                lines = batch.text
-                print(lines, file=f)
-
-                if self.progress and self.format == "fasta":
-                    count = 0
-                    for line in lines.splitlines():
-                        if line.startswith(">"):
-                            count += 1
-                    progress += count
-                    print(f"{progress} / {total}")
+    def download_from_uniprot(
+        self, url, output, database="", checkpoint=None, total=""
+    ):
+        # page through the search endpoint, resuming from checkpoint if given
+        counter = self.get_counter()
+        if checkpoint:
+            logging.info(
+                f"Resuming download to '{output}' from entry {checkpoint['entries']} (byte {checkpoint['offset']})"
+            )
+            batch_url = checkpoint["next"]
+            if counter is not None:
+                counter.count = checkpoint["entries"]
+            f = open(output, "r+b")
+            # drop anything written after the last complete page
+            f.truncate(checkpoint["offset"])
+            f.seek(checkpoint["offset"])
+        else:
+            batch_url = url
+            # a new file, the old one may be a hard link into the mirror
+            if os.path.exists(output):
+                os.remove(output)
+            f = open(output, "wb")
+        metrics = self.get_metrics(
+            url, database, total, checkpoint["entries"] if checkpoint else None
+        )
+        with f:
+            for batch, total in DownloadFromUniprot.get_batch(batch_url):
+                with batch:
+                    self.write_response(batch, f, metrics, counter)
+                # pages are separated by an empty line
+                f.write(b"\n")
+                f.flush()
+                next_link = DownloadFromUniprot.get_next_link(batch.headers)
+                if next_link:
+                    write_checkpoint(
+                        output,
+                        {
+                            "url": url,
+                            "next": next_link,
+                            "entries": None if counter is None else counter.count,
+                            "offset": f.tell(),
+                        },
+                    )
+        metrics.done()
+        self.check_total(counter, output, total)
+        if os.path.exists(f"{output}{CHECKPOINT_SUFFIX}"):
+            os.remove(f"{output}{CHECKPOINT_SUFFIX}")
+
+    def stream_from_uniprot(self, url, output, database="", total=""):
+        # the whole result in one gzip compressed response from the stream endpoint
+        counter = self.get_counter()
+        metrics = self.get_metrics(url, database, total)
+        with get_session().get(
+            url, stream=True, headers={"Accept-Encoding": "gzip"}
+        ) as response:
+            response.raise_for_status()
+            # a new file, the old one may be a hard link into the mirror
+            if os.path.exists(output):
+                os.remove(output)
+            with open(output, "wb") as f:
+                self.write_response(response, f, metrics, counter)
+        metrics.done()
+        self.check_total(counter, output, total)
+
+    def download_and_filter(
+        self,
+        url,
+        output,
+        output_filtered,
+        database="",
+        endpoint="stream",
+        checkpoint=None,
+        total="",
+    ):
+        # filter the entries while they are downloaded, without writing the .dat file
+        # unless it is kept gzip compressed with --keep_dat. Paged downloads write a
+        # checkpoint after every page and keep their partial outputs after a failure,
+        # to be resumed by a rerun
+        counter = self.get_counter()
+        raw_output = f"{output}.gz"
+        tmp_filtered = f"{output_filtered}.tmp"
+        tmp_raw = f"{raw_output}.tmp"
+        checkpoint_file = f"{output}{CHECKPOINT_SUFFIX}"
+        if checkpoint:
+            logging.info(
+                f"Resuming download to '{output_filtered}' from entry {checkpoint['entries']} (byte {checkpoint['offset']})"
+            )
+            batch_url = checkpoint["next"]
+            counter.count = checkpoint["entries"]
+            output_file = open(tmp_filtered, "r+")
+            # drop anything written after the last complete page
+            output_file.truncate(checkpoint["offset"])
+            output_file.seek(checkpoint["offset"])
+            raw_fh = None
+            if checkpoint["raw"]:
+                raw_fh = open(tmp_raw, "r+b")
+                raw_fh.truncate(checkpoint["raw_offset"])
+                raw_fh.seek(checkpoint["raw_offset"])
+        else:
+            batch_url = url
+            output_file = open(tmp_filtered, "w")
+            raw_fh = open(tmp_raw, "wb") if self.keep_dat else None
+        metrics = self.get_metrics(
+            url, database, total, checkpoint["entries"] if checkpoint else None
+        )
+
+        def filter_chunks(chunks):
+            lines = iter_lines(self.count_chunks(chunks, metrics, counter))
+            write_blocks(output_file, filter_dat(lines, self.isoforms))
+
+        try:
+            if endpoint == "stream":
+                with get_session().get(
+                    url, stream=True, headers={"Accept-Encoding": "gzip"}
+                ) as response:
+                    response.raise_for_status()
+                    page_start = metrics.page_start()
+                    filter_chunks(iter_body(response, raw_fh))
+                    metrics.page(response, page_start)
+            else:
+                for batch, total in DownloadFromUniprot.get_batch(batch_url):
+                    # pages hold whole entries, each one is filtered on its own
+                    with batch:
+                        page_start = metrics.page_start()
+                        filter_chunks(iter_body(batch, raw_fh))
+                        metrics.page(batch, page_start)
+                    next_link = DownloadFromUniprot.get_next_link(batch.headers)
+                    if next_link:
+                        output_file.flush()
+                        if raw_fh is not None:
+                            raw_fh.flush()
+                        write_checkpoint(
+                            output,
+                            {
+                                "url": url,
+                                "next": next_link,
+                                "entries": counter.count,
+                                "filtered": tmp_filtered,
+                                "offset": output_file.tell(),
+                                "raw": None if raw_fh is None else tmp_raw,
+                                "raw_offset": None if raw_fh is None else raw_fh.tell(),
+                            },
+                        )
+        except BaseException:
+            output_file.close()
+            if raw_fh is not None:
+                raw_fh.close()
+            if endpoint == "search" and os.path.exists(checkpoint_file):
+                logging.info(
+                    f"Partial download kept in '{tmp_filtered}', a rerun with the same options resumes it"
+                )
+            else:
+                # no partial outputs, a rerun starts the download again
+                self.remove_partial(tmp_filtered, tmp_raw, checkpoint_file)
+            raise
+        output_file.close()
+        if raw_fh is not None:
+            raw_fh.close()
+        metrics.done()
+        try:
+            self.check_total(counter, output, total)
+        except ValueError:
+            self.remove_partial(tmp_filtered, tmp_raw, checkpoint_file)
+            raise
+        os.replace(tmp_filtered, output_filtered)
+        if raw_fh is not None:
+            os.replace(tmp_raw, raw_output)
+            logging.info(f"Downloaded entries kept in '{raw_output}'")
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+
+    @staticmethod
+    def remove_partial(*paths):
+        for path in paths:
+            if path and os.path.exists(path):
+                os.remove(path)
 
     def download_curated_isoforms(self):
         self.ftp = FTP("ftp.uniprot.org")
@@ -132,48 +655,38 @@ class DownloadFromUniprot:
         logging.info("Download manually curated isoform sequences ... ")
         varsplic_out = "uniprot_sprot_varsplic.fasta.gz"
         self.ftp.cwd("/pub/databases/uniprot/current_release/knowledgebase/complete")
-        with open(varsplic_out, "wb") as fp:
-            self.ftp.retrbinary("RETR uniprot_sprot_varsplic.fasta.gz", fp.write)
+        version = None
+        if self.mirror:
+            # the mirrored file is reused while the modification time and size are unchanged
+            self.ftp.voidcmd("TYPE I")
+            modified = self.ftp.sendcmd(f"MDTM {varsplic_out}").split()[-1]
+            version = f"{modified}_{self.ftp.size(varsplic_out)}"
+            self.isoform_version = version
+        if self.mirror and self.mirror.fetch(
+            "ftp", varsplic_out, version, varsplic_out
+        ):
+            logging.info(
+                f"Isoform file is unchanged ({version}), using the mirrored '{varsplic_out}'"
+            )
+        else:
+            if os.path.exists(varsplic_out):
+                os.remove(varsplic_out)
+            with open(varsplic_out, "wb") as fp:
+                self.ftp.retrbinary("RETR uniprot_sprot_varsplic.fasta.gz", fp.write)
+            if self.mirror:
+                self.mirror.store(
+                    "ftp", varsplic_out, version, varsplic_out, {"ftp": self.ftp.host}
+                )
         logging.info("Done")
 
         self.ftp.quit()
 
-    def load_isoform_hash(self, isoform_file):
-        acc = ""
-        with open(isoform_file, "r") as fh:
-            for line in fh:
-                line = line.rstrip()
-                if line.startswith(">"):
-                    # from:
-                    # >sp|Q9S9Z8-2|14311_ARATH Isoform 2 of 14-3-3-like protein GF14 omicron OS=Arabidopsis thaliana OX=3702 GN=GRF11
-                    # get:
-                    # acc = Q9S9Z8
-                    # fln script only matches to 9 splice variants with regex
-                    # (^>\w+\|(\w+)\-\d\|.+)
-                    # I am modifying it to all splice variants
-                    # (^>\w+\|(\w+)\-\d+\|.+)
-
-                    # for example, the above regex matches all below
-                    # >sp|P05067-9|A4_HUMAN Isoform L-APP752 of Amyloid-beta precursor protein OS=Homo sapiens OX=9606 GN=APP
-                    # >sp|P05067-10|A4_HUMAN Isoform APP639 of Amyloid-beta precursor protein OS=Homo sapiens OX=9606 GN=APP -- SKIPPED BY FLN RUBY SCRIPT
-                    # >sp|P05067-11|A4_HUMAN Isoform 11 of Amyloid-beta precursor protein OS=Homo sapiens OX=9606 GN=APP -- SKIPPED BY FLN RUBY SCRIPT
-
-                    """
-                    All the splice variants gets added under the same 'acc'
-                    """
-                    acc_match_region = re.search(r"^>\w+\|(\w+)\-\d+\|.+", line)
-                    if acc_match_region:
-                        acc = acc_match_region.group(1)
-                        if acc not in self.isoform_hash:
-                            self.isoform_hash[acc] = f"{line}\n"
-                        else:
-                            self.isoform_hash[acc] += f"\n{line}\n"
-                    else:
-                        raise ValueError(
-                            f"Error: Could extract relevant information from fasta header line '{line}' of file '{isoform_file}'"
-                        )
-                else:
-                    self.isoform_hash[acc] += line
+    def load_isoforms(self, isoform_file):
+        # only the accession index of the isoforms is kept in memory
+        self.isoforms = IsoformStore.from_fasta(isoform_file, ISOFORM_STORE)
+        logging.info(
+            f"Isoforms of {len(self.isoforms)} accessions in '{ISOFORM_STORE}'"
+        )
 
     def filter_incomplete_seqs(self, input_file, output):
         # UniProtKB fragments with FT NON_CONS and FT NON_TER features.
@@ -186,177 +699,200 @@ class DownloadFromUniprot:
         #
         # NON_CONS fragments are not indicated as non-consecutive in InterPro and being non-consecutive the match to methods may be incorrect if the method spans the 'break'.
 
-        newseq = False
-        print_seq = True
-        id_id = ""
-        acc_id = ""
-        reviewed_status = ""
-        description = ""
-        organism_name = ""
-        organism_taxid = ""
-        gene_name = ""
-        protein_existence = ""
-        sequence_version = ""
-        seq = ""
-        organelle = ""
-
-        # Open the file with writing permission
-        output_file = open(output, "w")
-
-        with open(input_file, "r") as fh:
-            for line in fh:
-                line = line.rstrip()
-                if newseq is False:
-                    id_match_region = re.search(r"^ID\s+(\w+)\s+(\w+);", line)
-                    if id_match_region:
-                        id_id = id_match_region.group(1)
-                        reviewed_status = id_match_region.group(2)
-                        newseq = True
-                        description = ""
-                        organism_name = ""
-                        organism_taxid = ""
-                        gene_name = ""
-                        protein_existence = ""
-                        sequence_version = ""
-                        seq = ""
-                        print_seq = True
-                        organelle = ""
-
-                else:
-                    ac_match_region = re.search(r"^AC\s+(\w+);", line)
-                    de_match_region = re.search(r"^DE\s+(.+);", line)
-                    os_match_region = re.search(r"^OS\s+([^\(]+)", line)
-                    ox_match_region = re.search(r"^OX\s+\w+=(\d+);", line)
-                    gn_match_region = re.search(r"^GN\s+\w+=([^;]+)", line)
-                    pe_match_region = re.search(r"^PE\s+(\d+):", line)
-                    sv_match_region = re.search(r"^DT\s+.*sequence version\s+(\d+).", line)
-                    og_match_region = re.search(r"^OG\s+(.+)", line)
-                    seq_match_region = re.search(r"^\s+([\w\s]+)", line)
-                    if ac_match_region:
-                        acc_id = ac_match_region.group(1)
-                    if de_match_region:
-                        if description == "":
-                            description = (
-                                de_match_region.group(1)
-                                .replace("RecName: Full=", "")
-                                .replace("SubName: Full=", "")
-                                .split("{")[0].strip()
-                            )
-                        if "Flags: Fragment" in line:
-                            # print(f"#{acc_id} #{line}")
-                            print_seq = False
-                    elif os_match_region:
-                        if organism_name == "":
-                            organism_name = os_match_region.group(1).strip().rstrip(".")
-                    elif ox_match_region:
-                        organism_taxid = ox_match_region.group(1)
-                    elif gn_match_region:
-                        if gene_name == "":
-                            gene_name = gn_match_region.group(1).split("{")[0].strip()
-                    elif pe_match_region:
-                        protein_existence = pe_match_region.group(1)
-                    elif sv_match_region:
-                        sequence_version = sv_match_region.group(1)
-                    elif og_match_region:
-                        organelle = og_match_region.group(1)
-                    elif re.match(r"^FT\s+NON_TER\s+", line):
-                        print_seq = False
-                        # print(f"#{acc_id}   NON_TER")
-                    elif re.match(r"^FT\s+NON_CONS\s+(\d+)\s+", line):
-                        print_seq = False
-                        # print(f"#{acc_id}   NON_CONS")
-                    elif seq_match_region:
-                        seq += seq_match_region.group(1)
-                    elif re.match(r"^\/\/", line):
-                        seq = re.sub(r"[\n\t\s]*", "", seq)
-                        if seq[:1].lower() != "m":
-                            print_seq = False
-                        newseq = False
-
-                        if print_seq:
-                            header = ""
-                            if reviewed_status == "Reviewed":
-                                header += "sp|"
-                            else:
-                                header += "tr|"
-                            header += f"{acc_id}|{id_id} {description} "
-                            header += f"OS={organism_name} "
-                            header += f"OX={organism_taxid} "
-                            header += f"GN={gene_name} "
-                            header += f"PE={protein_existence} "
-                            header += f"SV={sequence_version}"
-
-                            line_width = 60
-                            sequence = "\n".join([seq[i:i+line_width] for i in range (0, len(seq), line_width)])
-                            output_file.write(
-                                f">{header}\n{sequence}\n"
-                            )
-                            # add the splice variants
-                            if acc_id in self.isoform_hash:
-                                output_file.write(f"{self.isoform_hash[acc_id]}\n")
+        # The entries are parsed by filter_dat, which only runs the pattern of the
+        # two letter code of each line and collects the sequence lines in a list.
+        if self.threads > 1:
+            self.filter_incomplete_seqs_parallel(input_file, output)
+            return
+        with open(input_file, "r") as fh, open(output, "w") as output_file:
+            write_blocks(output_file, filter_dat(fh, self.isoforms))
+
+    def filter_incomplete_seqs_parallel(self, input_file, output):
+        # byte ranges of whole entries, split after '//' lines, filtered in worker
+        # processes and written in input order
+        parts = max(self.threads * 4, os.path.getsize(input_file) // RANGE_SIZE + 1)
+        ranges = record_ranges(input_file, parts, b"//")
+        logging.info(
+            f"Filter {len(ranges)} parts of '{input_file}' with {self.threads} processes"
+        )
+        # the workers do not share the working directory of this process
+        input_file = os.path.abspath(input_file)
+        with open(output, "w") as output_file:
+            if self.filter_pool is not None:
+                texts = self.filter_pool.map(filter_range, repeat(input_file), ranges)
+                write_blocks(output_file, texts)
+                return
+            with filter_pool(self.threads, self.isoforms) as executor:
+                texts = executor.map(filter_range, repeat(input_file), ranges)
+                write_blocks(output_file, texts)
 
     def run(self):
         # Download manually curated isoform sequences
         if self.filter_database:
             self.download_curated_isoforms()
 
-            # extract the files
-            logging.info("Extract downloaded files ... ")
-            os.system("gunzip -f *.gz")
-            logging.info("Done")
-
-            # populate self.isoform_hash
-            self.load_isoform_hash("uniprot_sprot_varsplic.fasta")
-        for review_list in ["true", "false"]:
-            # Uniprot Advanced: Share: Generate URI for API
-            # https://rest.uniprot.org/uniprotkb/search?compressed=true&format=fasta&query=((taxonomy_id:3701)+NOT+(taxonomy_id:3702))+AND+(reviewed:true)&size=500
-            url = f"https://rest.uniprot.org/uniprotkb/search?query=(reviewed:{review_list})+AND+((taxonomy_id:{self.taxon_id})"
-
-            if self.exclude_taxon_id:
-                url += f"+NOT+(taxonomy_id:{self.exclude_taxon_id})"
-
-            if self.format == "dat":
-                url += ")&format=txt"
-            else:
-                url += f")&format={self.format}"
-
-            url += f"&size={self.size}"
-
-            (
-                total,
-                release,
-                release_date,
-                download_date,
-            ) = DownloadFromUniprot.get_batch_details(url)
-            database = "SwissProt" if review_list == "true" else "TrEMBL"
-            output = "_".join(
-                [
-                    "Uniprot",
-                    database,
-                    self.taxon_name,
-                    self.taxon_id,
-                    total,
-                    date_fmt + "." + self.format,
+            # index the isoforms, decompressing the download while it is read
+            self.load_isoforms("uniprot_sprot_varsplic.fasta.gz")
+        if self.filter_database and self.threads > 1:
+            # both databases share the --threads filter processes
+            self.filter_pool = filter_pool(self.threads, self.isoforms)
+        try:
+            # download Swiss-Prot and TrEMBL concurrently
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [
+                    executor.submit(self.download_database, review_list)
+                    for review_list in ["true", "false"]
                 ]
+                for future in futures:
+                    future.result()
+        finally:
+            if self.filter_pool is not None:
+                self.filter_pool.shutdown()
+                self.filter_pool = None
+        if self.filter_database:
+            self.isoforms.close()
+
+    def get_endpoint(self, database, total, checkpoint):
+        # an unfinished download is always resumed from its checkpoint
+        if checkpoint:
+            if self.endpoint == "stream":
+                logging.info(
+                    f"Resuming the unfinished {database} download with the 'search' endpoint"
+                )
+            return "search"
+        if self.endpoint != "auto":
+            return self.endpoint
+        return "search" if int(total) > RESUMABLE_ENTRIES else "stream"
+
+    def filtered_version(self, release):
+        # the filtered fasta also depends on the isoforms added to it
+        if self.isoform_version is None:
+            return release
+        return f"{release}_{self.isoform_version}"
+
+    def fetch_filtered(self, mirror_key, release, output, output_filtered):
+        """
+        Link or copy the mirrored '--filter_stream' outputs, returns False if they are
+        not mirrored
+        """
+        if self.keep_dat and not self.mirror.fetch(
+            "uniprotkb_dat_gz", mirror_key, release, f"{output}.gz"
+        ):
+            return False
+        return self.mirror.fetch(
+            "uniprotkb_filtered",
+            mirror_key,
+            self.filtered_version(release),
+            output_filtered,
+        )
+
+    def store_filtered(self, mirror_key, release, output, output_filtered, info):
+        self.mirror.store(
+            "uniprotkb_filtered",
+            mirror_key,
+            self.filtered_version(release),
+            output_filtered,
+            info,
+        )
+        if self.keep_dat:
+            self.mirror.store(
+                "uniprotkb_dat_gz", mirror_key, release, f"{output}.gz", info
             )
-            logging.info(f"Download date: {download_date}")
-            message = f"Downloading taxon id ({self.taxon_id})"
-            if self.exclude_taxon_id:
-                message += f", excluding taxon id ({self.exclude_taxon_id}),"
-            message += f" from {database} ({total} entries) UniProt Release {release} (UniProt Release Date:{release_date}) to file '{output}' ... "
-
-            logging.info(message)
-            self.download_from_uniprot(url, output)
-            logging.info("Done")
 
+    def download_database(self, review_list):
+        # Uniprot Advanced: Share: Generate URI for API
+        # https://rest.uniprot.org/uniprotkb/search?compressed=true&format=fasta&query=((taxonomy_id:3701)+NOT+(taxonomy_id:3702))+AND+(reviewed:true)&size=500
+        query = f"query=(reviewed:{review_list})+AND+((taxonomy_id:{self.taxon_id})"
+
+        if self.exclude_taxon_id:
+            query += f"+NOT+(taxonomy_id:{self.exclude_taxon_id})"
+
+        if self.format == "dat":
+            query += ")&format=txt"
+        else:
+            query += f")&format={self.format}"
+
+        url = f"{self.base_url}/search?{query}&size={self.size}"
+
+        (
+            total,
+            release,
+            release_date,
+            download_date,
+        ) = DownloadFromUniprot.get_batch_details(url)
+        database = "SwissProt" if review_list == "true" else "TrEMBL"
+        prefix = "_".join(["Uniprot", database, self.taxon_name, self.taxon_id, total])
+        output = f"{prefix}_{date_fmt}.{self.format}"
+        resumed_output, checkpoint = find_checkpoint(prefix, url, self.filter_stream)
+        if checkpoint:
+            output = resumed_output
+        endpoint = self.get_endpoint(database, total, checkpoint)
+        logging.info(f"Download date: {download_date}")
+        message = f"Downloading taxon id ({self.taxon_id})"
+        if self.exclude_taxon_id:
+            message += f", excluding taxon id ({self.exclude_taxon_id}),"
+        message += f" from {database} ({total} entries) UniProt Release {release} (UniProt Release Date:{release_date})"
+
+        mirror_key = f"{self.base_url}?{query}"
+        mirror_info = {
+            "total": total,
+            "release_date": release_date,
+            "download_date": download_date,
+        }
+        output_filtered = output.replace(".dat", ".filtered.fasta")
+        if (
+            self.mirror
+            and self.filter_stream
+            and not checkpoint
+            and self.fetch_filtered(mirror_key, release, output, output_filtered)
+        ):
+            logging.info(
+                f"UniProt Release {release} is unchanged, using the mirrored filtered {database} download for '{output_filtered}'"
+            )
+            logging.info(f"Output file:'{output_filtered}'")
+            return
+        if (
+            self.mirror
+            and not checkpoint
+            and self.mirror.fetch("uniprotkb", mirror_key, release, output)
+        ):
+            logging.info(
+                f"UniProt Release {release} is unchanged, using the mirrored {database} download for '{output}'"
+            )
+        elif self.filter_stream:
+            logging.info(
+                f"{message}, filtering incomplete sequences and adding manually curated isoform sequences while downloading, to file '{output_filtered}' ... "
+            )
+            if endpoint == "stream":
+                url = f"{self.base_url}/stream?{query}"
+            self.download_and_filter(
+                url, output, output_filtered, database, endpoint, checkpoint, total
+            )
+            if self.mirror:
+                self.store_filtered(
+                    mirror_key, release, output, output_filtered, mirror_info
+                )
+            logging.info(f"Done ({database})")
+            logging.info(f"Output file:'{output_filtered}'")
+            return
+        else:
+            logging.info(f"{message} to file '{output}' ... ")
+            if endpoint == "stream":
+                self.stream_from_uniprot(
+                    f"{self.base_url}/stream?{query}", output, database, total
+                )
+            else:
+                self.download_from_uniprot(url, output, database, checkpoint, total)
+            if self.mirror:
+                self.mirror.store("uniprotkb", mirror_key, release, output, mirror_info)
+        logging.info(f"Done ({database})")
 
-            if self.filter_database:
-                output_filtered = output.replace(".dat", ".filtered.fasta")
-                logging.info(f"Filter incomplete sequences from '{output}' and add manually curated isoform sequences ... ")
-                self.filter_incomplete_seqs(output, output_filtered)
-                logging.info("Done")
+        if self.filter_database:
+            logging.info(f"Filter incomplete sequences from '{output}' and add manually curated isoform sequences ... ")
+            self.filter_incomplete_seqs(output, output_filtered)
+            logging.info(f"Done ({database})")
 
-                logging.info(f"Output file:'{output_filtered}'")
+            logging.info(f"Output file:'{output_filtered}'")
 
 
 def main():
@@ -414,16 +950,51 @@ def main():
         action="store_true",
         help="Filter the database to remove incomplete sequences. If enabled the format of download will be in 'dat' format and filtered output will be in 'fasta' format (default: %(default)s)",
     )
+    parser.add_argument(
+        "--filter_stream",
+        action="store_true",
+        help="Filter the entries while they are downloaded, implies '--filter_database'. Only the filtered fasta is written, the .dat file is not. A failed 'search' download keeps its partial outputs and checkpoint and is resumed by a rerun with the same options, a failed 'stream' download starts again. With '--mirror_dir', the filtered fasta (and the .dat.gz of '--keep_dat') of an unchanged release and isoform file is taken from the mirror, and a release mirrored as a .dat file is filtered from it (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--keep_dat",
+        action="store_true",
+        help="With '--filter_stream', keep the downloaded entries gzip compressed in '<output>.dat.gz' (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--threads",
+        default=1,
+        type=int,
+        help="Number of worker processes used by '--filter_database'. The downloaded .dat file is memory mapped, split into parts of whole entries and filtered in parallel (default: %(default)s)",
+    )
     parser.add_argument(
         "--size",
         default=500,
         type=int,
-        help="Always use size 500 as this will provide fast performance (default: %(default)s)",
+        help="Page size for '--endpoint search'. Always use size 500 as this will provide fast performance (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--endpoint",
+        choices=endpoints,
+        default="auto",
+        help=f"UniProt REST endpoint. 'stream' downloads all entries in one compressed response and cannot be resumed, 'search' pages through the results and writes a checkpoint after every page, so that a rerun of a failed download resumes from it. 'auto' uses 'search' for downloads of more than {RESUMABLE_ENTRIES} entries and 'stream' for the others. An unfinished download with a checkpoint is always resumed with 'search' (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--mirror_dir",
+        help="Keep the downloads in this local mirror directory, keyed by query, format and UniProt release. An unchanged release is linked or copied from the mirror instead of downloaded again, as is the isoform file of '--filter_database' while its modification time and size on the FTP site are unchanged. '--filter_stream' mirrors its filtered fasta, keyed by query, UniProt release and isoform file, and the .dat.gz of '--keep_dat'",
+    )
+    parser.add_argument(
+        "--base_url",
+        default=UNIPROT_URL,
+        help="UniProtKB REST API address, for a mirror or a local test server (default: %(default)s)",
     )
     parser.add_argument(
         "--progress",
         action="store_true",
-        help="Report progress for downloads. Only available for fasta downloads (default: %(default)s)",
+        help="Report the progress of the downloads as JSON lines on stdout: bytes and entries per second, ETA against the entries reported by UniProt, latency, duration and retries of every page, and a summary with a page latency histogram (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--metrics_file",
+        help="Append the same JSON lines as '--progress' to this file, to follow the download performance over time",
     )
     args = parser.parse_args()
 
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Progress and throughput metrics of the UniProt downloads, as JSON lines
+
+Each download reports one event per line:
+
+    {"event": "start", ...}     query, format, entries reported by UniProt
+    {"event": "progress", ...}  at most every PROGRESS_INTERVAL seconds
+    {"event": "page", ...}      every response, with its latency (request to headers),
+                                duration, bytes, entries and urllib3 retries
+    {"event": "done", ...}      totals and the histogram of the page latencies
+
+Rates are bytes and entries per second since the start, the ETA is the time left to
+reach the number of entries reported by UniProt (x-total-results) at that rate.
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+# import libraries
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# seconds between two progress events of a download
+PROGRESS_INTERVAL = 5
+# upper bounds in seconds of the page latency histogram, the last bucket is unbounded
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class MetricsWriter:
+    """
+    Write metrics events to stdout and/or append them to a file, from several threads
+    """
+
+    def __init__(self, stdout=False, metrics_file=None):
+        self.stdout = stdout
+        self.metrics_file = metrics_file
+        self.lock = threading.Lock()
+
+    def __bool__(self):
+        return self.stdout or bool(self.metrics_file)
+
+    def emit(self, event):
+        line = json.dumps(event) + "\n"
+        with self.lock:
+            if self.stdout:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            if self.metrics_file:
+                with open(self.metrics_file, "a") as fh:
+                    fh.write(line)
+
+
+class DownloadMetrics:
+    """
+    Metrics of one download, counting entries with counter (an EntryCounter or None)
+    """
+
+    def __init__(self, writer, database, total, counter=None, **details):
+        self.writer = writer
+        self.database = database
+        self.total = int(total) if total else None
+        self.counter = counter
+        self.bytes = 0
+        self.pages = 0
+        self.retries = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.start = self.last_report = time.monotonic()
+        self.emit("start", total=self.total, **details)
+
+    @property
+    def entries(self):
+        return None if self.counter is None else self.counter.count
+
+    def emit(self, event, **fields):
+        if self.writer:
+            self.writer.emit(
+                {
+                    "event": event,
+                    "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "database": self.database,
+                    **fields,
+                }
+            )
+
+    def rates(self):
+        elapsed = time.monotonic() - self.start
+        fields = {
+            "elapsed_s": round(elapsed, 3),
+            "bytes": self.bytes,
+            "entries": self.entries,
+            "total": self.total,
+            "bytes_per_s": round(self.bytes / elapsed) if elapsed else None,
+            "entries_per_s": None,
+            "eta_s": None,
+        }
+        if self.entries is not None and elapsed:
+            entries_per_s = self.entries / elapsed
+            fields["entries_per_s"] = round(entries_per_s, 1)
+            if self.total is not None and entries_per_s:
+                fields["eta_s"] = round(
+                    max(self.total - self.entries, 0) / entries_per_s, 1
+                )
+        return fields
+
+    def update(self, chunk):
+        self.bytes += len(chunk)
+        if self.counter is not None:
+            self.counter.update(chunk)
+        if time.monotonic() - self.last_report >= PROGRESS_INTERVAL:
+            self.last_report = time.monotonic()
+            self.emit("progress", **self.rates())
+
+    def page_start(self):
+        return time.monotonic(), self.bytes, self.entries
+
+    def page(self, response, page_start):
+        """
+        Record a response whose body was read since page_start()
+        """
+        started, bytes_before, entries_before = page_start
+        self.pages += 1
+        latency = response.elapsed.total_seconds()
+        retry_history = getattr(getattr(response.raw, "retries", None), "history", ())
+        self.retries += len(retry_history)
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and latency > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+        self.emit(
+            "page",
+            page=self.pages,
+            status=response.status_code,
+            latency_s=round(latency, 3),
+            duration_s=round(time.monotonic() - started, 3),
+            bytes=self.bytes - bytes_before,
+            entries=None if self.entries is None else self.entries - entries_before,
+            retries=len(retry_history),
+        )
+
+    def done(self):
+        labels = [f"le_{bound}" for bound in LATENCY_BUCKETS] + ["inf"]
+        self.emit(
+            "done",
+            **self.rates(),
+            pages=self.pages,
+            retries=self.retries,
+            page_latency_s=dict(zip(labels, self.histogram)),
+        )
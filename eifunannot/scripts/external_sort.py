@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bounded memory helpers to sort and join large text files on a key
+
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+# import libraries
+import heapq
+import os
+import tempfile
+
+# number of lines held in memory before a sorted run is written to disk
+SORT_BUFFER = 1000000
+
+
+def _write_run(lines, tmp_dir):
+    with tempfile.NamedTemporaryFile(
+        mode="w",
+        encoding="utf8",
+        prefix="eifunannot_sort_",
+        suffix=".txt",
+        dir=tmp_dir,
+        delete=False,
+    ) as fh:
+        for line in lines:
+            fh.write(f"{line}\n")
+    return fh.name
+
+
+def _read_run(run):
+    with open(run, "r", encoding="utf8") as fh:
+        for line in fh:
+            yield line[:-1]
+
+
+def sort_lines(lines, key, buffer_size=SORT_BUFFER, tmp_dir=None):
+    """
+    Stable external sort of lines (without the trailing newline) by key
+
+    Lines are sorted in memory in runs of buffer_size, spilled to tmp_dir and
+    k-way merged. Lines with equal keys keep their input order.
+    """
+    runs = []
+    run = []
+    try:
+        for line in lines:
+            run.append(line)
+            if len(run) >= buffer_size:
+                run.sort(key=key)
+                runs.append(_write_run(run, tmp_dir))
+                run = []
+        run.sort(key=key)
+        if not runs:
+            yield from run
+            return
+        if run:
+            runs.append(_write_run(run, tmp_dir))
+            run = []
+        # heapq.merge breaks ties by run order, so the merge is stable
+        yield from heapq.merge(*(_read_run(name) for name in runs), key=key)
+    finally:
+        for name in runs:
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def check_sorted(items, key, name):
+    """
+    Pass items through, raising ValueError if they are not sorted by key
+    """
+    previous = None
+    for num, item in enumerate(items, 1):
+        current = key(item)
+        if previous is not None and current < previous:
+            raise ValueError(
+                f"Error: Input '{name}' is not sorted, '{current}' (record {num}) comes after '{previous}'. Sort with 'LC_ALL=C sort -t $'\\t' -k1,1' or do not use the presorted option"
+            )
+        previous = current
+        yield item
+
+
+def unique_by_key(items, key):
+    """
+    Collapse runs of items with the same key into (key, last item), as a dict would
+    """
+    previous = None
+    last = None
+    for item in items:
+        current = key(item)
+        if last is not None and current != previous:
+            yield previous, last
+        previous = current
+        last = item
+    if last is not None:
+        yield previous, last
+
+
+class SortedLookup:
+    """
+    Dict-like lookup into a stream of (key, value) pairs sorted by key
+
+    Keys must be requested in non-decreasing order, so only the current pair is held in memory.
+    """
+
+    def __init__(self, pairs):
+        self._pairs = iter(pairs)
+        self._current = next(self._pairs, None)
+
+    def get(self, key, default=None):
+        while self._current is not None and self._current[0] < key:
+            self._current = next(self._pairs, None)
+        if self._current is not None and self._current[0] == key:
+            return self._current[1]
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
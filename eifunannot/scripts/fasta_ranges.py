@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rewrite the headers of a FASTA file in worker processes, over byte ranges of whole
+records, and write the results in input order
+
+The source specific part is a header transform, a picklable function of a header
+line (without newline) returning None to drop the record, or (header, info) to keep
+it under the new header line, with info a line of the side table or None. Sequence
+lines of the kept records are copied, blank lines and comments are removed.
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+# import libraries
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from eifunannot.scripts.record_ranges import RANGE_SIZE, read_range, record_ranges
+
+# dropped header lines of each range kept for the summary, the others are only counted
+DROPPED_EXAMPLES = 10
+
+# header transform of this process
+worker_transform = None
+
+
+class RangeResult:
+    """
+    Output of one byte range: fasta and side table text, number of records read and
+    kept, and the first dropped header lines
+    """
+
+    __slots__ = ("text", "info", "records", "kept", "dropped")
+
+    def __init__(self, text, info, records, kept, dropped):
+        self.text = text
+        self.info = info
+        self.records = records
+        self.kept = kept
+        self.dropped = dropped
+
+
+def init_transform_worker(transform):
+    # the transform (and its lookup tables) is sent once to each worker process
+    global worker_transform
+    worker_transform = transform
+
+
+def transform_lines(lines, transform):
+    """
+    RangeResult of the fasta lines of one range
+    """
+    text = []
+    info = []
+    dropped = []
+    records = kept = 0
+    print_rest = False
+    for line in lines:
+        if line.startswith(">"):
+            records += 1
+            protein = transform(line.rstrip("\n"))
+            print_rest = protein is not None
+            if print_rest:
+                kept += 1
+                header, info_line = protein
+                text.append(f"{header}\n")
+                if info_line is not None:
+                    info.append(f"{info_line}\n")
+            elif len(dropped) < DROPPED_EXAMPLES:
+                dropped.append(line.rstrip("\n"))
+        elif print_rest and line.strip() and not line.startswith("#"):
+            text.append(line if line.endswith("\n") else f"{line}\n")
+    return RangeResult("".join(text), "".join(info), records, kept, dropped)
+
+
+def transform_range(fasta, byte_range):
+    return transform_lines(read_range(fasta, byte_range), worker_transform)
+
+
+def transform_fasta(fasta, transform, out, info_out=None, threads=1):
+    """
+    Write the transformed records of fasta to out, and their info lines to info_out
+
+    Returns the number of records read and kept, and the first dropped header lines
+    """
+    size = os.path.getsize(fasta)
+    # several ranges per worker balance the load, and all of them bound the memory
+    parts = max(threads * 4 if threads > 1 else 1, size // RANGE_SIZE + 1)
+    ranges = record_ranges(fasta, parts, b">", after=False)
+    records = kept = 0
+    dropped = []
+
+    def write(results):
+        nonlocal records, kept
+        for result in results:
+            out.write(result.text)
+            if info_out is not None:
+                info_out.write(result.info)
+            records += result.records
+            kept += result.kept
+            dropped.extend(result.dropped[: DROPPED_EXAMPLES - len(dropped)])
+
+    if threads > 1 and len(ranges) > 1:
+        with ProcessPoolExecutor(
+            max_workers=threads,
+            initializer=init_transform_worker,
+            initargs=(transform,),
+        ) as executor:
+            write(executor.map(transform_range, repeat(fasta), ranges))
+    else:
+        write(
+            transform_lines(read_range(fasta, byte_range), transform)
+            for byte_range in ranges
+        )
+    return records, kept, dropped
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Script to generate one AHRD reference fasta from many NCBI, Ensembl and fasta plus
+annotation tsv sources
+
+The sources are read once each, concurrently, with the header formats of
+generate_ahrd_reference_fasta_from_ncbi, _from_ensembl and _from_file. Proteins
+whose sequence was already written from an earlier source (in command line order)
+are dropped, proteins of one source sharing a sequence (isoforms, paralogs) are all
+kept as with the per source scripts. The outputs are the AHRD reference fasta, its '.ahrd_format.info.txt'
+table and its BLAST protein database.
+
+"""
+
+# import libraries
+import argparse
+from argparse import RawTextHelpFormatter
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from eifunannot import __version__, __author__, __email__
+from eifunannot.scripts.generate_ahrd_reference_fasta_from_ensembl import (
+    parse_protein_coding,
+)
+from eifunannot.scripts.generate_ahrd_reference_fasta_from_file import (
+    GenerateAHRDReferenceFasta,
+)
+from eifunannot.scripts.generate_ahrd_reference_fasta_from_ncbi import parse_curated
+
+# change logging format - https://realpython.com/python-logging/
+# format is - time, process_id, user, log level, message
+logging.basicConfig(
+    format="%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%d-%b-%y %H:%M:%S",
+)
+# the per source summaries are logged at info level
+logging.getLogger().setLevel(logging.INFO)
+
+# check python version
+try:
+    assert sys.version_info >= (3, 7)
+except AssertionError:
+    logging.error(
+        f"Python >=3.7 is required.\nCurrent is Python {sys.version}.\nExiting..."
+    )
+    sys.exit(1)
+
+# get script name
+script = os.path.basename(sys.argv[0])
+
+
+def iter_fasta(fasta):
+    """
+    Yield the header line and the sequence lines of each record, without blank lines
+    and comments
+    """
+    header = None
+    seq_lines = []
+    with open(fasta, "r") as fh:
+        for line in fh:
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, seq_lines
+                header = line.rstrip("\n")
+                seq_lines = []
+            elif header is not None and line.strip() and not line.startswith("#"):
+                seq_lines.append(line if line.endswith("\n") else f"{line}\n")
+    if header is not None:
+        yield header, seq_lines
+
+
+def get_describer(source):
+    """
+    Function of a header line returning (protein, function, symbol, AHRD header),
+    or None for proteins the source does not keep
+    """
+    kind, fasta, options = source
+    if kind == "ncbi":
+
+        def describe(line):
+            protein = parse_curated(line, options["keep_XP"])
+            if protein is None:
+                return None
+            header, description = protein
+            return (
+                header,
+                description,
+                "",
+                f">{header} | Symbols:  | {description.replace('[','(').replace(']',')')}  |",
+            )
+
+    elif kind == "ensembl":
+
+        def describe(line):
+            protein = parse_protein_coding(line)
+            if protein is None:
+                return None
+            header, description = protein
+            return (
+                header,
+                description,
+                "",
+                f">{header} | Symbols:  | {description.replace('[','(').replace(']',')')}  |",
+            )
+
+    else:
+        annotation = GenerateAHRDReferenceFasta(
+            argparse.Namespace(fasta=fasta, **options)
+        )
+        annotation.parse_file()
+
+        def describe(line):
+            header = line.split(" ")[0].replace(">", "")
+            info = annotation.lookup(header)
+            if info is None:
+                return None
+            description, symbol = info
+            return (
+                header,
+                description,
+                "" if symbol is None else symbol,
+                annotation.get_ahrd_header(header, info),
+            )
+
+    return describe
+
+
+def convert_source(source, tmp_dir):
+    """
+    Write the AHRD records of one source to a temporary fasta, and an index with the
+    sequence digest, byte length, protein, function and symbol of each record
+
+    Returns the paths of both files and the number of records read and kept
+    """
+    describe = get_describer(source)
+    records = kept = 0
+    with tempfile.NamedTemporaryFile(
+        "wb", dir=tmp_dir, suffix=".fasta", delete=False
+    ) as fasta_out, tempfile.NamedTemporaryFile(
+        "w", dir=tmp_dir, suffix=".tsv", delete=False
+    ) as index_out:
+        for line, seq_lines in iter_fasta(source[1]):
+            records += 1
+            protein = describe(line)
+            if protein is None:
+                continue
+            kept += 1
+            header, description, symbol, ahrd_header = protein
+            sequence = "".join(seq_line.strip() for seq_line in seq_lines)
+            digest = hashlib.blake2b(sequence.encode(), digest_size=16).hexdigest()
+            text = f"{ahrd_header}\n{''.join(seq_lines)}".encode("utf8")
+            fasta_out.write(text)
+            index_out.write(
+                f"{digest}\t{len(text)}\t{header}\t{description}\t{symbol}\n"
+            )
+    return fasta_out.name, index_out.name, records, kept
+
+
+class GenerateAHRDReference:
+    def __init__(self, args):
+        self.args = args
+        self.output = args.output
+        self.sources = args.sources
+        self.threads = args.threads
+        self.tmp_dir = args.tmp_dir
+
+    def write_reference(self):
+        """
+        Concatenate the converted sources in order, dropping the sequences already
+        written from an earlier source
+        """
+        fasta_txt = f"{self.output}.ahrd_format.info.txt"
+        # digests of the earlier sources, identical sequences of one source are kept
+        seen = set()
+        written = 0
+        # removed with the files of all sources, also after a failure
+        tmp_dir = tempfile.TemporaryDirectory(
+            prefix="eifunannot_ahrd_", dir=self.tmp_dir
+        )
+        with tmp_dir, ProcessPoolExecutor(max_workers=self.threads) as executor:
+            futures = [
+                executor.submit(convert_source, source, tmp_dir.name)
+                for source in self.sources
+            ]
+            with open(self.output, "wb") as out, open(fasta_txt, "w") as writer:
+                writer.write("#Protein\t#Function\t#Symbol\t#Source\n")
+                for (kind, fasta, options), future in zip(self.sources, futures):
+                    fasta_tmp, index_tmp, records, kept = future.result()
+                    duplicates = 0
+                    digests = set()
+                    with open(fasta_tmp, "rb") as fasta_fh, open(index_tmp) as index_fh:
+                        for row in index_fh:
+                            digest, length, protein = row.rstrip("\n").split("\t", 2)
+                            text = fasta_fh.read(int(length))
+                            if digest in seen:
+                                duplicates += 1
+                                continue
+                            digests.add(digest)
+                            out.write(text)
+                            writer.write(f"{protein}\t{os.path.basename(fasta)}\n")
+                    seen |= digests
+                    written += kept - duplicates
+                    os.remove(fasta_tmp)
+                    os.remove(index_tmp)
+                    logging.info(
+                        f"{kind} '{fasta}': {records} proteins, {kept} with an AHRD description, {duplicates} dropped as sequences of an earlier source, {kept - duplicates} written"
+                    )
+        logging.info(
+            f"AHRD reference fasta '{self.output}' has {written} proteins, information written to file '{fasta_txt}'"
+        )
+
+    def make_blast_db(self):
+        makeblastdb = shutil.which(self.args.makeblastdb)
+        if makeblastdb is None:
+            logging.error(
+                f"Cannot find '{self.args.makeblastdb}' to build the BLAST database, use --makeblastdb or --no_blastdb"
+            )
+            sys.exit(1)
+        cmd = [makeblastdb, "-in", self.output, "-dbtype", "prot"]
+        logging.info(f"Build the BLAST database: {' '.join(cmd)}")
+        subprocess.run(cmd, check=True)
+
+    def run(self):
+        self.write_reference()
+        if not self.args.no_blastdb:
+            self.make_blast_db()
+
+
+class SourceAction(argparse.Action):
+    # keep the sources of all kinds in command line order
+    def __call__(self, parser, namespace, values, option_string=None):
+        if namespace.sources is None:
+            namespace.sources = []
+        if self.dest == "file":
+            if len(values) not in (4, 5):
+                parser.error(
+                    f"{option_string} takes FASTA TSV ID DESCRIPTION [SYMBOL], got {values}"
+                )
+            try:
+                columns = [int(value) for value in values[2:]]
+            except ValueError:
+                parser.error(f"{option_string} column numbers must be integers")
+            options = {
+                "annotation_tsv": values[1],
+                "id": columns[0],
+                "description": columns[1],
+                "symbol": columns[2] if len(columns) == 3 else None,
+                "index": None,
+            }
+            namespace.sources.append(("file", values[0], options))
+        else:
+            namespace.sources.append((self.dest, values, {}))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Script to generate one AHRD reference fasta from many NCBI, Ensembl and fasta plus annotation tsv sources",
+        formatter_class=RawTextHelpFormatter,
+        epilog="Example command:\n"
+        + script
+        + " -o ahrd_reference.fasta --ncbi GCF_000214255.1_Bter_1.0_protein.faa --ensembl Homo_sapiens.GRCh38.pep.all.fa --file chloroplast.faa chloroplast.tsv 1 3 2"
+        + "\n\nSources are read concurrently and proteins with a sequence already written from an earlier source are dropped, those sharing a sequence within a source are kept."
+        + "\nOutputs are the fasta, '<output>.ahrd_format.info.txt' and the BLAST database '<output>'."
+        + "\n\nContact:"
+        + __author__
+        + "("
+        + __email__
+        + ")",
+    )
+    parser.set_defaults(sources=None)
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help="AHRD reference fasta to write, also the name of the BLAST database",
+    )
+    parser.add_argument(
+        "--keep_XP",
+        action="store_true",
+        help="Keep the XP_* proteins of the --ncbi sources, by default only NP_* proteins are used (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--ncbi",
+        action=SourceAction,
+        metavar="FASTA",
+        help="NCBI protein fasta [ncbi.protein.faa], can be repeated",
+    )
+    parser.add_argument(
+        "--ensembl",
+        action=SourceAction,
+        metavar="FASTA",
+        help="Ensembl protein fasta [ensembl.pep.all.fa], can be repeated",
+    )
+    parser.add_argument(
+        "--file",
+        action=SourceAction,
+        nargs="+",
+        metavar="FASTA TSV ID DESCRIPTION [SYMBOL]",
+        help="Fasta and annotation tsv file, with the column numbers of the fasta header id, the description and optionally the symbol, as in generate_ahrd_reference_fasta_from_file, can be repeated",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of sources read in parallel (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--tmp_dir",
+        help="Directory of the temporary files of the sources (default: system temporary directory)",
+    )
+    parser.add_argument(
+        "--makeblastdb",
+        default="makeblastdb",
+        help="makeblastdb executable (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no_blastdb",
+        action="store_true",
+        help="Do not build the BLAST database (default: %(default)s)",
+    )
+    args = parser.parse_args()
+    if not args.sources:
+        parser.error("Provide at least one source with --ncbi, --ensembl or --file")
+    for kind, fasta, options in args.sources:
+        if kind == "ncbi":
+            options["keep_XP"] = args.keep_XP
+
+    GenerateAHRDReference(args).run()
+
+
+if __name__ == "__main__":
+    main()
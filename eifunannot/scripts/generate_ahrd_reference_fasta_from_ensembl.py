@@ -17,6 +17,7 @@ import sys
 import logging
 
 from eifunannot import __version__, __author__, __email__
+from eifunannot.scripts.fasta_ranges import transform_fasta
 
 # change logging format - https://realpython.com/python-logging/
 # format is - time, process_id, user, log level, message
@@ -101,8 +102,63 @@ def get_description(line):
     return description
 
 
+def tokenize_header(line):
+    """
+    Split an Ensembl header line in one pass into the fasta header, the key:value fields
+    and the description, which is always last and may contain spaces
+    >ENSP00000451515.1 pep chromosome:GRCh38:14:105836765:105837135:1 gene:ENSG00000211898.10 transcript:ENST00000390559.6 gene_biotype:IG_C_gene transcript_biotype:IG_C_gene gene_symbol:IGHD description:immunoglobulin heavy constant delta [Source:HGNC Symbol;Acc:HGNC:5480]
+    """
+    head, _, description = line.partition(" description:")
+    tokens = head[1:].split()
+    # a header separated from the '>' is left to get_header
+    header = tokens[0] if tokens and not line[1:2].isspace() else None
+    fields = {}
+    for token in tokens[1:]:
+        key, _, value = token.partition(":")
+        fields[key] = value
+    return header, fields, description
+
+
+def parse_protein_coding(line):
+    """
+    Fasta header and description of an Ensembl header line, None unless the gene and
+    the transcript are protein_coding and the line has a description
+    """
+    # the fields are read from the tokens of the header, the regex helpers only
+    # handle headers without them (and exit)
+    header, fields, description = tokenize_header(line)
+    header = header or get_header(line)
+    gene = fields.get("gene") or get_gene(line)
+    gene_biotype = fields.get("gene_biotype") or get_gene_biotype(line)
+    transcript_biotype = fields.get("transcript_biotype") or get_transcript_biotype(
+        line
+    )
+    # only worry about protein_coding at gene and transcript level
+    if gene_biotype == "protein_coding" and transcript_biotype == "protein_coding":
+        description = description or get_description(line)
+        if description != "Unknown function":
+            return header, description
+    return None
+
+
+def ahrd_header(line):
+    # header transform of transform_fasta
+    protein = parse_protein_coding(line)
+    if protein is None:
+        return None
+    header, description = protein
+    # print("\t".join([header, gene, gene_biotype, transcript_biotype, description]))
+    # create format
+    # >ENSOABP00000000006.1 | Symbols:  | zgc:77880 (Source:ZFIN;Acc:ZDB-GENE-040426-1901)  |
+    # >ENSOABP00000000014.1 | Symbols:  | FERM domain containing 7 (Source:HGNC Symbol;Acc:HGNC:8079)  |
+    return (
+        f">{header} | Symbols:  | {description.replace('[','(').replace(']',')')}  |",
+        None,
+    )
+
+
 # format_fasta_header
-def format_fasta_header(fasta):
+def format_fasta_header(fasta, out=sys.stdout, threads=1):
     """
     Format I need to make
     >ENSP00000479374.1 | Symbols:  | T cell-interacting, activating receptor on myeloid cells 1  |
@@ -110,43 +166,8 @@ def format_fasta_header(fasta):
     >ENSP00000484596.1 | Symbols:  | Homo sapiens uncharacterized LOC389831 (LOC389831), transcript variant 3, mRNA.  |
     """
 
-    # write the fasta information to file
-    fasta_base = os.path.basename(fasta)
-    # process the fasta
-    print_rest = False
-    with open(fasta, "r") as filehandle:
-        for line in filehandle:
-            line = line.rstrip("\n")
-            # remove blank and comments
-            if re.match(r"^\s*$", line) or line.startswith("#"):
-                pass
-            elif line.startswith(">"):
-                header = get_header(line)
-                gene = get_gene(line)
-                gene_biotype = get_gene_biotype(line)
-                transcript_biotype = get_transcript_biotype(line)
-                # only worry about protein_coding at gene and transcript level
-                if (
-                    gene_biotype == "protein_coding"
-                    and transcript_biotype == "protein_coding"
-                ):
-                    description = get_description(line)
-                    if description != "Unknown function":
-                        print_rest = True
-                        # print("\t".join([header, gene, gene_biotype, transcript_biotype, description]))
-                        # create format
-                        # >ENSOABP00000000006.1 | Symbols:  | zgc:77880 (Source:ZFIN;Acc:ZDB-GENE-040426-1901)  |
-                        # >ENSOABP00000000014.1 | Symbols:  | FERM domain containing 7 (Source:HGNC Symbol;Acc:HGNC:8079)  |
-                        print(
-                            f">{header} | Symbols:  | {description.replace('[','(').replace(']',')')}  |"
-                        )
-                    else:
-                        print_rest = False
-                else:
-                    print_rest = False
-            else:
-                if print_rest:
-                    print(line)
+    # process the fasta, in byte ranges of whole records on threads worker processes
+    transform_fasta(fasta, ahrd_header, out, threads=threads)
 
 
 def main():
@@ -169,9 +190,15 @@ def main():
         nargs="?",
         help="Provide protein fasta file [ensembl.pep.all.fa]",
     )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of worker processes formatting ranges of the fasta file (default: %(default)s)",
+    )
     args = parser.parse_args()
     fasta = args.fasta
-    format_fasta_header(fasta)
+    format_fasta_header(fasta, threads=args.threads)
 
 
 if __name__ == "__main__":
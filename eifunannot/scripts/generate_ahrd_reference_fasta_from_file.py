@@ -12,9 +12,10 @@ from argparse import RawTextHelpFormatter
 import os
 import sys
 import logging
-from collections import defaultdict
+import sqlite3
 
 from eifunannot import __version__, __author__, __email__
+from eifunannot.scripts.fasta_ranges import transform_fasta
 
 # change logging format - https://realpython.com/python-logging/
 # format is - time, process_id, user, log level, message
@@ -36,50 +37,186 @@ except AssertionError:
 script = os.path.basename(sys.argv[0])
 
 
+class AnnotationIndex:
+    """
+    Fasta header to (description, symbol) lookup of an annotation tsv file, kept in an
+    on-disk SQLite database that is reused until the tsv file or its columns change
+    """
+
+    # arguments the annotations are read with, stored in the meta table of the index
+    COLUMNS = ("annotation_tsv", "id", "description", "symbol")
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    @classmethod
+    def from_tsv(cls, args, path):
+        """
+        Open the index of args.annotation_tsv, (re)building it if it is older than the
+        file or was built from other columns
+        """
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(
+            args.annotation_tsv
+        ):
+            cls.build(args, path)
+        elif cls.columns(path) != cls.arguments(args):
+            logging.info(
+                f"The annotation index '{path}' was built from other columns, rebuilding it"
+            )
+            cls.build(args, path)
+        else:
+            logging.info(
+                f"Using the annotation index '{path}' of '{args.annotation_tsv}'"
+            )
+        return cls(path)
+
+    @classmethod
+    def arguments(cls, args):
+        return {key: str(getattr(args, key)) for key in cls.COLUMNS}
+
+    @staticmethod
+    def columns(path):
+        # arguments the index was built with, empty for an index without a meta table
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return dict(db.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError:
+            return {}
+        finally:
+            db.close()
+
+    @classmethod
+    def build(cls, args, path):
+        logging.info(
+            f"Build the annotation index '{path}' from '{args.annotation_tsv}' ... "
+        )
+        if os.path.exists(f"{path}.tmp"):
+            os.remove(f"{path}.tmp")
+        db = sqlite3.connect(f"{path}.tmp")
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute(
+            "CREATE TABLE annotations (id TEXT PRIMARY KEY, description TEXT, symbol TEXT) WITHOUT ROWID"
+        )
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.executemany("INSERT INTO meta VALUES (?, ?)", cls.arguments(args).items())
+        for num, line, header, description, symbol in iter_annotations(args):
+            try:
+                db.execute(
+                    "INSERT INTO annotations VALUES (?, ?, ?)",
+                    (header, description, symbol),
+                )
+            except sqlite3.IntegrityError:
+                db.close()
+                os.remove(f"{path}.tmp")
+                duplicate_header(args, num, line, header)
+        db.commit()
+        db.close()
+        os.replace(f"{path}.tmp", path)
+        logging.info("Done")
+
+    def __getstate__(self):
+        # worker processes reopen the same database read only
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def get(self, header):
+        return self.db.execute(
+            "SELECT description, symbol FROM annotations WHERE id = ?", (header,)
+        ).fetchone()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM annotations").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+
+def iter_annotations(args):
+    """
+    Yield line number, line, header, description and symbol of each annotation tsv line
+    """
+    with open(args.annotation_tsv, "r") as fh:
+        for num, line in enumerate(fh, 1):
+            line = line.rstrip("\n")
+            # remove comments
+            if line.startswith("#"):
+                continue
+            # make sure that we atleast have more than two columns:
+            # 1. id column
+            # 2. description file
+            x = line.split("\t")
+            if len(x) < 3:
+                continue
+
+            # get the main columns
+            header = x[args.id - 1]
+            if not header:
+                logging.warning(
+                    f"Fasta header '{header}' is not defined in line '{num}' column number '{args.id}' below:"
+                    f"\n{line}\nPlease correct the '{args.annotation_tsv}' file."
+                )
+                continue
+            description = x[args.description - 1]
+            if description == None or description == "":
+                description = "Unknown"
+            symbol = x[args.symbol - 1] if args.symbol else None
+            yield num, line, header, description, symbol
+
+
+def duplicate_header(args, num, line, header):
+    logging.error(
+        f"Duplicate header '{header}' encountered in line '{num}' below:"
+        f"\n{line}\nPlease correct the '{args.annotation_tsv}' file."
+    )
+    sys.exit(1)
+
+
 class GenerateAHRDReferenceFasta(object):
     def __init__(self, args):
         self.args = args
-        self.id_info = defaultdict(dict)
+        # header to (description, symbol), in memory or in the --index database
+        self.id_info = {}
 
     def parse_file(self):
-        with open(self.args.annotation_tsv, "r") as fh:
-            for num, line in enumerate(fh, 1):
-                line = line.rstrip("\n")
-                # remove comments
-                if line.startswith("#"):
-                    continue
-                # make sure that we atleast have more than two columns:
-                # 1. id column
-                # 2. description file
-                x = line.split("\t")
-                if len(x) < 3:
-                    continue
-
-                # get the main columns
-                header = x[self.args.id - 1]
-                if not header:
-                    logging.warning(
-                        f"Fasta header '{header}' is not defined in line '{num}' column number '{self.args.id}' below:"
-                        f"\n{line}\nPlease correct the '{self.args.annotation_tsv}' file."
-                    )
-                    continue
-                description = x[self.args.description - 1]
-                if description == None or description == "":
-                    description = "Unknown"
-                symbol = x[self.args.symbol - 1] if self.args.symbol else None
-
-                if header not in self.id_info:
-                    self.id_info[header]["header"] = header
-                    self.id_info[header]["description"] = description
-                    self.id_info[header]["symbol"] = symbol
-                else:
-                    logging.error(
-                        f"Duplicate header '{header}' encountered in line '{num}' below:"
-                        f"\n{line}\nPlease correct the '{self.args.annotation_tsv}' file."
-                    )
-                    sys.exit(1)
-
-    def format_fasta_header(self):
+        if self.args.index:
+            self.id_info = AnnotationIndex.from_tsv(self.args, self.args.index)
+            return
+        for num, line, header, description, symbol in iter_annotations(self.args):
+            if header not in self.id_info:
+                self.id_info[header] = (description, symbol)
+            else:
+                duplicate_header(self.args, num, line, header)
+
+    def lookup(self, header):
+        # (description, symbol) of a fasta header in the annotation tsv file, None otherwise
+        return self.id_info.get(header)
+
+    def get_ahrd_header(self, header, info=None):
+        # AHRD header of a fasta header in the annotation tsv file, None otherwise
+        if info is None:
+            info = self.lookup(header)
+            if info is None:
+                return None
+        description, symbol = info
+        if self.args.symbol:
+            return f">{header} | Symbols: {symbol} | {description} |"
+        return f">{header} | Symbols:  | {description} ({symbol})  |"
+
+    def ahrd_header(self, line):
+        # header transform of transform_fasta, with the line of the information file
+        # get fasta header alone
+        header = line.split(" ")[0].replace(">", "")
+        # check the gene in the fasta_info dictionary
+        info = self.lookup(header)
+        if info is None:
+            return None
+        return self.get_ahrd_header(header, info), f"{header}\t{info[0]}\t{info[1]}"
+
+    def format_fasta_header(self, out=sys.stdout):
         """
         Format I need to make
         >YP_009370001.1 | Symbols: psbA | photosystem II protein D1 |
@@ -96,43 +233,22 @@ class GenerateAHRDReferenceFasta(object):
         with open(fasta_txt, "w") as writer:
             writer.write(f"#Protein\t#Function\t#Symbol\n")
 
-            # process the fasta
-            with open(self.args.fasta, "r") as fh:
-                for line in fh:
-                    line = line.rstrip("\n")
-                    if line.startswith(">"):
-                        # get fasta header alone
-                        try:
-                            header = line.split(" ")[0].replace(">", "")
-                        except:
-                            raise ValueError(
-                                f"Cannot extract fasta header from the fasta file '{self.args.fasta}' line below:\n{line}\n"
-                            )
-                        # check the gene in the fasta_info dictionary
-                        if header in self.id_info:
-                            if self.args.symbol:
-                                print(
-                                    f">{header} | Symbols: {self.id_info[header]['symbol']} | {self.id_info[header]['description']} |"
-                                )
-                            else:
-                                print(
-                                    f">{header} | Symbols:  | {self.id_info[header]['description']} ({self.id_info[header]['symbol']})  |"
-                                )
-
-                            writer.write(
-                                f"{header}\t{self.id_info[header]['description']}\t{self.id_info[header]['symbol']}\n"
-                            )
-                        else:
-                            logging.error(
-                                f"Fasta header '{header}' information not present in the '{self.args.annotation_tsv}' file"
-                            )
-                    else:
-                        print(line)
+            # process the fasta, in byte ranges of whole records on worker processes
+            records, kept, dropped = transform_fasta(
+                self.args.fasta, self.ahrd_header, out, writer, self.args.threads
+            )
+        if records > kept:
+            missing_examples = [line.split(" ")[0][1:] for line in dropped]
+            logging.error(
+                f"{records - kept} fasta headers information not present in the '{self.args.annotation_tsv}' file, for example: {', '.join(missing_examples)}"
+            )
         logging.warning(f"#Fasta information is written to file '{fasta_txt}'")
 
     def run(self):
         self.parse_file()
         self.format_fasta_header()
+        if self.args.index:
+            self.id_info.close()
 
 
 def main():
@@ -165,6 +281,16 @@ def main():
         type=int,
         help="Provide the column number in the annotation tsv file that match the functional description symbol, for e.g., column in the annotation tsv file that has 'psbA'",
     )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of worker processes formatting ranges of the fasta file (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--index",
+        help="Look the fasta headers up in this on-disk SQLite index of the annotation tsv file instead of loading the file in memory, for large annotation files. The index is built when missing, older than the annotation tsv file or built from other --annotation_tsv, --id, --description or --symbol values, and reused otherwise",
+    )
     args = parser.parse_args()
 
     GenerateAHRDReferenceFasta(args).run()
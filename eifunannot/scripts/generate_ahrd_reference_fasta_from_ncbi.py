@@ -14,8 +14,10 @@ import os
 import re
 import sys
 import logging
+from functools import partial
 
 from eifunannot import __version__, __author__, __email__
+from eifunannot.scripts.fasta_ranges import transform_fasta
 
 
 # change logging format - https://realpython.com/python-logging/
@@ -86,8 +88,41 @@ def get_description(line):
     return description
 
 
+def parse_curated(line, keep_XP):
+    """Get the header and description of a protein to keep
+
+    Returns:
+        (header, description) of NP_* proteins, or of all proteins with keep_XP,
+        None for the other proteins and those without a description
+
+    Examples:
+        >>> parse_curated(">NP_001267818.1 acyl-CoA delta-9 desaturase [Bombus terrestris]", False)
+        ('NP_001267818.1', 'acyl-CoA delta-9 desaturase')
+        >>> parse_curated(">XP_003393040.1 bis(5'-nucleosyl)-tetraphosphatase [asymmetrical] [Bombus terrestris]", False)
+    """
+    header = get_header(line)
+    # print curated protein with NP prefix, or non-curated proteins too with keep_XP
+    if keep_XP or header.startswith("NP"):
+        description = get_description(line)
+        if description != "Unknown function":
+            return header, description
+    return None
+
+
+def ahrd_header(line, keep_XP):
+    # header transform of transform_fasta
+    protein = parse_curated(line, keep_XP)
+    if protein is None:
+        return None
+    header, description = protein
+    return (
+        f">{header} | Symbols:  | {description.replace('[','(').replace(']',')')}  |",
+        None,
+    )
+
+
 # format_fasta_header
-def format_fasta_header(fasta, keep_XP):
+def format_fasta_header(fasta, keep_XP, out=sys.stdout, threads=1):
     """
     Format I need to make
     >ENSP00000479374.1 | Symbols:  | T cell-interacting, activating receptor on myeloid cells 1  |
@@ -95,41 +130,8 @@ def format_fasta_header(fasta, keep_XP):
     >ENSP00000484596.1 | Symbols:  | Homo sapiens uncharacterized LOC389831 (LOC389831), transcript variant 3, mRNA.  |
     """
 
-    # process the fasta
-    print_rest = False
-    with open(fasta, "r") as filehandle:
-        for line in filehandle:
-            line = line.rstrip("\n")
-            # remove blank and comments
-            if re.match(r"^\s*$", line) or line.startswith("#"):
-                pass
-            elif line.startswith(">"):
-                header = get_header(line)
-                # print curated protein with NP prefix
-                if header.startswith("NP") and not keep_XP:
-                    description = get_description(line)
-                    if description != "Unknown function":
-                        print_rest = True
-                        print(
-                            f">{header} | Symbols:  | {description.replace('[','(').replace(']',')')}  |"
-                        )
-                    else:
-                        print_rest = False
-                # print non-curated proteins
-                elif keep_XP:
-                    description = get_description(line)
-                    if description != "Unknown function":
-                        print_rest = True
-                        print(
-                            f">{header} | Symbols:  | {description.replace('[','(').replace(']',')')}  |"
-                        )
-                    else:
-                        print_rest = False
-                else:
-                    print_rest = False
-            else:
-                if print_rest:
-                    print(line)
+    # process the fasta, in byte ranges of whole records on threads worker processes
+    transform_fasta(fasta, partial(ahrd_header, keep_XP=keep_XP), out, threads=threads)
 
 
 def main():
@@ -157,10 +159,16 @@ def main():
         action="store_true",
         help="By default all XP_* fasta prefix are ignored and only NP_* fasta prefix protein descriptions are used (default: %(default)s)",
     )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of worker processes formatting ranges of the fasta file (default: %(default)s)",
+    )
     args = parser.parse_args()
     fasta = args.fasta
     keep_XP = args.keep_XP
-    format_fasta_header(fasta, keep_XP)
+    format_fasta_header(fasta, keep_XP, threads=args.threads)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On disk store of the manually curated UniProt isoform sequences (uniprot_sprot_varsplic)
+
+The isoforms are written with unwrapped sequences to the store file, grouped by the
+accession of their canonical entry, and the index file lists the byte ranges of each
+accession. Only the index is kept in memory, the isoforms of an accession are read
+with os.pread when they are needed.
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+# import libraries
+import gzip
+import logging
+import os
+import re
+
+INDEX_SUFFIX = ".idx"
+
+# from:
+# >sp|Q9S9Z8-2|14311_ARATH Isoform 2 of 14-3-3-like protein GF14 omicron OS=Arabidopsis thaliana OX=3702 GN=GRF11
+# get:
+# acc = Q9S9Z8
+# fln script only matches to 9 splice variants with regex
+# (^>\w+\|(\w+)\-\d\|.+)
+# I am modifying it to all splice variants
+# (^>\w+\|(\w+)\-\d+\|.+)
+
+# for example, the above regex matches all below
+# >sp|P05067-9|A4_HUMAN Isoform L-APP752 of Amyloid-beta precursor protein OS=Homo sapiens OX=9606 GN=APP
+# >sp|P05067-10|A4_HUMAN Isoform APP639 of Amyloid-beta precursor protein OS=Homo sapiens OX=9606 GN=APP -- SKIPPED BY FLN RUBY SCRIPT
+# >sp|P05067-11|A4_HUMAN Isoform 11 of Amyloid-beta precursor protein OS=Homo sapiens OX=9606 GN=APP -- SKIPPED BY FLN RUBY SCRIPT
+re_isoform = re.compile(r"^>\w+\|(\w+)\-\d+\|.+")
+
+
+def open_text(path):
+    # gzip compressed files are decompressed while they are read
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf8")
+    return open(path, "r", encoding="utf8")
+
+
+class IsoformStore:
+    """
+    Mapping of accession to the text of its isoforms, '>header\\nsequence' joined
+    with newlines
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        with open(f"{path}{INDEX_SUFFIX}", "r") as fh:
+            for line in fh:
+                acc, offset, length = line.split("\t")
+                self.index.setdefault(acc, []).append((int(offset), int(length)))
+        self.fd = os.open(path, os.O_RDONLY)
+
+    @classmethod
+    def from_fasta(cls, isoform_file, path):
+        """
+        Open the store of isoform_file, (re)building it if it is older than the file
+        """
+        index = f"{path}{INDEX_SUFFIX}"
+        if not os.path.exists(index) or os.path.getmtime(index) < os.path.getmtime(
+            isoform_file
+        ):
+            cls.build(isoform_file, path)
+        else:
+            logging.info(f"Using the isoform store '{path}' of '{isoform_file}'")
+        return cls(path)
+
+    @staticmethod
+    def build(isoform_file, path):
+        logging.info(f"Build the isoform store '{path}' from '{isoform_file}' ... ")
+        index = f"{path}{INDEX_SUFFIX}"
+        acc = None
+        start = offset = 0
+        header = None
+        seq = []
+        with open_text(isoform_file) as fh, open(f"{path}.tmp", "wb") as out, open(
+            f"{index}.tmp", "w"
+        ) as index_fh:
+
+            def write_isoform():
+                # one isoform, extending the byte range of its accession
+                nonlocal offset
+                offset += out.write(f"{header}\n{''.join(seq)}\n".encode("utf8"))
+
+            for line in fh:
+                line = line.rstrip()
+                if line.startswith(">"):
+                    # All the splice variants gets added under the same 'acc'
+                    acc_match_region = re_isoform.search(line)
+                    if not acc_match_region:
+                        raise ValueError(
+                            f"Error: Could extract relevant information from fasta header line '{line}' of file '{isoform_file}'"
+                        )
+                    if header is not None:
+                        write_isoform()
+                    if acc_match_region.group(1) != acc:
+                        if acc is not None:
+                            index_fh.write(f"{acc}\t{start}\t{offset - start}\n")
+                        acc = acc_match_region.group(1)
+                        start = offset
+                    header = line
+                    seq = []
+                elif header is None:
+                    if line:
+                        raise ValueError(
+                            f"Error: Sequence line '{line}' before the first fasta header of file '{isoform_file}'"
+                        )
+                else:
+                    seq.append(line)
+            if header is not None:
+                write_isoform()
+                index_fh.write(f"{acc}\t{start}\t{offset - start}\n")
+        os.replace(f"{path}.tmp", path)
+        os.replace(f"{index}.tmp", index)
+        logging.info("Done")
+
+    def __contains__(self, acc):
+        return acc in self.index
+
+    def __getitem__(self, acc):
+        text = b"".join(
+            os.pread(self.fd, length, offset) for offset, length in self.index[acc]
+        )
+        # the isoforms end with a newline, the last one is added by the caller
+        return text[:-1].decode("utf8")
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        os.close(self.fd)
+
+    def __getstate__(self):
+        # worker processes get the index and open the store themselves
+        return {"path": os.path.abspath(self.path), "index": self.index}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.fd = os.open(self.path, os.O_RDONLY)
@@ -15,11 +15,15 @@ __maintainer__ = "Gemy George Kaithakottil"
 __email__ = "gemygk@gmail.com"
 
 import argparse
+from array import array
 from argparse import RawTextHelpFormatter
 from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
 import os
 import re
 import sys
+from eifunannot.scripts.blast_cache import read_cache, write_cache
 
 # get script name
 script = os.path.basename(sys.argv[0])
@@ -36,11 +40,9 @@ def merge_overlapping_intervals(coords):
     return merged
 
 
-def compute_blast_coverage(blast_tblr_output):
-    # compute blast coverage
-    blast_cov_info = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-    blast_info = defaultdict(dict)
-    for line in open(blast_tblr_output, encoding="utf8"):
+def iter_blast_hits(lines):
+    # parse blast tabular lines into (qseqid, sseqid, qstart, qend, sstart, send, qlen, slen)
+    for line in lines:
         if line and not re.match(r"^\s*$", line) and not line.startswith("#"):
             line = line.rstrip("\n")
             x = line.split("\t")
@@ -74,43 +76,129 @@ def compute_blast_coverage(blast_tblr_output):
             if int(sstart) > int(send):
                 sstart, send = send, sstart
             # print(qseqid, qlen, qstart, qend, sseqid, slen, sstart, send)
-            blast_info[qseqid]["qlen"] = qlen
-            blast_info[qseqid]["slen"] = slen
-            blast_cov_info[qseqid][sseqid]["qcoords"].append([int(qstart), int(qend)])
-            blast_cov_info[qseqid][sseqid]["scoords"].append([int(sstart), int(send)])
-    # print(blast_info)
-    # print(blast_cov_info)
-
-    # merge overlapping intervals
-    for qseqid in blast_cov_info:
-        for sseqid in blast_cov_info[qseqid]:
-            qcoords = blast_cov_info[qseqid][sseqid]["qcoords"]
-            scoords = blast_cov_info[qseqid][sseqid]["scoords"]
-            qcoords = merge_overlapping_intervals(qcoords)
-            scoords = merge_overlapping_intervals(scoords)
-            blast_cov_info[qseqid][sseqid]["qcoords"] = qcoords
-            blast_cov_info[qseqid][sseqid]["scoords"] = scoords
+            yield (
+                qseqid,
+                sseqid,
+                int(qstart),
+                int(qend),
+                int(sstart),
+                int(send),
+                qlen,
+                slen,
+            )
 
+
+# index of the per query coverage state, the coordinates are stored flat as qstart, qend, sstart, send
+SSEQID, COORDS, QLEN, SLEN, SEEN = range(5)
+
+
+def add_blast_hit(blast_cov_info, hit):
+    # only the coordinates of the last new subject of a query are kept, as it is the reported one
+    qseqid, sseqid, qstart, qend, sstart, send, qlen, slen = hit
+    state = blast_cov_info.get(qseqid)
+    if state is None:
+        blast_cov_info[qseqid] = [
+            sseqid,
+            array("l", (qstart, qend, sstart, send)),
+            qlen,
+            slen,
+            None,
+        ]
+        return
+    if sseqid == state[SSEQID]:
+        state[COORDS].extend((qstart, qend, sstart, send))
+    elif state[SEEN] is None or sseqid not in state[SEEN]:
+        if state[SEEN] is None:
+            state[SEEN] = {state[SSEQID]}
+        state[SEEN].add(sseqid)
+        state[SSEQID] = sseqid
+        state[COORDS] = array("l", (qstart, qend, sstart, send))
+    # query and subject length are taken from the last hit of the query
+    state[QLEN] = qlen
+    state[SLEN] = slen
+
+
+def summarise_query_coverage(state):
     # compute query and subject coverage
+    coords = state[COORDS]
+    qlen = int(state[QLEN])
+    slen = int(state[SLEN])
+    qcoords = [[coords[i], coords[i + 1]] for i in range(0, len(coords), 4)]
+    scoords = [[coords[i + 2], coords[i + 3]] for i in range(0, len(coords), 4)]
+    qcov = 0
+    for qcoord in merge_overlapping_intervals(qcoords):
+        qcov += qcoord[1] - qcoord[0] + 1
+    qper = f"{round(qcov / qlen * 100, 2):.2f}"
+    scov = 0
+    for scoord in merge_overlapping_intervals(scoords):
+        scov += scoord[1] - scoord[0] + 1
+    sper = f"{round(scov / slen * 100, 2):.2f}"
+    return {
+        "qlen": state[QLEN],
+        "slen": state[SLEN],
+        "qcov": qcov,
+        "qper": qper,
+        "sseqid": state[SSEQID],
+        "scov": scov,
+        "sper": sper,
+    }
+
+
+def compute_query_coverage(hits):
+    # compute coverage for all the hits of a single query, in file order
+    blast_cov_info = {}
+    for hit in hits:
+        add_blast_hit(blast_cov_info, hit)
+    (state,) = blast_cov_info.values()
+    return summarise_query_coverage(state)
+
+
+def parse_blast_coverage(blast_tblr_output):
+    # collect the per query coverage state
+    blast_cov_info = {}
+    lengths = {}  # share the repeated length strings
+    with open(blast_tblr_output, encoding="utf8") as fh:
+        for hit in iter_blast_hits(fh):
+            hit = hit[:6] + (
+                lengths.setdefault(hit[6], hit[6]),
+                lengths.setdefault(hit[7], hit[7]),
+            )
+            add_blast_hit(blast_cov_info, hit)
+    return blast_cov_info
+
+
+def compute_blast_coverage(blast_tblr_output):
+    # compute blast coverage
+    blast_cov_info = parse_blast_coverage(blast_tblr_output)
+    blast_info = defaultdict(dict)
     for qseqid in blast_cov_info:
-        qlen = int(blast_info[qseqid]["qlen"])
-        for sseqid in blast_cov_info[qseqid]:
-            slen = int(blast_info[qseqid]["slen"])
-            qcoords = blast_cov_info[qseqid][sseqid]["qcoords"]
-            scoords = blast_cov_info[qseqid][sseqid]["scoords"]
-            qcov = 0
-            for qcoord in qcoords:
-                qcov += qcoord[1] - qcoord[0] + 1
-            qper = f"{round(qcov / qlen * 100, 2):.2f}"
-            scov = 0
-            for scoord in scoords:
-                scov += scoord[1] - scoord[0] + 1
-            sper = f"{round(scov / slen * 100, 2):.2f}"
-            blast_info[qseqid]["qcov"] = qcov
-            blast_info[qseqid]["qper"] = qper
-            blast_info[qseqid]["sseqid"] = sseqid
-            blast_info[qseqid]["scov"] = scov
-            blast_info[qseqid]["sper"] = sper
+        blast_info[qseqid] = summarise_query_coverage(blast_cov_info[qseqid])
+    return blast_info
+
+
+def pop_blast_coverage(blast_tblr_output):
+    # compute blast coverage, releasing the parsed state as it goes. Yields (qseqid, coverage) in no particular order
+    blast_cov_info = parse_blast_coverage(blast_tblr_output)
+    while blast_cov_info:
+        qseqid, state = blast_cov_info.popitem()
+        yield qseqid, summarise_query_coverage(state)
+
+
+def iter_blast_coverage(lines):
+    # compute blast coverage from blast tabular lines grouped by query, yields (qseqid, coverage)
+    for qseqid, hits in groupby(iter_blast_hits(lines), key=itemgetter(0)):
+        yield qseqid, compute_query_coverage(hits)
+
+
+def load_blast_coverage(blast_tblr_output, use_cache=False):
+    # reuse the binary cache next to the blast tabular file, if valid
+    if use_cache:
+        blast_info = read_cache(blast_tblr_output)
+        if blast_info is not None:
+            return blast_info
+    blast_info = compute_blast_coverage(blast_tblr_output)
+    if use_cache:
+        write_cache(blast_tblr_output, blast_info)
     return blast_info
 
 
@@ -132,8 +220,13 @@ def main():
         help="Provide blast tabular output, see note below for recommended format",
         required=True,
     )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse or create a binary cache of the parsed blast coverage next to the blast tabular output. The cache is recomputed when the blast tabular output changes (default: %(default)s)",
+    )
     args = parser.parse_args()
-    blast_info = compute_blast_coverage(args.blast_tblr_output)
+    blast_info = load_blast_coverage(args.blast_tblr_output, args.cache)
     # print header
     print("#qseqid", "#qlen", "#qcov", "#qcov_percent", "#sseqid", "#slen", "#scov", "#scov_percent", sep="\t")
     for qseqid in blast_info:
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Split a memory mapped text file into byte ranges of whole records, to process the
+ranges in parallel and concatenate the results in order
+
+A record boundary is a line starting with a marker, either the last line of a record
+('//' of UniProt .dat files, after=True) or the first ('>' of FASTA files,
+after=False). Only the bytes around each split point are read to find the boundaries.
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+# import libraries
+import io
+import mmap
+import os
+
+# split large files into ranges of about this many bytes, to bound worker memory
+RANGE_SIZE = 64 << 20
+
+
+def record_ranges(path, parts, marker, after=True):
+    """
+    Split path into at most parts (start, end) byte ranges ending at record boundaries
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    ranges = []
+    start = 0
+    with open(path, "rb") as fh, mmap.mmap(
+        fh.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        for part in range(1, parts):
+            # the boundary is the first marker line starting at or after the split point
+            position = max(size * part // parts, start)
+            found = mm.find(b"\n" + marker, max(position - 1, 0))
+            if found == -1:
+                break
+            boundary = found + 1
+            if after:
+                line_end = mm.find(b"\n", boundary)
+                boundary = size if line_end == -1 else line_end + 1
+            if boundary >= size:
+                break
+            if boundary > start:
+                ranges.append((start, boundary))
+                start = boundary
+    ranges.append((start, size))
+    return ranges
+
+
+def read_range(path, byte_range):
+    """
+    Text lines of one byte range of path, with universal newlines as in open()
+    """
+    start, end = byte_range
+    with open(path, "rb") as fh, mmap.mmap(
+        fh.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        return io.StringIO(mm[start:end].decode("utf8"), newline=None)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact column oriented storage for namedtuple records keyed on their first field
+
+Low cardinality columns (quality codes, biotypes, descriptions, ...) are dictionary
+encoded into an integer array with a table of their distinct values. The remaining
+string columns are packed into a single UTF-8 buffer with an offset and a length
+array, instead of one Python string object per value. Keys are interned so that
+the same transcript id loaded into several stores is only held once. Records are
+rebuilt on access.
+
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+# import libraries
+import sys
+from array import array
+
+
+class CategoricalColumn:
+    """
+    Dictionary encoded column, any hashable value (including None)
+    """
+
+    def __init__(self):
+        self.levels = []
+        self.codes = {}
+        self.values = array("I")
+
+    def _encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.levels)
+            self.levels.append(value)
+        return code
+
+    def append(self, value):
+        self.values.append(self._encode(value))
+
+    def __setitem__(self, row, value):
+        self.values[row] = self._encode(value)
+
+    def __getitem__(self, row):
+        return self.levels[self.values[row]]
+
+
+class TextColumn:
+    """
+    Column of strings (or None) packed into a single UTF-8 buffer
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.starts = array("Q")
+        self.lengths = array("i")  # -1 for None
+
+    def _pack(self, value):
+        if value is None:
+            return 0, -1
+        data = value.encode("utf8")
+        start = len(self.buffer)
+        self.buffer += data
+        return start, len(data)
+
+    def append(self, value):
+        start, length = self._pack(value)
+        self.starts.append(start)
+        self.lengths.append(length)
+
+    def __setitem__(self, row, value):
+        # the previous value is left behind in the buffer
+        self.starts[row], self.lengths[row] = self._pack(value)
+
+    def __getitem__(self, row):
+        length = self.lengths[row]
+        if length < 0:
+            return None
+        start = self.starts[row]
+        return self.buffer[start : start + length].decode("utf8")
+
+
+class RecordStore:
+    """
+    Dict-like store of namedtuple records keyed on their first field
+
+    Args:
+        record_type: namedtuple class of the stored records
+        categorical: field names to dictionary encode, all other fields must be str or None
+    """
+
+    def __init__(self, record_type, categorical=()):
+        self.record_type = record_type
+        unknown = set(categorical) - set(record_type._fields[1:])
+        if unknown:
+            raise ValueError(
+                f"Unknown field(s) {', '.join(sorted(unknown))} for record type '{record_type.__name__}'"
+            )
+        self._rows = {}  # key -> row number
+        self._columns = [
+            CategoricalColumn() if field in categorical else TextColumn()
+            for field in record_type._fields[1:]
+        ]
+
+    def __setitem__(self, key, record):
+        if record[0] != key:
+            raise ValueError(
+                f"Record key '{record[0]}' does not match the store key '{key}'"
+            )
+        row = self._rows.get(key)
+        if row is None:
+            key = sys.intern(key)
+            self._rows[key] = len(self._rows)
+            for column, value in zip(self._columns, record[1:]):
+                column.append(value)
+        else:
+            for column, value in zip(self._columns, record[1:]):
+                column[row] = value
+
+    def _record(self, key, row):
+        return self.record_type(key, *(column[row] for column in self._columns))
+
+    def __getitem__(self, key):
+        return self._record(key, self._rows[key])
+
+    def get(self, key, default=None):
+        row = self._rows.get(key)
+        if row is None:
+            return default
+        return self._record(key, row)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def items(self):
+        for key, row in self._rows.items():
+            yield key, self._record(key, row)
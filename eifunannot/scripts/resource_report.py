@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resource usage of the eifunannot rules, from the '/usr/bin/time -v' output in their
+logs (logs/cluster/<rule>[.<chunk>].log)
+
+For each rule and chunk the report has the wall time, CPU use, maximum resident set
+size and file system I/O. It flags the stragglers, chunks whose wall time is more
+than a factor of the median of their rule, the rules using much less memory or
+fewer cores than they request in the cluster config, and suggests cluster config
+memory requests from the observed usage.
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+# import libraries
+import glob
+import json
+import math
+import os
+import statistics
+
+# rules whose log name is not the rule name
+LOG_RULES = {"interproscan": "interproscan_5_22_61"}
+# the cluster config memory requests are rounded up to multiples of this (MB)
+MEM_STEP = 1024
+# lowest memory requests (MB) of the rules with a fixed heap, 'java -Xmx10g' of ahrd
+RULE_MIN_MEM = {"ahrd": 12288}
+# bytes of a file system input or output counted by time
+BLOCK_SIZE = 512
+
+# '/usr/bin/time -v' fields used, and their keys
+TIME_FIELDS = {
+    "Command being timed": "command",
+    "User time (seconds)": "user_s",
+    "System time (seconds)": "system_s",
+    "Elapsed (wall clock) time (h:mm:ss or m:ss)": "wall_s",
+    "Maximum resident set size (kbytes)": "max_rss_kb",
+    "File system inputs": "fs_inputs",
+    "File system outputs": "fs_outputs",
+    "Exit status": "exit_status",
+}
+
+
+def parse_wall_time(value):
+    """
+    Seconds of a h:mm:ss or m:ss wall clock time
+
+    Examples:
+        >>> parse_wall_time("1:02:03")
+        3723.0
+        >>> parse_wall_time("0:05.32")
+        5.32
+    """
+    seconds = 0.0
+    for field in value.split(":"):
+        seconds = seconds * 60 + float(field)
+    return seconds
+
+
+def parse_time_log(log):
+    """
+    Usage of the commands timed in log, one dictionary per '/usr/bin/time -v' output
+    """
+    commands = []
+    with open(log, "r", errors="replace") as fh:
+        for line in fh:
+            # the command may contain ": ", none of the keys do
+            key, sep, value = line.strip().partition(": ")
+            if not sep:
+                continue
+            if key == "Command being timed":
+                commands.append({"command": value.strip('"')})
+                continue
+            if not commands or key not in TIME_FIELDS:
+                continue
+            field = TIME_FIELDS[key]
+            try:
+                if field == "wall_s":
+                    commands[-1][field] = parse_wall_time(value)
+                elif field in ("user_s", "system_s"):
+                    commands[-1][field] = float(value)
+                else:
+                    commands[-1][field] = int(value)
+            except ValueError:
+                # missing values are counted as 0
+                pass
+    return commands
+
+
+def log_usage(log):
+    """
+    Rule, chunk and usage of all the commands timed in log, None if there are none
+    """
+    commands = parse_time_log(log)
+    if not commands:
+        return None
+    name = os.path.basename(log)[: -len(".log")]
+    rule, _, chunk = name.partition(".")
+    wall_s = sum(command.get("wall_s", 0) for command in commands)
+    cpu_s = sum(
+        command.get("user_s", 0) + command.get("system_s", 0) for command in commands
+    )
+    return {
+        "rule": LOG_RULES.get(rule, rule),
+        "chunk": chunk,
+        "log": log,
+        "commands": len(commands),
+        "wall_s": wall_s,
+        "cpu_s": cpu_s,
+        "cpu_percent": round(cpu_s / wall_s * 100) if wall_s else 0,
+        "max_rss_mb": max(command.get("max_rss_kb", 0) for command in commands) / 1024,
+        "read_mb": sum(command.get("fs_inputs", 0) for command in commands)
+        * BLOCK_SIZE
+        / (1 << 20),
+        "write_mb": sum(command.get("fs_outputs", 0) for command in commands)
+        * BLOCK_SIZE
+        / (1 << 20),
+        "exit_status": max(command.get("exit_status", 0) for command in commands),
+    }
+
+
+def collect_usage(logs_dir):
+    """
+    Usage of all the rule logs in logs_dir, sorted by rule and chunk
+    """
+    usage = []
+    for log in glob.iglob(os.path.join(logs_dir, "*.log")):
+        row = log_usage(log)
+        if row is not None:
+            usage.append(row)
+    usage.sort(key=lambda row: (row["rule"], chunk_key(row["chunk"])))
+    return usage
+
+
+def chunk_key(chunk):
+    # chunk_2 before chunk_10
+    return [
+        (0, int(field), "") if field.isdigit() else (1, 0, field)
+        for field in chunk.replace("_", ".").split(".")
+    ]
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def rule_config(cluster_config, rule):
+    # cluster config of a rule, with the __default__ values
+    return {**cluster_config.get("__default__", {}), **cluster_config.get(rule, {})}
+
+
+def summarise(
+    usage, cluster_config, straggler=2.0, headroom=1.2, min_mem_use=0.5, min_cpu_use=0.5
+):
+    """
+    Per rule summary, stragglers, and suggested cluster config of the rules in usage
+    """
+    rules = {}
+    for row in usage:
+        rules.setdefault(row["rule"], []).append(row)
+    summary = {}
+    stragglers = []
+    suggested = json.loads(json.dumps(cluster_config))
+    for rule, rows in rules.items():
+        walls = [row["wall_s"] for row in rows]
+        median = statistics.median(walls)
+        max_rss_mb = max(row["max_rss_mb"] for row in rows)
+        config = rule_config(cluster_config, rule)
+        mem = config.get("mem")
+        cores = config.get("c", 1)
+        max_cpu_percent = max(row["cpu_percent"] for row in rows)
+        suggested_mem = max(
+            RULE_MIN_MEM.get(rule, MEM_STEP),
+            math.ceil(max_rss_mb * headroom / MEM_STEP) * MEM_STEP,
+        )
+        flags = []
+        if mem and max_rss_mb < mem * min_mem_use:
+            flags.append(
+                f"memory over-provisioned ({max_rss_mb:.0f} MB used of {mem} MB)"
+            )
+        if mem and max_rss_mb > mem:
+            flags.append(f"memory above request ({max_rss_mb:.0f} MB of {mem} MB)")
+        if cores > 1 and max_cpu_percent < cores * 100 * min_cpu_use:
+            flags.append(
+                f"cores under-used (at most {max_cpu_percent:.0f}% CPU of {cores} cores)"
+            )
+        if any(row["exit_status"] for row in rows):
+            flags.append("failed commands")
+        if len(rows) >= 3:
+            for row in rows:
+                if median and row["wall_s"] > straggler * median:
+                    stragglers.append(
+                        {**row, "median_s": median, "ratio": row["wall_s"] / median}
+                    )
+        summary[rule] = {
+            "chunks": len(rows),
+            "median_wall_s": median,
+            "max_wall_s": max(walls),
+            "total_cpu_h": sum(row["cpu_s"] for row in rows) / 3600,
+            "max_cpu_percent": max_cpu_percent,
+            "max_rss_mb": max_rss_mb,
+            "mem": mem,
+            "suggested_mem": suggested_mem,
+            "flags": flags,
+        }
+        if rule in suggested or mem is not None:
+            suggested.setdefault(rule, {})["mem"] = suggested_mem
+    return summary, stragglers, suggested
+
+
+def write_usage_tsv(usage, tsv):
+    keys = [
+        "rule",
+        "chunk",
+        "wall_s",
+        "cpu_s",
+        "cpu_percent",
+        "max_rss_mb",
+        "read_mb",
+        "write_mb",
+        "exit_status",
+        "commands",
+        "log",
+    ]
+    with open(tsv, "w") as out:
+        out.write("#" + "\t#".join(keys) + "\n")
+        for row in usage:
+            out.write(
+                "\t".join(
+                    f"{row[key]:.1f}" if isinstance(row[key], float) else str(row[key])
+                    for key in keys
+                )
+                + "\n"
+            )
+
+
+def report_text(usage, summary, stragglers):
+    lines = [
+        "Per chunk usage:",
+        f"{'rule':<28}{'chunk':<22}{'wall':>10}{'CPU%':>7}{'maxRSS_MB':>11}{'read_MB':>10}{'write_MB':>10}{'exit':>6}",
+    ]
+    for row in usage:
+        lines.append(
+            f"{row['rule']:<28}{row['chunk']:<22}{format_duration(row['wall_s']):>10}"
+            f"{row['cpu_percent']:>7.0f}{row['max_rss_mb']:>11.0f}{row['read_mb']:>10.0f}"
+            f"{row['write_mb']:>10.0f}{row['exit_status']:>6}"
+        )
+    lines += [
+        "",
+        "Per rule summary:",
+        f"{'rule':<28}{'chunks':>7}{'median':>10}{'max':>10}{'CPU_h':>8}{'maxRSS_MB':>11}{'mem':>8}{'suggested':>11}",
+    ]
+    for rule, rule_summary in summary.items():
+        mem = "" if rule_summary["mem"] is None else rule_summary["mem"]
+        lines.append(
+            f"{rule:<28}{rule_summary['chunks']:>7}"
+            f"{format_duration(rule_summary['median_wall_s']):>10}"
+            f"{format_duration(rule_summary['max_wall_s']):>10}"
+            f"{rule_summary['total_cpu_h']:>8.1f}{rule_summary['max_rss_mb']:>11.0f}"
+            f"{mem:>8}{rule_summary['suggested_mem']:>11}"
+        )
+    flagged = [(rule, s["flags"]) for rule, s in summary.items() if s["flags"]]
+    if flagged:
+        lines += ["", "Flags:"]
+        for rule, flags in flagged:
+            lines += [f"{rule}: {flag}" for flag in flags]
+    if stragglers:
+        lines += ["", "Stragglers:"]
+        for row in stragglers:
+            lines.append(
+                f"{row['rule']} {row['chunk']}: {format_duration(row['wall_s'])}, {row['ratio']:.1f}x the median {format_duration(row['median_s'])} ({row['log']})"
+            )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Progress of a Snakemake run, parsed from its log while it runs
+
+The log lines are turned into events, written as JSON lines to the event log:
+
+    {"event": "job_counts", ...}  jobs per rule planned by Snakemake
+    {"event": "job_start", ...}   rule, jobid and wildcards of a submitted job
+    {"event": "job_finish", ...}  rule, jobid and duration of a finished job
+    {"event": "job_error", ...}   rule and jobid of a failed job
+    {"event": "steps", ...}       'N of M steps (P%) done'
+    {"event": "done", ...}        exit code and the per rule counts
+
+and summarised in a per rule table of done, running and failed jobs, with the ETA of
+the run at the rate of the steps done so far.
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+# import libraries
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from eifunannot.scripts.download_metrics import MetricsWriter
+
+# rule blastp:
+# localrule all:
+# checkpoint split_fasta:
+re_rule = re.compile(r"^(?:local)?(?:rule|checkpoint) (\S+):$")
+#     jobid: 12
+#     wildcards: protein=swissprot, sample=001
+re_job_field = re.compile(r"^\s+(jobid|wildcards): (.*)$")
+# Finished job 12.
+re_finished = re.compile(r"^Finished job (\d+)\.$")
+# Error in rule blastp:
+re_error = re.compile(r"^Error in rule (\S+):$")
+# Error executing rule blastp on cluster (jobid: 12, external: ...
+re_cluster_error = re.compile(r"^Error executing rule (\S+) on cluster \(jobid: (\d+)")
+# 5 of 40 steps (12%) done
+re_steps = re.compile(r"^(\d+) of (\d+) steps \((\d+)%\) done")
+# Job counts: (Snakemake <7) or Job stats: (Snakemake >=7), followed by the table
+re_job_table = re.compile(r"^Job (?:counts|stats):$")
+
+
+class SnakemakeProgress:
+    """
+    Parse Snakemake log lines with feed(), printing the progress table to out at
+    most every interval seconds
+    """
+
+    def __init__(self, events_file=None, out=sys.stdout, interval=60, dry_run=False):
+        self.writer = MetricsWriter(metrics_file=events_file)
+        self.out = out
+        self.interval = interval
+        self.dry_run = dry_run
+        self.start = self.last_report = time.monotonic()
+        # rule: planned jobs, and the rule, wildcards and start of the running jobs
+        self.totals = {}
+        self.jobs = {}
+        self.done = {}
+        self.failed = {}
+        self.steps = None
+        # the rule block or job table being read
+        self.block = None
+        self.table = None
+
+    def emit(self, event, **fields):
+        if self.writer:
+            self.writer.emit(
+                {
+                    "event": event,
+                    "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    **fields,
+                }
+            )
+
+    def feed(self, line):
+        line = line.rstrip("\n")
+        if self.table is not None:
+            if self.read_table_row(line):
+                return
+            self.end_table()
+        if self.block is not None:
+            field = re_job_field.match(line)
+            if field:
+                self.block[field.group(1)] = field.group(2)
+                return
+            if line.startswith((" ", "\t")):
+                return
+            self.end_block()
+
+        match = re_rule.match(line)
+        if match:
+            self.block = {"rule": match.group(1)}
+            return
+        match = re_finished.match(line)
+        if match:
+            self.job_finish(int(match.group(1)))
+            return
+        match = re_error.match(line)
+        if match:
+            self.block = {"rule": match.group(1), "error": True}
+            return
+        match = re_cluster_error.match(line)
+        if match:
+            self.job_error(match.group(1), int(match.group(2)))
+            return
+        match = re_steps.match(line)
+        if match:
+            done, total, percent = (int(value) for value in match.groups())
+            self.steps = (done, total)
+            self.emit("steps", done=done, total=total, percent=percent)
+            self.report()
+            return
+        if re_job_table.match(line):
+            self.table = {}
+
+    def read_table_row(self, line):
+        """
+        Add a row of the job table to self.table, False at the end of the table
+        """
+        fields = line.split()
+        if not fields:
+            return False
+        if fields[0] in ("count", "job") or set(fields[0]) == {"-"}:
+            return True
+        if len(fields) == 1 and fields[0].isdigit():
+            # total of Snakemake <7
+            return True
+        if len(fields) >= 2 and fields[0].isdigit():
+            # '\t10\tblastp' of Snakemake <7
+            self.table[fields[1]] = int(fields[0])
+            return True
+        if len(fields) >= 2 and fields[1].isdigit():
+            # 'blastp  10  4  4' of Snakemake >=7
+            if fields[0] != "total":
+                self.table[fields[0]] = int(fields[1])
+            return True
+        return False
+
+    def end_table(self):
+        if self.table:
+            self.totals = self.table
+            self.emit("job_counts", counts=self.totals, dry_run=self.dry_run)
+        self.table = None
+
+    def end_block(self):
+        block, self.block = self.block, None
+        if "jobid" not in block:
+            return
+        jobid = int(block["jobid"])
+        if block.get("error"):
+            self.job_error(block["rule"], jobid)
+        elif not self.dry_run:
+            self.job_start(block["rule"], jobid, block.get("wildcards"))
+
+    def job_start(self, rule, jobid, wildcards):
+        self.jobs[jobid] = (rule, wildcards, time.monotonic())
+        self.emit("job_start", rule=rule, jobid=jobid, wildcards=wildcards)
+
+    def job_finish(self, jobid):
+        rule, wildcards, started = self.jobs.pop(jobid, (None, None, None))
+        if rule is not None:
+            self.done[rule] = self.done.get(rule, 0) + 1
+        self.emit(
+            "job_finish",
+            rule=rule,
+            jobid=jobid,
+            wildcards=wildcards,
+            duration_s=None if started is None else round(time.monotonic() - started),
+        )
+
+    def job_error(self, rule, jobid):
+        # a cluster job is reported by the cluster error and by the rule error block
+        failed = self.failed.setdefault(rule, set())
+        if jobid in failed:
+            return
+        failed.add(jobid)
+        self.jobs.pop(jobid, None)
+        self.emit("job_error", rule=rule, jobid=jobid)
+
+    def counts(self):
+        """
+        Total, done, running and failed jobs of each rule
+        """
+        running = {}
+        for rule, wildcards, started in self.jobs.values():
+            running[rule] = running.get(rule, 0) + 1
+        rules = list(self.totals)
+        for rule in (*self.done, *running, *self.failed):
+            if rule not in rules:
+                rules.append(rule)
+        return {
+            rule: {
+                "total": self.totals.get(rule),
+                "done": self.done.get(rule, 0),
+                "running": running.get(rule, 0),
+                "failed": len(self.failed.get(rule, ())),
+            }
+            for rule in rules
+        }
+
+    def eta(self):
+        # remaining steps at the rate of the steps done so far
+        if not self.steps or not self.steps[0]:
+            return None
+        done, total = self.steps
+        elapsed = time.monotonic() - self.start
+        return elapsed / done * (total - done)
+
+    def table_text(self):
+        elapsed = timedelta(seconds=round(time.monotonic() - self.start))
+        eta = self.eta()
+        steps = "no steps done yet"
+        if self.steps:
+            done, total = self.steps
+            steps = f"{done} of {total} steps done"
+        lines = [
+            f"eifunannot progress - {steps}, elapsed {elapsed}"
+            + ("" if eta is None else f", ETA {timedelta(seconds=round(eta))}"),
+            f"{'rule':<30}{'total':>8}{'done':>8}{'running':>9}{'failed':>8}",
+        ]
+        for rule, counts in self.counts().items():
+            total = "" if counts["total"] is None else counts["total"]
+            lines.append(
+                f"{rule:<30}{total:>8}{counts['done']:>8}{counts['running']:>9}{counts['failed']:>8}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def report(self, force=False):
+        if self.dry_run or self.out is None:
+            return
+        if force or time.monotonic() - self.last_report >= self.interval:
+            self.last_report = time.monotonic()
+            self.out.write(f"\n{self.table_text()}\n")
+            self.out.flush()
+
+    def close(self, exit_code):
+        if self.table is not None:
+            self.end_table()
+        if self.block is not None:
+            self.end_block()
+        self.emit(
+            "done",
+            exit_code=exit_code,
+            elapsed_s=round(time.monotonic() - self.start),
+            counts=self.counts(),
+        )
+        self.report(force=True)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to sort a GFF3 file hierarchically with bounded memory
+
+Top level features are ordered by seqid (in order of first appearance) and start,
+each followed by its descendants, children ordered by start under their parent and
+ties kept in input order. The ID/Parent links are resolved in an on-disk SQLite index
+and the lines are sorted with an external merge sort, so only the sort buffer is
+held in memory.
+
+Directives ('##') are written first, '###' separators are dropped, comments stay
+with the preceding feature and anything after '##FASTA' is copied to the end.
+
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+
+# import libraries
+import argparse
+import itertools
+import os
+import sqlite3
+import sys
+import tempfile
+from eifunannot.scripts.external_sort import SORT_BUFFER, sort_lines
+
+# get script name
+script = os.path.basename(sys.argv[0])
+
+# get the GFF3 attributes
+SEQID, SOURCE, TYPE, START, END, SCORE, STRAND, PHASE, ATTRIBUTE = range(9)
+
+# guard against Parent cycles
+MAX_DEPTH = 32
+
+
+def get_id_parent(attributes):
+    """
+    Get the ID and the first Parent from the GFF3 column 9, keys are case insensitive
+    """
+    feature_id = parent = None
+    for item in attributes.strip(" ;").split(";"):
+        key, sep, value = item.partition("=")
+        key = key.strip().lower()
+        if key == "id":
+            feature_id = value
+        elif key == "parent":
+            parent = value.split(",")[0]
+    return feature_id, parent
+
+
+def iter_gff_lines(gff_file):
+    """
+    Yields (line number, line) for the GFF3 body, stops at '##FASTA'
+    """
+    with open(gff_file, "r") as fh:
+        for num, line in enumerate(fh, 1):
+            line = line.rstrip("\n")
+            if line.startswith("##FASTA"):
+                return
+            yield num, line
+
+
+class FeatureIndex:
+    """
+    On-disk index of the GFF3 ID/Parent hierarchy
+    """
+
+    def __init__(self, tmp_dir=None):
+        fd, self.path = tempfile.mkstemp(
+            prefix="eifunannot_gff3_", suffix=".sqlite", dir=tmp_dir
+        )
+        os.close(fd)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute(
+            "CREATE TABLE features (id TEXT PRIMARY KEY, parent TEXT, seqid INTEGER, start INTEGER, num INTEGER)"
+        )
+
+    def build(self, gff_file):
+        seqids = {}
+        rows = []
+        for num, line in iter_gff_lines(gff_file):
+            if not line or line.startswith("#"):
+                continue
+            row = line.split("\t")
+            if len(row) != 9:
+                raise ValueError(
+                    f"Error: Not a standard GFF3 9 column line, see below:\n{line}"
+                )
+            feature_id, parent = get_id_parent(row[ATTRIBUTE])
+            seqids.setdefault(row[SEQID], len(seqids))
+            if feature_id is not None:
+                # multi-line features share an ID, keep the first line
+                rows.append(
+                    (feature_id, parent, seqids[row[SEQID]], int(row[START]), num)
+                )
+            if len(rows) >= 100000:
+                self._insert(rows)
+                rows = []
+        self._insert(rows)
+        self.db.execute("CREATE INDEX features_parent ON features (parent)")
+        # sort key of every ID, the key of its parent followed by its own seqid/start/line
+        self.db.execute("CREATE TABLE paths (id TEXT PRIMARY KEY, path TEXT)")
+        self.db.execute(f"""
+            INSERT OR IGNORE INTO paths
+            WITH RECURSIVE tree(id, path, depth) AS (
+                SELECT id, printf('%012d%012d%012d', seqid, start, num), 0 FROM features
+                WHERE parent IS NULL OR parent NOT IN (SELECT id FROM features)
+                UNION ALL
+                SELECT features.id, tree.path || printf('%012d%012d', features.start, features.num), tree.depth + 1
+                FROM features JOIN tree ON features.parent = tree.id
+                WHERE tree.depth < {MAX_DEPTH}
+            )
+            SELECT id, path FROM tree
+            """)
+        self.db.commit()
+        return seqids
+
+    def _insert(self, rows):
+        self.db.executemany(
+            "INSERT OR IGNORE INTO features VALUES (?, ?, ?, ?, ?)", rows
+        )
+
+    def get_path(self, feature_id):
+        row = self.db.execute(
+            "SELECT path FROM paths WHERE id = ?", (feature_id,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def close(self):
+        self.db.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def sort_gff3(gff_file, out, sort_buffer=SORT_BUFFER, tmp_dir=None):
+    """
+    Write gff_file hierarchically sorted to the out file handle
+    """
+    index = FeatureIndex(tmp_dir)
+    try:
+        seqids = index.build(gff_file)
+        directives = []
+
+        def keyed_lines():
+            # lines are prefixed with the path of the feature and their kind and line number
+            path = ""
+            for num, line in iter_gff_lines(gff_file):
+                if not line.strip() or line.startswith("###"):
+                    continue
+                if line.startswith("##"):
+                    directives.append(line)
+                    continue
+                if line.startswith("#"):
+                    # comments stay after the preceding feature
+                    yield f"{path}\t1{num:012d}\t{line}"
+                    continue
+                row = line.split("\t")
+                feature_id, parent = get_id_parent(row[ATTRIBUTE])
+                path = None
+                if feature_id is not None:
+                    path = index.get_path(feature_id)
+                elif parent is not None:
+                    path = index.get_path(parent)
+                    if path is not None:
+                        path += f"{int(row[START]):012d}{num:012d}"
+                if path is None:
+                    # cycles and features without ID or known parent are sorted as top level features
+                    path = f"{seqids[row[SEQID]]:012d}{int(row[START]):012d}{num:012d}"
+                yield f"{path}\t0{num:012d}\t{line}"
+
+        sorted_lines = sort_lines(
+            keyed_lines(), lambda x: x.split("\t", 2)[:2], sort_buffer, tmp_dir
+        )
+        # the directives are collected while the first line is sorted
+        first = next(sorted_lines, None)
+        for line in directives:
+            out.write(f"{line}\n")
+        if first is not None:
+            for line in itertools.chain([first], sorted_lines):
+                out.write(f"{line.split(chr(9), 2)[2]}\n")
+    finally:
+        index.close()
+
+    # copy any ##FASTA section as is
+    with open(gff_file, "r") as fh:
+        fasta = False
+        for line in fh:
+            if line.startswith("##FASTA"):
+                fasta = True
+            if fasta:
+                out.write(line)
+
+
+class HelpFormatter(
+    argparse.ArgumentDefaultsHelpFormatter, argparse.RawTextHelpFormatter
+):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog=script,
+        formatter_class=HelpFormatter,
+        description="""
+        Script to sort a GFF3 file hierarchically with bounded memory
+        """,
+        epilog=f"Contact: {__author__} ({__email__})",
+    )
+    parser.add_argument(
+        "gff_file",
+        help="Provide GFF3 file",
+    )
+    parser.add_argument(
+        "--sort_buffer",
+        type=int,
+        default=SORT_BUFFER,
+        help="Number of lines sorted in memory before spilling to a temporary file",
+    )
+    parser.add_argument(
+        "--tmp_dir",
+        help="Directory for the temporary index and sort files (default: system temporary directory)",
+    )
+    args = parser.parse_args()
+    sort_gff3(args.gff_file, sys.stdout, args.sort_buffer, args.tmp_dir)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except BrokenPipeError:
+        # Python flushes standard streams on exit; redirect remaining output
+        # to devnull to avoid another BrokenPipeError at shutdown
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)  # Python exits with error code 1 on EPIPE
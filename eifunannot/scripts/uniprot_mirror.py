@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local mirror of UniProt downloads, keyed by query and release
+
+Layout of the mirror directory:
+
+    <mirror_dir>/<namespace>/<digest of the key>/<version>/data
+    <mirror_dir>/<namespace>/<digest of the key>/<version>/info.json
+
+The version is the UniProt release for the REST downloads and the modification
+time and size for the FTP files. 'info.json' is written last, so an entry without
+it is incomplete and never used. Storing a new version of a key removes the
+previous ones. Files are hard linked into and out of the mirror when it is on the
+same file system, copied otherwise.
+"""
+
+# authorship and License information
+__author__ = "Gemy George Kaithakottil"
+__license__ = "GNU General Public License v3.0"
+__maintainer__ = "Gemy George Kaithakottil"
+__email__ = "gemygk@gmail.com"
+
+# import libraries
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+
+INFO = "info.json"
+DATA = "data"
+
+
+def link_or_copy(source, target):
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class UniprotMirror:
+    def __init__(self, mirror_dir):
+        self.mirror_dir = mirror_dir
+
+    def key_dir(self, namespace, key):
+        digest = hashlib.sha256(key.encode("utf8")).hexdigest()[:20]
+        return os.path.join(self.mirror_dir, namespace, digest)
+
+    def entry_dir(self, namespace, key, version):
+        # releases look like '2024_01', keep the directory name safe anyway
+        return os.path.join(
+            self.key_dir(namespace, key), re.sub(r"[^\w.-]", "_", version)
+        )
+
+    def fetch(self, namespace, key, version, target):
+        """
+        Link or copy the mirrored file to target, returns False if it is not mirrored
+        """
+        entry = self.entry_dir(namespace, key, version)
+        if not os.path.exists(os.path.join(entry, INFO)):
+            return False
+        link_or_copy(os.path.join(entry, DATA), target)
+        return True
+
+    def store(self, namespace, key, version, source, info):
+        """
+        Add source to the mirror and remove the older versions of key
+        """
+        entry = self.entry_dir(namespace, key, version)
+        os.makedirs(entry, exist_ok=True)
+        tmp_data = os.path.join(entry, f"{DATA}.{os.getpid()}.tmp")
+        link_or_copy(source, tmp_data)
+        os.replace(tmp_data, os.path.join(entry, DATA))
+        tmp_info = os.path.join(entry, f"{INFO}.{os.getpid()}.tmp")
+        with open(tmp_info, "w") as fh:
+            json.dump(dict(info, key=key, version=version), fh, indent=2)
+        os.replace(tmp_info, os.path.join(entry, INFO))
+        key_dir = self.key_dir(namespace, key)
+        for old_version in os.listdir(key_dir):
+            old_entry = os.path.join(key_dir, old_version)
+            if old_entry != entry:
+                shutil.rmtree(old_entry, ignore_errors=True)
+        logging.info(f"Mirrored '{key}' ({version}) to '{entry}'")
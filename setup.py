@@ -64,10 +64,13 @@ setup(
             "generate_ahrd_reference_fasta_from_ncbi=eifunannot.scripts.generate_ahrd_reference_fasta_from_ncbi:main",
             "generate_ahrd_reference_fasta_from_ensembl=eifunannot.scripts.generate_ahrd_reference_fasta_from_ensembl:main",
             "generate_ahrd_reference_fasta_from_file=eifunannot.scripts.generate_ahrd_reference_fasta_from_file:main",
+            "generate_ahrd_reference_fasta=eifunannot.scripts.generate_ahrd_reference_fasta:main",
             "download_from_uniprot=eifunannot.scripts.download_from_uniprot:main",
             "create_functional_annotation=eifunannot.scripts.create_functional_annotation:main",
             "parse_blast=eifunannot.scripts.parse_blast:main",
             "add_description_to_annotation_GFF3=eifunannot.scripts.add_description_to_annotation_GFF3:main",
+            "create_annotated_gff3=eifunannot.scripts.create_annotated_gff3:main",
+            "sort_gff3=eifunannot.scripts.sort_gff3:main",
         ]
     },
     package_data={
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BGZF output and tabix index of SortedBgzfGff3Writer
+"""
+
+# import libraries
+import gzip
+import random
+
+import pytest
+
+from eifunannot.scripts.bgzf import SortedBgzfGff3Writer
+
+
+@pytest.fixture
+def gff3(tmp_path):
+    """
+    Coordinate sorted GFF3 written out of order, over several BGZF blocks, and its
+    expected lines
+    """
+    rng = random.Random(1)
+    features = []
+    for num in range(6000):
+        seqid = ["chr2", "chr1", "scaffold_10"][num % 3]
+        start = rng.randint(1, 2000000)
+        end = start + rng.randint(0, 40000)
+        features.append(
+            f"{seqid}\tsrc\texon\t{start}\t{end}\t.\t+\t.\tID=exon{num};Parent=mRNA{num // 4}"
+        )
+    output = tmp_path / "annotation.gff3.gz"
+    writer = SortedBgzfGff3Writer(str(output), sort_buffer=1000, tmp_dir=str(tmp_path))
+    text = "##gff-version 3\n" + "\n###\n".join(features) + "\n"
+    # lines are split across the writes
+    for i in range(0, len(text), 4093):
+        writer.write(text[i : i + 4093])
+    writer.close()
+    seqids = ["chr2", "chr1", "scaffold_10"]
+    expected = sorted(
+        features,
+        key=lambda line: (
+            seqids.index(line.split("\t")[0]),
+            int(line.split("\t")[3]),
+        ),
+    )
+    return output, expected
+
+
+def test_output_is_gzip_readable(gff3, tmp_path):
+    output, expected = gff3
+    assert output.stat().st_size > 1 << 16
+    with gzip.open(output, "rt") as fh:
+        assert fh.read().splitlines() == ["##gff-version 3"] + expected
+    # the spool and sort files are removed
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "annotation.gff3.gz",
+        "annotation.gff3.gz.tbi",
+    ]
+
+
+def test_tabix_index_returns_the_region(gff3):
+    pysam = pytest.importorskip("pysam")
+    output, expected = gff3
+    with pysam.TabixFile(str(output)) as tabix:
+        assert tabix.contigs == ["chr2", "chr1", "scaffold_10"]
+        for seqid, beg, end in [
+            ("chr1", 1000000, 1010000),
+            ("chr2", 0, 50000),
+            ("scaffold_10", 1990000, 2100000),
+        ]:
+            # records overlapping the 0-based half open region, in file order
+            region = [
+                line
+                for line in expected
+                if line.split("\t")[0] == seqid
+                and int(line.split("\t")[3]) - 1 < end
+                and int(line.split("\t")[4]) > beg
+            ]
+            assert region
+            assert list(tabix.fetch(seqid, beg, end)) == region
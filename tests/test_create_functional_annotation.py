@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Functional annotation table of create_functional_annotation, in memory and streamed
+"""
+
+# import libraries
+import argparse
+
+from eifunannot.scripts.create_functional_annotation import (
+    add_arguments,
+    iter_annotation,
+)
+
+AHRD = (
+    "# AHRD-Version 3.3.3\n"
+    "\n"
+    "Protein-Accession\tBlast-Hit-Accession\tAHRD-Quality-Code\tHuman-Readable-Description\tInterpro-ID (Description)\tGene-Ontology-Term\n"
+    "T1.1\tAT1G01010.1\t*-*-\tNAC domain containing protein 1\t\tGO:0003677\n"
+    "T2.1\t\t\tUnknown protein\t\t\n"
+    "T3.1\tAT1G01030.1\t***-\tAP2 domain protein\tIPR003340\t\n"
+)
+METRICS = (
+    "TID\tGID\tbiotype\tconfidence\n"
+    "T1.1\tT1\tprotein_coding\tHigh\n"
+    "T2.1\tT2\tprotein_coding\tLow\n"
+    "T3.1\tT3\ttransposable_element\tLow\n"
+)
+BLAST = (
+    "T1.1\tAT1G01010.1\t90.0\t1\t300\t1\t300\t400\t429\t300\t270\t30\t280\t0\t0\t1e-100\t500\n"
+    "T3.1\tAT1G01030.1\t80.0\t10\t200\t5\t195\t358\t361\t191\t150\t41\t170\t0\t0\t1e-80\t300\n"
+)
+
+
+def annotation(tmp_path, *options):
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args(
+        [
+            "--ahrd_output",
+            str(tmp_path / "ahrd_output.csv"),
+            "--metrics_output",
+            str(tmp_path / "metrics.final_table.tsv"),
+            "--metrics_output_cols",
+            "1,2,3,4",
+            "--blast_tblr_output",
+            str(tmp_path / "blastp.tblr"),
+            *options,
+        ]
+    )
+    return list(iter_annotation(args))
+
+
+def test_presorted_inputs_with_trailing_blank_lines(tmp_path):
+    # sorted inputs, ending with blank lines as left by some editors and tools
+    (tmp_path / "ahrd_output.csv").write_text(f"{AHRD}\n")
+    (tmp_path / "metrics.final_table.tsv").write_text(f"{METRICS}\n \n")
+    (tmp_path / "blastp.tblr").write_text(f"{BLAST}\n\n")
+    in_memory = annotation(tmp_path)
+    assert [line[0] for line in in_memory[1:]] == ["T1.1", "T2.1", "T3.1"]
+    assert annotation(tmp_path, "--streaming") == in_memory
+    assert annotation(tmp_path, "--streaming", "--presorted") == in_memory
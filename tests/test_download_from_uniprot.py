@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+download_from_uniprot against a local stand-in of the UniProtKB REST API
+
+The server serves synthetic entries for 'reviewed:true' and 'reviewed:false' from
+/uniprotkb/search (HEAD details, pages linked with 'Link: <...>; rel="next"') and
+/uniprotkb/stream (one gzip encoded response). The downloader is pointed at it with
+--base_url, and the isoform FTP download is replaced by a local file.
+"""
+
+# import libraries
+import glob
+import gzip
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+requests = pytest.importorskip("requests")
+import urllib3
+
+from eifunannot.scripts import download_from_uniprot
+from eifunannot.scripts.download_from_uniprot import DownloadFromUniprot
+
+RELEASE = "2024_01"
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+# entries of each set, the reviewed set has isoforms for some of its accessions
+ENTRIES = {"true": 25, "false": 40}
+
+
+def make_entry(num, reviewed):
+    """
+    .dat and fasta text of one synthetic entry, some of them incomplete
+    """
+    acc = f"{'P' if reviewed else 'A0A'}{num:06d}"
+    name = f"PROT{num}_ARATH"
+    length = 50 + num * 7 % 200
+    seq = ("A" if num % 11 == 5 else "M") + "".join(
+        AMINO_ACIDS[(num * 3 + i * 7) % 20] for i in range(length - 1)
+    )
+    status = "Reviewed" if reviewed else "Unreviewed"
+    lines = [
+        f"ID   {name}   {status};   {length} AA.\n",
+        f"AC   {acc}; Q{num:05d};\n",
+        f"DT   01-JAN-1990, sequence version {num % 3 + 1}.\n",
+        f"DE   RecName: Full=Protein kinase {num} {{ECO:0000256|ARBA:00012513}};\n",
+    ]
+    if num % 13 == 1:
+        lines.append("DE   Flags: Fragment;\n")
+    lines += [
+        f"GN   Name=GENE{num} {{ECO:0000313|EMBL:X}}; ORFNames=F{num};\n",
+        "OS   Arabidopsis thaliana (Mouse-ear cress).\n",
+        "OX   NCBI_TaxID=3702 {ECO:0000313|EMBL:X};\n",
+        f"PE   {num % 5 + 1}: Inferred from homology;\n",
+        f"FT   CHAIN           1..{length}\n",
+    ]
+    if num % 9 == 3:
+        lines.append("FT   NON_TER         1\n")
+    lines.append(f"SQ   SEQUENCE   {length} AA;  12345 MW;  ABCDEF0123456789 CRC64;\n")
+    for i in range(0, length, 60):
+        part = seq[i : i + 60]
+        lines.append(
+            "     " + " ".join(part[j : j + 10] for j in range(0, len(part), 10)) + "\n"
+        )
+    lines.append("//\n")
+    prefix = "sp" if reviewed else "tr"
+    fasta = (
+        f">{prefix}|{acc}|{name} Protein kinase {num} OS=Arabidopsis thaliana OX=3702\n"
+    )
+    fasta += "".join(f"{seq[i : i + 60]}\n" for i in range(0, length, 60))
+    return "".join(lines), fasta
+
+
+class UniprotHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def query(self):
+        parts = urlsplit(self.path)
+        params = parse_qs(parts.query)
+        reviewed = re.search(r"reviewed:(true|false)", params["query"][0]).group(1)
+        return parts, params, reviewed
+
+    def send_details(self, reviewed):
+        server = self.server
+        self.send_header(
+            "x-total-results", str(len(server.entries[reviewed]) + server.total_offset)
+        )
+        self.send_header("x-uniprot-release", server.release)
+        self.send_header("x-uniprot-release-date", "24-January-2024")
+
+    def do_HEAD(self):
+        parts, params, reviewed = self.query()
+        self.server.requests.append(("HEAD", parts.path, reviewed, None))
+        self.send_response(200)
+        self.send_details(reviewed)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        server = self.server
+        parts, params, reviewed = self.query()
+        text_format = 1 if params["format"][0] == "fasta" else 0
+        entries = [entry[text_format] for entry in server.entries[reviewed]]
+        headers = {}
+        if parts.path.endswith("/stream"):
+            page = "stream"
+            if server.barrier is not None:
+                server.barrier.wait()
+            body = gzip.compress("".join(entries).encode("utf8"))
+            headers["Content-Encoding"] = "gzip"
+        else:
+            page = int(params.get("cursor", ["0"])[0])
+            size = int(params["size"][0])
+            body = "".join(entries[page : page + size]).encode("utf8")
+            if page + size < len(entries):
+                query = re.sub(r"&cursor=\d+", "", parts.query)
+                next_url = f"http://{self.headers['Host']}{parts.path}?{query}&cursor={page + size}"
+                headers["Link"] = f'<{next_url}>; rel="next"'
+        server.requests.append(("GET", parts.path, reviewed, page))
+        self.send_response(200)
+        self.send_details(reviewed)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if (reviewed, page) in server.drop:
+            # the connection is lost half way through the body, once
+            server.drop.remove((reviewed, page))
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def uniprot_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UniprotHandler)
+    server.daemon_threads = True
+    server.entries = {
+        reviewed: [make_entry(num, reviewed == "true") for num in range(count)]
+        for reviewed, count in ENTRIES.items()
+    }
+    server.release = RELEASE
+    server.total_offset = 0
+    server.drop = set()
+    server.barrier = None
+    server.requests = []
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/uniprotkb"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def local_isoforms(monkeypatch):
+    # the manually curated isoforms, written instead of downloaded from the FTP site
+    def download_curated_isoforms(self):
+        if self.mirror:
+            self.isoform_version = "20240124000000_1000"
+        with gzip.open("uniprot_sprot_varsplic.fasta.gz", "wt") as out:
+            for num in range(0, ENTRIES["true"], 4):
+                out.write(f">sp|P{num:06d}-2|PROT{num}_ARATH Isoform 2\nMKVLA\n")
+
+    monkeypatch.setattr(
+        DownloadFromUniprot, "download_curated_isoforms", download_curated_isoforms
+    )
+
+
+def download(monkeypatch, work_dir, server, *options, file_format="dat"):
+    """
+    Run download_from_uniprot in work_dir, returns its outputs by file name
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    monkeypatch.chdir(work_dir)
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "download_from_uniprot",
+            "Arabidopsis",
+            "3702",
+            file_format,
+            "--base_url",
+            server.base_url,
+            *options,
+        ],
+    )
+    download_from_uniprot.main()
+    outputs = {}
+    for path in glob.glob(os.path.join(work_dir, "Uniprot_*")):
+        with open(path, "rb") as fh:
+            outputs[os.path.basename(path)] = fh.read()
+    return outputs
+
+
+def without_blank_lines(data):
+    # the search endpoint separates its pages with an empty line
+    return b"".join(line for line in data.splitlines(True) if line != b"\n")
+
+
+def test_stream_and_search_outputs_are_identical(
+    uniprot_server, local_isoforms, monkeypatch, tmp_path
+):
+    stream = download(
+        monkeypatch, tmp_path / "stream", uniprot_server, "--filter_database"
+    )
+    search = download(
+        monkeypatch,
+        tmp_path / "search",
+        uniprot_server,
+        "--filter_database",
+        "--endpoint",
+        "search",
+        "--size",
+        "7",
+    )
+    assert sorted(stream) == sorted(search)
+    filtered = [name for name in stream if name.endswith(".filtered.fasta")]
+    assert len(filtered) == 2
+    for name in stream:
+        if name.endswith(".filtered.fasta"):
+            assert stream[name] == search[name]
+        else:
+            assert stream[name] == without_blank_lines(search[name])
+    swissprot = next(name for name in filtered if "_SwissProt_" in name)
+    # fragments and incomplete sequences are dropped, isoforms added
+    assert 0 < stream[swissprot].count(b">sp|P") < ENTRIES["true"] + 7
+    assert b"Isoform 2" in stream[swissprot]
+    assert b">sp|P000001|" not in stream[swissprot]
+
+
+def test_both_databases_are_downloaded_concurrently(
+    uniprot_server, monkeypatch, tmp_path
+):
+    # both stream requests must be in flight at the same time to get an answer
+    uniprot_server.barrier = threading.Barrier(2, timeout=10)
+    outputs = download(monkeypatch, tmp_path, uniprot_server, file_format="fasta")
+    swissprot = [name for name in outputs if name.startswith("Uniprot_SwissProt_")]
+    trembl = [name for name in outputs if name.startswith("Uniprot_TrEMBL_")]
+    assert len(swissprot) == len(trembl) == 1
+    assert outputs[swissprot[0]].count(b">sp|") == ENTRIES["true"]
+    assert outputs[trembl[0]].count(b">tr|") == ENTRIES["false"]
+
+
+@pytest.mark.parametrize("endpoint", ["stream", "search"])
+def test_entry_count_mismatch_raises(uniprot_server, monkeypatch, tmp_path, endpoint):
+    uniprot_server.total_offset = 1
+    with pytest.raises(ValueError, match="x-total-results"):
+        download(monkeypatch, tmp_path, uniprot_server, "--endpoint", endpoint)
+
+
+def test_dropped_connection_resumes_from_checkpoint(
+    uniprot_server, monkeypatch, tmp_path
+):
+    options = ("--endpoint", "search", "--size", "7")
+    expected = download(monkeypatch, tmp_path / "complete", uniprot_server, *options)
+
+    uniprot_server.drop.add(("false", 14))
+    uniprot_server.requests.clear()
+    with pytest.raises(
+        (requests.exceptions.RequestException, urllib3.exceptions.HTTPError)
+    ):
+        download(monkeypatch, tmp_path / "resumed", uniprot_server, *options)
+    assert glob.glob(str(tmp_path / "resumed" / "Uniprot_TrEMBL_*.checkpoint"))
+
+    outputs = download(monkeypatch, tmp_path / "resumed", uniprot_server, *options)
+    assert outputs == expected
+    # the pages before the dropped one are not downloaded again
+    trembl_pages = [
+        page
+        for method, path, reviewed, page in uniprot_server.requests
+        if method == "GET" and reviewed == "false"
+    ]
+    assert trembl_pages == [0, 7, 14, 14, 21, 28, 35]
+
+
+def test_filter_stream_resumes_large_downloads_with_default_options(
+    uniprot_server, local_isoforms, monkeypatch, tmp_path
+):
+    # TrEMBL is above the limit of the stream endpoint, Swiss-Prot below it
+    monkeypatch.setattr(
+        download_from_uniprot, "RESUMABLE_ENTRIES", ENTRIES["false"] - 1
+    )
+    options = ("--filter_stream", "--keep_dat", "--size", "7")
+    expected = download(monkeypatch, tmp_path / "complete", uniprot_server, *options)
+    assert ("GET", "/uniprotkb/stream", "true", "stream") in uniprot_server.requests
+    assert ("GET", "/uniprotkb/search", "false", 0) in uniprot_server.requests
+
+    uniprot_server.drop.add(("false", 21))
+    uniprot_server.requests.clear()
+    with pytest.raises(
+        (requests.exceptions.RequestException, urllib3.exceptions.HTTPError)
+    ):
+        download(monkeypatch, tmp_path / "resumed", uniprot_server, *options)
+    assert glob.glob(str(tmp_path / "resumed" / "Uniprot_TrEMBL_*.checkpoint"))
+
+    outputs = download(monkeypatch, tmp_path / "resumed", uniprot_server, *options)
+    assert outputs == expected
+    trembl_pages = [
+        page
+        for method, path, reviewed, page in uniprot_server.requests
+        if method == "GET" and reviewed == "false"
+    ]
+    assert trembl_pages == [0, 7, 14, 21, 21, 28, 35]
+
+
+def test_parallel_filter_matches_serial_filter(
+    uniprot_server, local_isoforms, monkeypatch, tmp_path
+):
+    serial = download(
+        monkeypatch, tmp_path / "serial", uniprot_server, "--filter_database"
+    )
+    parallel = download(
+        monkeypatch,
+        tmp_path / "parallel",
+        uniprot_server,
+        "--filter_database",
+        "--threads",
+        "2",
+    )
+    assert parallel == serial
+
+
+def test_filter_stream_outputs_are_mirrored(
+    uniprot_server, local_isoforms, monkeypatch, tmp_path
+):
+    options = (
+        "--filter_stream",
+        "--keep_dat",
+        "--mirror_dir",
+        str(tmp_path / "mirror"),
+    )
+    first = download(monkeypatch, tmp_path / "first", uniprot_server, *options)
+    assert len(first) == 4
+
+    # an unchanged release is not downloaded again
+    uniprot_server.requests.clear()
+    second = download(monkeypatch, tmp_path / "second", uniprot_server, *options)
+    assert second == first
+    assert all(method == "HEAD" for method, *_ in uniprot_server.requests)
+
+    uniprot_server.release = "2024_02"
+    uniprot_server.requests.clear()
+    third = download(monkeypatch, tmp_path / "third", uniprot_server, *options)
+    assert third == first
+    assert [method for method, *_ in uniprot_server.requests].count("GET") == 2
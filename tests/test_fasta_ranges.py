@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+transform_fasta of fasta_ranges with one and several worker processes
+"""
+
+# import libraries
+import io
+import os
+import random
+from functools import partial
+
+from eifunannot.scripts.fasta_ranges import DROPPED_EXAMPLES, transform_fasta
+from eifunannot.scripts.generate_ahrd_reference_fasta_from_ncbi import ahrd_header
+from eifunannot.scripts.record_ranges import record_ranges
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def write_fasta(path, records, rng):
+    with open(path, "w") as out:
+        for num in range(records):
+            prefix = "NP" if num % 3 else "XP"
+            out.write(
+                f">{prefix}_{num:06d}.1 protein kinase {num} [Bombus terrestris]\n"
+            )
+            seq = "".join(rng.choices(AMINO_ACIDS, k=rng.randint(20, 3000)))
+            for i in range(0, len(seq), 60):
+                out.write(f"{seq[i : i + 60]}\n")
+            if num % 50 == 7:
+                out.write("\n# comment\n")
+        # the last record has no trailing newline
+        out.write(">NP_999999.1 last protein [Bombus terrestris]\nMKT")
+
+
+def transform(fasta, threads):
+    out = io.StringIO()
+    records, kept, dropped = transform_fasta(
+        fasta, partial(ahrd_header, keep_XP=False), out, threads=threads
+    )
+    return out.getvalue(), records, kept, dropped
+
+
+def test_parallel_output_matches_serial_output(tmp_path):
+    fasta = str(tmp_path / "proteins.faa")
+    write_fasta(fasta, 400, random.Random(1))
+    size = os.path.getsize(fasta)
+    # the split points fall within records, the ranges end at the next header
+    ranges = record_ranges(fasta, 16, b">", after=False)
+    assert len(ranges) == 16
+    with open(fasta, "rb") as fh:
+        data = fh.read()
+    assert any(
+        data[size * part // 16 : size * part // 16 + 1] != b">" for part in range(1, 16)
+    )
+    assert all(data[start : start + 1] == b">" for start, end in ranges)
+
+    serial = transform(fasta, 1)
+    text, records, kept, dropped = serial
+    assert (records, kept) == (401, 267)
+    assert text.startswith(">NP_000001.1 | Symbols:  | protein kinase 1  |\n")
+    assert text.endswith(">NP_999999.1 | Symbols:  | last protein  |\nMKT\n")
+    assert "# comment" not in text and "\n\n" not in text
+    assert dropped[:2] == [
+        ">XP_000000.1 protein kinase 0 [Bombus terrestris]",
+        ">XP_000003.1 protein kinase 3 [Bombus terrestris]",
+    ]
+    assert len(dropped) == DROPPED_EXAMPLES
+    for threads in (2, 4):
+        assert transform(fasta, threads) == serial
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AHRD reference fasta of generate_ahrd_reference_fasta from NCBI, Ensembl and fasta
+plus annotation tsv sources
+"""
+
+# import libraries
+import os
+import stat
+import subprocess
+import sys
+
+SEQ_A = "MKTAYIAKQRQISFVKSHFSRQ"
+SEQ_B = "MSDNGPQNQRNAPRITFGGPSD"
+SEQ_C = "MTAILERRESESLWGRFCNWIT"
+
+NCBI = (
+    f">NP_000001.1 shared kinase [Bombus terrestris]\n{SEQ_A}\n"
+    f">NP_000002.1 shared kinase paralog [Bombus terrestris]\n{SEQ_A}\n"
+    f">XP_000003.1 predicted kinase [Bombus terrestris]\n{SEQ_C}\n"
+)
+
+
+def ensembl_header(num, description):
+    return (
+        f">ENSP{num:011d}.1 pep chromosome:GRCh38:1:1:100:1 gene:ENSG{num:011d}.1"
+        f" transcript:ENST{num:011d}.1 gene_biotype:protein_coding"
+        f" transcript_biotype:protein_coding gene_symbol:G{num}"
+        f" description:{description} [Source:HGNC Symbol;Acc:HGNC:{num}]"
+    )
+
+
+ENSEMBL = (
+    f"{ensembl_header(1, 'kinase')}\n{SEQ_A}\n"
+    f"{ensembl_header(2, 'nucleoprotein')}\n{SEQ_B}\n"
+    f"{ensembl_header(3, 'nucleoprotein')}\n{SEQ_B}\n"
+)
+FILE = f">YP_1.1 chloroplast\n{SEQ_C}\n"
+ANNOTATION = "YP_1.1\tpsbA\tphotosystem II protein D1\n"
+
+
+def run(work_dir, *options):
+    for name, text in [
+        ("ncbi.faa", NCBI),
+        ("ensembl.pep.all.fa", ENSEMBL),
+        ("chloroplast.faa", FILE),
+        ("chloroplast.tsv", ANNOTATION),
+    ]:
+        (work_dir / name).write_text(text)
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "eifunannot.scripts.generate_ahrd_reference_fasta",
+            "-o",
+            "reference.fasta",
+            "--ncbi",
+            "ncbi.faa",
+            "--ensembl",
+            "ensembl.pep.all.fa",
+            "--file",
+            "chloroplast.faa",
+            "chloroplast.tsv",
+            "1",
+            "3",
+            "2",
+            "--threads",
+            "2",
+            *options,
+        ],
+        cwd=work_dir,
+        check=True,
+    )
+    return (
+        (work_dir / "reference.fasta").read_text(),
+        (work_dir / "reference.fasta.ahrd_format.info.txt").read_text(),
+    )
+
+
+def test_sequences_of_earlier_sources_are_dropped(tmp_path):
+    fasta, info = run(tmp_path, "--no_blastdb")
+    # the Ensembl kinase repeats an NCBI sequence, the isoforms and paralogs sharing
+    # a sequence within one source are kept
+    assert fasta == (
+        f">NP_000001.1 | Symbols:  | shared kinase  |\n{SEQ_A}\n"
+        f">NP_000002.1 | Symbols:  | shared kinase paralog  |\n{SEQ_A}\n"
+        f">ENSP00000000002.1 | Symbols:  | nucleoprotein (Source:HGNC Symbol;Acc:HGNC:2)  |\n{SEQ_B}\n"
+        f">ENSP00000000003.1 | Symbols:  | nucleoprotein (Source:HGNC Symbol;Acc:HGNC:3)  |\n{SEQ_B}\n"
+        f">YP_1.1 | Symbols: psbA | photosystem II protein D1 |\n{SEQ_C}\n"
+    )
+    assert info.splitlines() == [
+        "#Protein\t#Function\t#Symbol\t#Source",
+        "NP_000001.1\tshared kinase\t\tncbi.faa",
+        "NP_000002.1\tshared kinase paralog\t\tncbi.faa",
+        "ENSP00000000002.1\tnucleoprotein [Source:HGNC Symbol;Acc:HGNC:2]\t\tensembl.pep.all.fa",
+        "ENSP00000000003.1\tnucleoprotein [Source:HGNC Symbol;Acc:HGNC:3]\t\tensembl.pep.all.fa",
+        "YP_1.1\tphotosystem II protein D1\tpsbA\tchloroplast.faa",
+    ]
+    assert not os.path.exists(tmp_path / "makeblastdb.args")
+
+
+def test_blast_database_is_built(tmp_path):
+    makeblastdb = tmp_path / "makeblastdb"
+    makeblastdb.write_text(f'#!/bin/sh\necho "$@" > {tmp_path / "makeblastdb.args"}\n')
+    makeblastdb.chmod(makeblastdb.stat().st_mode | stat.S_IXUSR)
+    run(tmp_path, "--makeblastdb", str(makeblastdb))
+    assert (tmp_path / "makeblastdb.args").read_text() == (
+        "-in reference.fasta -dbtype prot\n"
+    )
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AHRD reference fasta of generate_ahrd_reference_fasta_from_file with --index
+"""
+
+# import libraries
+import subprocess
+import sys
+
+ANNOTATION = (
+    "#id\tgene\tname\tproduct\n"
+    "YP_1.1\tpsbA\tPSBA\tphotosystem II protein D1\n"
+    "YP_2.1\tmatK\tMATK\tmaturase K\n"
+)
+FASTA = ">YP_1.1 chloroplast\nMTAILERR\n>YP_2.1 chloroplast\nMEKFQGYL\n"
+
+
+def run(work_dir, *options):
+    return subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "eifunannot.scripts.generate_ahrd_reference_fasta_from_file",
+            "proteins.fa",
+            *options,
+        ],
+        cwd=work_dir,
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    ).stdout
+
+
+def test_index_is_rebuilt_for_other_columns(tmp_path):
+    (tmp_path / "proteins.fa").write_text(FASTA)
+    (tmp_path / "annotation.tsv").write_text(ANNOTATION)
+    options = ["-a", "annotation.tsv", "-i", "1", "-s", "2", "--index", "index.db"]
+    products = run(tmp_path, *options, "-d", "4")
+    assert products == (
+        ">YP_1.1 | Symbols: psbA | photosystem II protein D1 |\nMTAILERR\n"
+        ">YP_2.1 | Symbols: matK | maturase K |\nMEKFQGYL\n"
+    )
+    # the index is now newer than the annotation tsv file, but of other columns
+    names = run(tmp_path, *options, "-d", "3")
+    assert names == (
+        ">YP_1.1 | Symbols: psbA | PSBA |\nMTAILERR\n"
+        ">YP_2.1 | Symbols: matK | MATK |\nMEKFQGYL\n"
+    )
+    assert run(tmp_path, *options, "-d", "3") == names
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parsing of the '/usr/bin/time -v' output in the rule logs by resource_report
+"""
+
+# import libraries
+from eifunannot.scripts.resource_report import log_usage, parse_time_log
+
+TIME_LOG = """\tCommand being timed: "blastp -query chunk_001.txt -outfmt 6 std: qlen -evalue 1e-5"
+\tUser time (seconds): 100.50
+\tSystem time (seconds): 20.25
+\tPercent of CPU this job got: ?%
+\tElapsed (wall clock) time (h:mm:ss or m:ss): 1:02:03
+\tMaximum resident set size (kbytes): 2097152
+\tFile system inputs: 2048
+\tFile system outputs: 4096
+\tExit status: 0
+"""
+
+
+def test_command_with_colon_is_parsed(tmp_path):
+    log = tmp_path / "blastp.swissprot.001.log"
+    log.write_text(f"Some tool output: with a colon\n{TIME_LOG}")
+    commands = parse_time_log(str(log))
+    assert commands == [
+        {
+            "command": "blastp -query chunk_001.txt -outfmt 6 std: qlen -evalue 1e-5",
+            "user_s": 100.5,
+            "system_s": 20.25,
+            "wall_s": 3723.0,
+            "max_rss_kb": 2097152,
+            "fs_inputs": 2048,
+            "fs_outputs": 4096,
+            "exit_status": 0,
+        }
+    ]
+    usage = log_usage(str(log))
+    assert (usage["rule"], usage["chunk"]) == ("blastp", "swissprot.001")
+    assert usage["max_rss_mb"] == 2048
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hierarchical sort of sort_gff3 on out of order GFF3 input
+"""
+
+# import libraries
+import io
+
+from eifunannot.scripts.sort_gff3 import get_id_parent, sort_gff3
+
+GFF3 = """##gff-version 3
+chr1\tsrc\tCDS\t150\t200\t.\t+\t0\tParent=t1
+chr2\tsrc\texon\t50\t60\t.\t+\t.\tID=e3;Parent=t2
+chr1\tsrc\texon\t300\t400\t.\t+\t.\tID=e2;Parent=t1
+chr1\tsrc\tmRNA\t100\t400\t.\t+\t.\tID=t1;Parent=g1
+chr1\tsrc\texon\t100\t200\t.\t+\t.\tID=e1;Parent=t1
+###
+chr2\tsrc\tgene\t10\t90\t.\t+\t.\tID=g2
+##sequence-region chr2 1 1000
+chr2\tsrc\tmRNA\t10\t90\t.\t+\t.\tID=t2;Parent=g2
+chr1\tsrc\tgene\t100\t400\t.\t+\t.\tID=g1
+# end of gene g1
+chr1\tsrc\tgene\t5\t50\t.\t-\t.\tID=g0
+##FASTA
+>chr1
+ACGT
+"""
+
+
+def test_parents_come_before_children(tmp_path):
+    gff_file = tmp_path / "annotation.gff3"
+    gff_file.write_text(GFF3)
+    out = io.StringIO()
+    # a small sort buffer merges several spilled runs
+    sort_gff3(str(gff_file), out, sort_buffer=2, tmp_dir=str(tmp_path))
+    lines = out.getvalue().splitlines()
+    assert lines[:2] == ["##gff-version 3", "##sequence-region chr2 1 1000"]
+    assert lines[-2:] == [">chr1", "ACGT"]
+    features = [line for line in lines if line and not line.startswith("#")]
+    # seqids in order of first appearance, children by start under their parent
+    assert [line.split("\t")[8] for line in features[:-2]] == [
+        "ID=g0",
+        "ID=g1",
+        "ID=t1;Parent=g1",
+        "ID=e1;Parent=t1",
+        "Parent=t1",
+        "ID=e2;Parent=t1",
+        "ID=g2",
+        "ID=t2;Parent=g2",
+        "ID=e3;Parent=t2",
+    ]
+    written = set()
+    for line in features[:-2]:
+        feature_id, parent = get_id_parent(line.split("\t")[8])
+        assert parent is None or parent in written
+        written.add(feature_id)
+    # comments stay after the preceding feature
+    assert lines[lines.index("# end of gene g1") - 1].endswith("ID=g1")
+    assert "###" not in lines
+    # the index and the sort files are removed
+    assert list(tmp_path.iterdir()) == [gff_file]